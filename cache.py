@@ -0,0 +1,219 @@
+import hashlib
+import json
+import numpy as np
+import os
+import pandas as pd
+import shutil
+import sys
+import tempfile
+import time
+import urllib.request
+
+
+# Local cache for the input data, shared by the three packages.
+#
+# Remote files (the scenario workbook, the course CSVs) are downloaded once and stored by the
+# SHA-256 of their content under `cache_dir`/blobs; `cache_dir`/urls has one small file per URL
+# with the hash of its latest download, so a URL is looked up without touching the network. A
+# URL is downloaded again only when it is not in the cache yet, when its entry is older than
+# `max_age` seconds or with `refresh=True`. In offline mode (`set_offline()`, or the environment
+# variable OPTI_OFFLINE=1) nothing is downloaded: a URL that is not in the cache raises
+# FileNotFoundError. `add(url, path)` puts a local copy of a file in the cache under its URL, e.g.
+# to run offline on a machine that has never been online.
+#
+# Parsed tables are cached as well, keyed by the content hash of the file and the arguments
+# given to the reader, so a file that has not changed is parsed once. A table is stored as one
+# .npy file per column (strings as a fixed-width unicode array and a mask of missing values),
+# which is loaded memory-mapped: reloading a cached table reads the column metadata and maps
+# the arrays, nothing is parsed. Local files are parsed through the same cache (by content),
+# without being copied into it.
+#
+# The cache is safe to share between processes (e.g. `batch.run_batch`'s workers): every file is
+# written to a temporary name and then renamed into place.
+
+cache_dir = os.environ.get('OPTI_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'opti201'))
+offline = os.environ.get('OPTI_OFFLINE', '') not in ('', '0')
+_version = 1    # of the table format, part of every table's key
+
+
+def set_offline(flag=True):
+    global offline
+    offline = flag
+
+
+def is_url(source):
+    return str(source).split(':', 1)[0] in ('http', 'https', 'ftp')
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _replace(write, path):
+    # Write to a temporary file (or directory) next to path, then rename it into place
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        target = write(tmp)
+        try:
+            os.replace(target, path)
+        except OSError:
+            if not os.path.exists(path):   # (a directory someone else wrote in the meantime stays)
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _entry_path(url):
+    return os.path.join(cache_dir, 'urls', _digest(url.encode()) + '.json')
+
+
+def _blob_path(digest):
+    return os.path.join(cache_dir, 'blobs', digest)
+
+
+def _store(url, data):
+    digest = _digest(data)
+    if not os.path.exists(_blob_path(digest)):
+        def write(tmp):
+            with open(os.path.join(tmp, 'blob'), 'wb') as f:
+                f.write(data)
+            return os.path.join(tmp, 'blob')
+        _replace(write, _blob_path(digest))
+
+    def write_entry(tmp):
+        with open(os.path.join(tmp, 'entry'), 'w') as f:
+            json.dump({'url': url, 'sha256': digest, 'size': len(data), 'fetched': time.time()}, f)
+        return os.path.join(tmp, 'entry')
+    _replace(write_entry, _entry_path(url))
+    return digest
+
+
+def lookup(url):
+    # The cache entry of a URL ({'url', 'sha256', 'size', 'fetched'}), None if there is none
+    try:
+        with open(_entry_path(url)) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return entry if os.path.exists(_blob_path(entry['sha256'])) else None
+
+
+def add(url, path):
+    with open(path, 'rb') as f:
+        return _store(url, f.read())
+
+
+def fetch(source, refresh=False, max_age=None, timeout=60):
+    # Local path and content hash of a URL (downloaded if needed) or of a local file
+    if not is_url(source):
+        return source, _file_digest(source)
+    entry = lookup(source)
+    stale = entry is not None and max_age is not None and time.time() - entry['fetched'] > max_age
+    if entry is None or ((refresh or stale) and not offline):
+        if offline:
+            raise FileNotFoundError(f"{source} is not in the data cache ({cache_dir}) and offline mode is on")
+        with urllib.request.urlopen(source, timeout=timeout) as response:
+            digest = _store(source, response.read())
+    else:
+        digest = entry['sha256']
+    return _blob_path(digest), digest
+
+
+# Tables
+
+
+def _save_table(df, path):
+    def write(tmp):
+        table = os.path.join(tmp, 'table')
+        os.makedirs(table)
+        index = None
+        if not (isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1):
+            index = [n if n is not None else f"level_{i}" for i, n in enumerate(df.index.names)]
+        frame = df.reset_index(names=index) if index else df
+        columns = []
+        for i, name in enumerate(frame.columns):
+            col = frame.iloc[:, i]
+            kind = 'array'
+            if col.dtype.kind in 'biufcmM' and not isinstance(col.dtype, pd.api.extensions.ExtensionDtype):
+                values = col.to_numpy()
+            elif pd.api.types.infer_dtype(col, skipna=True) in ('string', 'empty'):
+                kind = 'str'
+                missing = col.isna().to_numpy()
+                values = np.where(missing, '', col.to_numpy(dtype=object)).astype(str)
+                np.save(os.path.join(table, f"{i}.mask.npy"), missing)
+            else:
+                kind = 'object'
+                values = col.to_numpy(dtype=object)
+            np.save(os.path.join(table, f"{i}.npy"), values, allow_pickle=kind == 'object')
+            columns.append({'name': name, 'kind': kind, 'dtype': str(col.dtype)})
+        with open(os.path.join(table, 'columns.json'), 'w') as f:
+            json.dump({'columns': columns, 'index': index, 'rows': len(frame)}, f)
+        return table
+    _replace(write, path)
+
+
+def _load_table(path):
+    with open(os.path.join(path, 'columns.json')) as f:
+        meta = json.load(f)
+    data = {}
+    for i, col in enumerate(meta['columns']):
+        if col['kind'] == 'object':
+            values = np.load(os.path.join(path, f"{i}.npy"), allow_pickle=True)
+        else:
+            values = np.load(os.path.join(path, f"{i}.npy"), mmap_mode='r')
+        if col['kind'] == 'str':
+            values = values.astype(object)
+            values[np.load(os.path.join(path, f"{i}.mask.npy"))] = np.nan
+        if col['kind'] != 'array':
+            values = pd.Series(values, dtype=col['dtype'])
+        data[i] = values
+    df = pd.DataFrame(data, copy=False)
+    df.columns = [col['name'] for col in meta['columns']]
+    if meta['index']:
+        df = df.set_index(meta['index'])
+    return df
+
+
+def _table_key(digest, reader, sheet, kwargs):
+    return _digest(json.dumps([_version, digest, reader, sheet, sorted(kwargs.items())], default=repr).encode())
+
+
+def _cached_table(path, digest, reader, sheet, kwargs, parse):
+    table = os.path.join(cache_dir, 'tables', _table_key(digest, reader, sheet, kwargs))
+    if not os.path.exists(table):
+        _save_table(parse(path), table)
+    return _load_table(table)
+
+
+def read_csv(source, refresh=False, **kwargs):
+    path, digest = fetch(source, refresh)
+    return _cached_table(path, digest, 'csv', None, kwargs, lambda p: pd.read_csv(p, **kwargs))
+
+
+def read_excel(source, sheet_name=0, refresh=False, **kwargs):
+    # Like pd.read_excel; for a list of sheets, the workbook is opened once for those not cached yet
+    path, digest = fetch(source, refresh)
+    sheets = sheet_name if isinstance(sheet_name, list) else [sheet_name]
+    tables = {s: os.path.join(cache_dir, 'tables', _table_key(digest, 'excel', s, kwargs)) for s in sheets}
+    missing = [s for s in sheets if not os.path.exists(tables[s])]
+    if missing:
+        for s, df in pd.read_excel(path, sheet_name=missing, **kwargs).items():
+            _save_table(df, tables[s])
+    frames = {s: _load_table(tables[s]) for s in sheets}
+    return frames if isinstance(sheet_name, list) else frames[sheet_name]
+
+
+if __name__ == '__main__':
+    # Fill the cache with the given URLs, e.g. before going offline
+    for url in sys.argv[1:]:
+        path, digest = fetch(url, refresh=True)
+        print(f"{url}: {digest} ({os.path.getsize(path)} bytes)")
@@ -0,0 +1,43 @@
+import pandas as pd
+
+import cache
+
+
+# Input data of the battery problem: the solar forecast, the building's demand and the expected
+# price of electricity. Each table is read the first time it is used (`data.total_demand`,
+# `from moresun.data import avg_price`, ...), not when the module is imported, and through the
+# data cache (see `cache`), so it is downloaded and parsed once and
+# afterwards loaded from disk, also in offline mode.
+
+path = 'https://raw.githubusercontent.com/Gurobi/modeling-examples/master/optimization101/Modeling_Session_2/'
+files = {'solar_values_read': 'pred_solar_values.csv', 'schedule': 'schedule_demand.csv',
+         'avg_building': 'building_demand.csv', 'avg_price': 'expected_price.csv'}
+_data = {}
+
+
+def load(name):
+    if name not in _data:
+        if name in files:
+            _data[name] = cache.read_csv(path + files[name])
+        elif name == 'solar_values':
+            # solar forecast
+            solar_values = round(load('solar_values_read').yhat, 3)
+            _data[name] = solar_values.reset_index(drop=True)
+        elif name == 'total_demand':
+            # total demand is a fixed building demand and an estimated demand based on a proposed
+            # schedule for the building
+            _data[name] = load('schedule').sched_demand + load('avg_building').build_demand
+        else:
+            raise KeyError(name)
+    return _data[name]
+
+
+def __getattr__(name):
+    if name in files or name in ('solar_values', 'total_demand'):
+        return load(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == '__main__':
+    print(pd.DataFrame({'solar': load('solar_values'), 'demand': load('total_demand'),
+                        'price': load('avg_price').price}))
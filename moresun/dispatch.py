@@ -0,0 +1,172 @@
+from gurobipy import GRB
+import gurobipy as gp
+import numpy as np
+import scipy.sparse as sp
+import sys
+import time
+
+
+# Battery dispatch model, for any fleet of batteries and any number of time periods.
+#
+# Per battery b and period t: charge flow_in[b, t] (from solar), discharge flow_out[b, t], state
+# of charge state[b, t] (up to the battery's capacity) and zwitch[b, t] (1 if charging, 0 if
+# discharging); per period: energy bought from the grid, grid[t], and solar used directly, gen[t].
+#
+#   sum_b (flow_out[b, t] - eff[b] * flow_in[b, t]) + gen[t] + grid[t] == demand[t]   (power_balance)
+#   state[b, 0] == initial[b] + eff[b] * flow_in[b, 0] - flow_out[b, 0]               (battery_state)
+#   state[b, t] == state[b, t - 1] + eff[b] * flow_in[b, t - 1] - flow_out[b, t - 1]
+#   sum_b flow_in[b, t] + gen[t] <= solar[t]                                          (solar_avail)
+#   flow_in[b, t] <= rate[b] * zwitch[b, t]                                           (to_charge)
+#   flow_out[b, t] <= rate[b] * (1 - zwitch[b, t])                                    (or_not_to_charge)
+#
+# The variables are (batteries x periods) and (periods,) MVars, so flow_in[b, t] is indexed by
+# position: `BatteryFleet.index` gives a battery's row. Every constraint family is added with one
+# sparse matrix per variable block (`A @ x` over the flattened MVars), not by a Python expression
+# per (b, t); elementwise MVar expressions are several times slower to build. The (b, t)
+# constraint families are one-dimensional, battery-major: the constraint of (b, t) is at
+# b * periods + t (see `DispatchModel.at`).
+#
+# With binaries=False the model is the LP without zwitch and the charge/discharge constraints
+# (the flows are only bounded by the rate); see `lp_first` for solving it with binaries added
+# where they are needed. `add_dispatch` adds the variables and constraints to an existing model
+# instead, with the grid purchase given as any expression -- e.g. one block per scenario, sharing
+# the grid purchase, in `stochastic`.
+
+
+class BatteryFleet:
+    def __init__(self, names, capacity, efficiency, initial=None, rate=20):
+        self.names = list(names)
+        self.capacity = np.asarray(capacity, dtype=float)      # kWh
+        self.efficiency = np.asarray(efficiency, dtype=float)  # fraction of the charge that is stored
+        self.initial = np.zeros(len(self.names)) if initial is None else np.asarray(initial, dtype=float)
+        self.rate = np.broadcast_to(np.asarray(rate, dtype=float), (len(self.names),))  # kW, in or out
+
+    def __len__(self):
+        return len(self.names)
+
+    def __str__(self):
+        return f"Battery fleet: {len(self.names)} batteries, {self.capacity.sum():.0f} kWh"
+
+    def index(self, name):
+        return self.names.index(name)
+
+
+class DispatchModel:
+    def __init__(self, m, fleet, flow_in, flow_out, grid, state, gen, zwitch, constrs, total_grid, total_cost):
+        self.m = m
+        self.fleet = fleet
+        self.flow_in = flow_in
+        self.flow_out = flow_out
+        self.grid = grid
+        self.state = state
+        self.gen = gen
+        self.zwitch = zwitch            # None without binaries
+        self.constrs = constrs          # constraint family name -> MConstr
+        self.total_grid = total_grid    # energy bought from the grid
+        self.total_cost = total_cost    # cost of that energy (None without prices)
+
+    def __str__(self):
+        return (f"Dispatch model: {len(self.fleet)} batteries, {self.grid.shape[0]} periods\n"
+                f"  Variables: {self.m.NumVars}\n  Constraints: {self.m.NumConstrs}")
+
+    @property
+    def periods(self):
+        return self.grid.shape[0]
+
+    def at(self, family, b, t):
+        # Constraint of battery b (position) and period t of a (battery, period) family
+        return self.constrs[family][b * self.periods + t]
+
+
+def build_dispatch(fleet, solar, demand, price=None, env=None, name='battery_dispatch', binaries=True):
+    m = gp.Model(name, env=env)
+    dm = add_dispatch(m, fleet, solar, demand, price, binaries=binaries)
+    # initial objective: min grid purchase
+    m.setObjective(dm.total_grid, GRB.MINIMIZE)
+    return dm
+
+
+def add_dispatch(m, fleet, solar, demand, price=None, grid=None, binaries=True, suffix=''):
+    # The dispatch variables and constraints, added to m (names ending in suffix). grid: the
+    # energy from the grid per period, a (periods,) MVar or expression; a new MVar by default
+    solar = np.asarray(solar, dtype=float)
+    demand = np.asarray(demand, dtype=float)
+    B, T = len(fleet), len(demand)
+    n = B * T
+
+    # Decision variables
+    rate = np.repeat(fleet.rate, T)
+    flow_ub = GRB.INFINITY if binaries else rate.reshape(B, T)
+    flow_in = m.addMVar((B, T), ub=flow_ub, name=f"flow_in{suffix}")
+    flow_out = m.addMVar((B, T), ub=flow_ub, name=f"flow_out{suffix}")
+    if grid is None:
+        grid = m.addMVar(T, name=f"grid{suffix}")
+    state = m.addMVar((B, T), ub=np.repeat(fleet.capacity[:, None], T, axis=1), name=f"state{suffix}")
+    gen = m.addMVar(T, name=f"gen{suffix}")
+    zwitch = m.addMVar((B, T), vtype=GRB.BINARY, name=f"zwitch{suffix}") if binaries else None
+    f_in, f_out, s = (v.reshape(-1) for v in (flow_in, flow_out, state))
+
+    # Sum over batteries (periods x battery-periods), with and without efficiency
+    total = sp.kron(np.ones((1, B)), sp.identity(T), format='csr')
+    stored = sp.kron(fleet.efficiency[None, :], sp.identity(T), format='csr')
+    # Per battery-period: the previous period of the same battery (none for period 0), and the
+    # period whose flows change the state (the previous one, and period 0 itself)
+    previous = sp.kron(sp.identity(B), sp.eye(T, k=-1), format='csr')
+    first = np.tile(np.r_[1.0, np.zeros(T - 1)], B)
+    flows = (previous + sp.diags(first)).tocsr()
+    efficiency = sp.diags(np.repeat(fleet.efficiency, T))
+
+    constrs = {}
+
+    # Power balance
+    constrs['power_balance'] = m.addConstr(total @ f_out - stored @ f_in + gen + grid == demand,
+                                           name=f"power_balance{suffix}")
+
+    # Battery state
+    constrs['battery_state'] = m.addConstr(
+        (sp.identity(n, format='csr') - previous) @ s - (flows @ efficiency) @ f_in + flows @ f_out
+        == np.repeat(fleet.initial, T) * first,
+        name=f"battery_state{suffix}")
+
+    # Solar availability
+    constrs['solar_avail'] = m.addConstr(total @ f_in + gen <= solar, name=f"solar_avail{suffix}")
+
+    # Charge/discharge
+    if binaries:
+        z = zwitch.reshape(-1)
+        constrs['to_charge'] = m.addConstr(f_in - sp.diags(rate) @ z <= 0, name=f"to_charge{suffix}")
+        constrs['or_not_to_charge'] = m.addConstr(f_out + sp.diags(rate) @ z <= rate,
+                                                  name=f"or_not_to_charge{suffix}")
+
+    # Energy purchased from the grid and its cost
+    total_grid = grid.sum()
+    total_cost = None if price is None else np.asarray(price, dtype=float) @ grid
+
+    return DispatchModel(m, fleet, flow_in, flow_out, grid, state, gen, zwitch, constrs, total_grid, total_cost)
+
+
+# Build time for a random fleet of `batteries` over `periods` periods (e.g. 35040 for a year of
+# 15-minute periods)
+
+
+def build_time(batteries, periods, seed=0):
+    rng = np.random.default_rng(seed)
+    fleet = BatteryFleet([f"Battery{b}" for b in range(batteries)], rng.uniform(40, 100, batteries),
+                         rng.uniform(0.85, 0.95, batteries))
+    hours = np.arange(periods) % 96 / 4
+    solar = np.clip(60 * np.sin((hours - 6) / 12 * np.pi), 0, None) * batteries / 2
+    demand = rng.uniform(10, 60, periods) * batteries / 2
+    start = time.perf_counter()
+    dm = build_dispatch(fleet, solar, demand, rng.uniform(20, 60, periods))
+    dm.m.update()
+    elapsed = time.perf_counter() - start
+    print(f"{batteries} batteries, {periods} periods: {dm.m.NumVars} variables, {dm.m.NumConstrs} constraints, "
+          f"built in {elapsed:.3f}s")
+    dm.m.dispose()
+    return elapsed
+
+
+if __name__ == '__main__':
+    sizes = [tuple(int(v) for v in size.split('x')) for size in sys.argv[1:]] or [(2, 96), (20, 2880), (100, 2880)]
+    for batteries, periods in sizes:
+        build_time(batteries, periods)
@@ -0,0 +1,119 @@
+from gurobipy import GRB
+import gurobipy as gp
+import numpy as np
+import pandas as pd
+import sys
+import time
+import warnings
+
+from moresun.dispatch import BatteryFleet, build_dispatch
+
+
+# LP-first battery dispatch.
+#
+# The full model has a binary zwitch[b, t] and the big-M pair to_charge/or_not_to_charge for
+# every battery and period, only to forbid charging and discharging a battery at the same time.
+# With losses (efficiency < 1) that rarely pays, so the LP without them usually already has a
+# solution that never does both. `solve_lp_first` solves the dispatch model built without
+# binaries (`build_dispatch(..., binaries=False)`), looks for the (battery, period) pairs where
+# the solution charges and discharges at once, adds the complementarity constraint for those
+# pairs only, and solves again, until no pair is left.
+#
+# The model without the constraints of the other pairs is a relaxation of the full model, so
+# a solution of it that satisfies all of them is optimal for the full model as well (within
+# the MIP gap, once binaries have been added).
+#
+# The complementarity is either an SOS1 constraint on (flow_in[b, t], flow_out[b, t])
+# (method='sos') or a binary with the same big-M pair as the full model (method='bigm'; the
+# flows are bounded by the rate, which is the big-M).
+
+round_cols = ['Round', 'Pairs', 'Added', 'Runtime', 'Objective']
+
+
+def simultaneous(dm, tol=1e-6):
+    # (battery, period) positions where the solution charges and discharges at once
+    flow_in, flow_out = dm.flow_in.X, dm.flow_out.X
+    return np.nonzero((flow_in > tol) & (flow_out > tol))
+
+
+def add_complementarity(dm, batteries, periods, method='sos', suffix=''):
+    # (names ending in suffix, as in `dispatch.add_dispatch`)
+    m = dm.m
+    if method == 'sos':
+        for b, t in zip(batteries, periods):
+            m.addSOS(GRB.SOS_TYPE1, [dm.flow_in[b, t].item(), dm.flow_out[b, t].item()], [1, 2])
+    elif method == 'bigm':
+        rate = dm.fleet.rate[batteries]
+        z = m.addMVar(len(batteries), vtype=GRB.BINARY, name=f"zwitch{suffix}")
+        m.addConstr(dm.flow_in[batteries, periods] - rate * z <= 0, name=f"to_charge{suffix}")
+        m.addConstr(dm.flow_out[batteries, periods] + rate * z <= rate, name=f"or_not_to_charge{suffix}")
+    else:
+        raise ValueError(f"Unknown complementarity method {method!r}")
+
+
+def solve_lp_first(dm, method='sos', tol=1e-6, max_rounds=100, verbose=False):
+    # dm: built without binaries; returns the rounds (pairs found and added, runtime, objective)
+    rounds = []
+    added = set()
+    for r in range(max_rounds):
+        dm.m.optimize()
+        if dm.m.SolCount == 0:
+            raise RuntimeError(f"No dispatch found in round {r} (status {dm.m.Status})")
+        batteries, periods = simultaneous(dm, tol)
+        new = [(b, t) for b, t in zip(batteries, periods) if (b, t) not in added]
+        rounds.append({'Round': r, 'Pairs': len(batteries), 'Added': len(new), 'Runtime': dm.m.Runtime,
+                       'Objective': dm.m.ObjVal})
+        if verbose:
+            print(f"Round {r}: {len(batteries)} pairs charging and discharging, objective {dm.m.ObjVal:.4f}")
+        if not new:
+            # none left, or only pairs that already have their constraint (reported below)
+            break
+        added.update(new)
+        b, t = (np.array(v) for v in zip(*new))
+        add_complementarity(dm, b, t, method, suffix=f"[{r}]")
+    else:
+        raise RuntimeError(f"Charging and discharging at once after {max_rounds} rounds")
+    if rounds[-1]['Pairs']:
+        # constrained, yet both flows above tol: within the solver's tolerances (e.g. IntFeasTol
+        # times the rate with 'bigm')
+        warnings.warn(f"{rounds[-1]['Pairs']} (battery, period) pairs still charge and discharge at once "
+                      f"(flows above {tol}), though all of them are constrained")
+    return pd.DataFrame(rounds, columns=round_cols)
+
+
+# The full MIP against LP-first, on a random fleet (as `dispatch.build_time`)
+
+
+def compare(batteries, periods, seed=0, method='sos'):
+    rng = np.random.default_rng(seed)
+    fleet = BatteryFleet([f"Battery{b}" for b in range(batteries)], rng.uniform(40, 100, batteries),
+                         rng.uniform(0.85, 0.95, batteries))
+    hours = np.arange(periods) % 96 / 4
+    solar = np.clip(60 * np.sin((hours - 6) / 12 * np.pi), 0, None) * batteries / 2
+    demand = rng.uniform(10, 60, periods) * batteries / 2
+    price = rng.uniform(20, 60, periods)
+    env = gp.Env(empty=True)
+    env.setParam('OutputFlag', 0)
+    env.start()
+    results = {}
+    for mode in ('mip', 'lp_first'):
+        start = time.perf_counter()
+        dm = build_dispatch(fleet, solar, demand, price, env=env, binaries=mode == 'mip')
+        dm.m.setObjective(dm.total_cost, GRB.MINIMIZE)
+        if mode == 'mip':
+            dm.m.optimize()
+            rounds = 1
+        else:
+            rounds = len(solve_lp_first(dm, method))
+        results[mode] = (time.perf_counter() - start, dm.m.ObjVal, rounds)
+        print(f"{batteries} batteries, {periods} periods, {mode}: {results[mode][0]:.3f}s, "
+              f"objective {results[mode][1]:.4f}, {rounds} round(s)")
+        dm.m.dispose()
+    env.dispose()
+    return results
+
+
+if __name__ == '__main__':
+    sizes = [tuple(int(v) for v in size.split('x')) for size in sys.argv[1:]] or [(2, 96), (4, 96)]
+    for batteries, periods in sizes:
+        compare(batteries, periods)
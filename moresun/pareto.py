@@ -0,0 +1,229 @@
+from gurobipy import GRB
+import gurobipy as gp
+import itertools
+import multiprocessing
+import numpy as np
+import os
+import pandas as pd
+import time
+
+from moresun import data
+from moresun.dispatch import BatteryFleet, build_dispatch
+
+
+# Pareto front explorer for a model with several objectives.
+#
+# The objectives are those of the model, as set with `setObjectiveN` (names from ObjNName; an
+# objective with a negative weight, or every objective of a maximization, is maximized). The
+# model comes from `build(env, *args)`, a module-level function, so each worker process of the
+# pool builds its own copy.
+#
+# Epsilon-constraint method (mode='epsilon'): objective 0 is minimized with every other
+# objective k bounded, obj_k <= eps_k. First the anchor points: each objective optimized
+# hierarchically, the others as tie-breakers (priorities as given by the order), which gives
+# the ideal and the nadir point of the payoff table. The anchors are solved with MIPGap 0
+# (every pass of the hierarchy), as an anchor within the gap of its objectives can be dominated
+# by a grid point; the grid points keep the model's MIPGap. Every anchor must have a solution
+# (one stopped by `time_limit` is used as it is, its status in the table); without one there is
+# no payoff table, and `explore` raises RuntimeError. Then eps_k takes `steps` values from
+# ideal to nadir for every k, a grid of steps^(K-1) points. The objective of a grid point is
+# augmented with `rho` times the sum of the other objectives (scaled by their ranges), so a
+# point on the grid is not weakly dominated. With mode='weights', the points minimize a
+# weighted sum of the scaled objectives, on a grid of weights that sum to one, instead; it is
+# faster but only finds the supported points of the front (those on its convex hull).
+#
+# The points are solved in waves of `workers` points, in a process pool, in an order in which
+# consecutive points are close (a snake through the grid). Each point is warm-started (Start of
+# every variable) from the solution of its nearest solved point -- distance in the scaled
+# epsilon (or weight) space -- usually a feasible or nearly feasible start. Points with the same
+# objective values (to `decimals`) and dominated points are dropped from the front.
+
+_instance = {}
+
+
+def _init_worker(build, args, threads=1):
+    env = gp.Env(empty=True)
+    env.setParam('OutputFlag', 0)
+    env.setParam('Threads', threads)
+    env.start()
+    m = build(env, *args)
+    m.update()
+    objectives, names, signs = [], [], []
+    for i in range(m.NumObj):
+        m.Params.ObjNumber = i
+        objectives.append(m.getObjective(i))
+        names.append(m.ObjNName or f"obj{i}")
+        # +1 minimized, -1 maximized
+        signs.append(m.ModelSense * (1 if m.ObjNWeight >= 0 else -1))
+    m.NumObj = 0
+    m.ModelSense = GRB.MINIMIZE
+    # Epsilon constraints on objectives 1, ..., K-1 (in the minimized sense), off by default
+    bounds = [m.addConstr(signs[k] * objectives[k] <= GRB.INFINITY, name=f"eps_{names[k]}")
+              for k in range(1, len(objectives))]
+    m.update()
+    _instance.update(env=env, m=m, vars=m.getVars(), objectives=objectives, names=names, signs=signs,
+                     bounds=bounds, mip_gap=m.Params.MIPGap)
+
+
+def _objectives():
+    return _instance['names'], _instance['signs']
+
+
+def _values():
+    # Objective values in the minimized sense
+    return np.array([s * obj.getValue() for s, obj in zip(_instance['signs'], _instance['objectives'])])
+
+
+def solve_point(task):
+    m, objectives, signs, bounds = _instance['m'], _instance['objectives'], _instance['signs'], _instance['bounds']
+    kind, target, scale, rho, start, time_limit = task
+    minimized = [s * obj for s, obj in zip(signs, objectives)]
+    for k, bound in enumerate(bounds):
+        bound.RHS = target[k] if kind == 'epsilon' else GRB.INFINITY
+    m.NumObj = 0
+    m.update()      # (setting objectives right after NumObj = 0 crashes gurobipy)
+    if kind == 'anchor':
+        # objective `target` first, the others in order as tie-breakers
+        order = [target] + [k for k in range(len(objectives)) if k != target]
+        for index, k in enumerate(order):
+            m.setObjectiveN(minimized[k], index=index, priority=len(order) - index)
+    elif kind == 'epsilon':
+        m.setObjective(minimized[0] + rho * scale[0] * gp.quicksum(e / r for e, r in zip(minimized[1:], scale[1:])),
+                       GRB.MINIMIZE)
+    else:
+        m.setObjective(gp.quicksum(w / r * e for w, r, e in zip(target, scale, minimized)), GRB.MINIMIZE)
+    m.setAttr(GRB.Attr.Start, _instance['vars'], start if start is not None else [GRB.UNDEFINED] * m.NumVars)
+    m.Params.TimeLimit = time_limit or GRB.INFINITY
+    m.Params.MIPGap = 0 if kind == 'anchor' else _instance['mip_gap']
+    m.optimize()
+    if m.SolCount == 0:
+        return m.Status, None, None, m.Runtime, m.NodeCount
+    x = np.array(m.getAttr(GRB.Attr.X, _instance['vars']))
+    return m.Status, _values(), x, m.Runtime, m.NodeCount
+
+
+def non_dominated(values, decimals=6):
+    # Rows of `values` (all objectives minimized) that are on the front: one per distinct point, undominated
+    values = np.round(np.asarray(values, dtype=float), decimals)
+    _, unique = np.unique(values, axis=0, return_index=True)
+    unique = np.sort(unique)
+    v = values[unique]
+    weakly = (v[:, None, :] <= v[None, :, :]).all(axis=2)       # [i, j]: i weakly dominates j
+    strictly = weakly & (v[:, None, :] < v[None, :, :]).any(axis=2)
+    return unique[~strictly.any(axis=0)]
+
+
+def _snake(levels):
+    # The epsilon grid, consecutive points differing in one coordinate by one step
+    points = [()]
+    for level in levels:
+        points = [p + (v,) for i, p in enumerate(points) for v in (level if i % 2 == 0 else level[::-1])]
+    return points
+
+
+def _weights(K, steps):
+    grid = [w for w in itertools.product(range(steps), repeat=K) if sum(w) == steps - 1]
+    return [tuple(np.array(w) / (steps - 1)) for w in grid]
+
+
+def explore(build, args=(), mode='epsilon', steps=5, workers=None, rho=1e-4, time_limit=None, decimals=6,
+            verbose=True):
+    # (front, points): the front and every solved point, objective values in their own sense
+    workers = workers or os.cpu_count() or 1
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, _init_worker, (build, args))
+        run = lambda tasks: pool.map(solve_point, tasks)
+        names, signs = pool.apply(_objectives)
+    else:
+        _init_worker(build, args, threads=0)
+        run = lambda tasks: [solve_point(task) for task in tasks]
+        names, signs = _objectives()
+    K = len(names)
+    start = time.perf_counter()
+    points, solved = [], []            # solved: (coordinates, x, point)
+
+    def run_wave(wave):
+        tasks = []
+        for kind, target, scale, coords in wave:
+            neighbour, x = None, None
+            if solved:
+                distance = [np.linalg.norm(np.subtract(c, coords)) for c, _, _ in solved]
+                _, x, neighbour = solved[int(np.argmin(distance))]
+            tasks.append(((kind, target, scale, rho, x, time_limit), neighbour, coords))
+        for (task, neighbour, coords), (status, values, x, runtime, nodes) in zip(tasks, run([t[0] for t in tasks])):
+            point = {'Point': len(points), 'Kind': task[0], 'Neighbour': neighbour, 'Status': status,
+                     'Runtime': runtime, 'Nodes': nodes}
+            for k in range(1, K):
+                point[f"eps {names[k]}"] = signs[k] * task[1][k - 1] if task[0] == 'epsilon' else np.nan
+            for k in range(K):
+                point[names[k]] = np.nan if values is None else signs[k] * values[k]
+            point['_values'] = values
+            points.append(point)
+            if x is not None:
+                solved.append((coords, x, point['Point']))
+
+    try:
+        # Anchors: the payoff table
+        run_wave([('anchor', k, None, None) for k in range(K)])
+        unsolved = [f"{names[k]} (status {p['Status']})" for k, p in enumerate(points) if p['_values'] is None]
+        if unsolved:
+            raise RuntimeError(f"No anchor point for {', '.join(unsolved)}: no payoff table to build the grid on")
+        payoff = np.array([p['_values'] for p in points])
+        ideal, nadir = payoff.min(axis=0), payoff.max(axis=0)
+        scale = np.maximum(nadir - ideal, 1e-9)
+        # coordinates of the anchors in the space of the grid
+        for k, (_, x, point) in enumerate(solved):
+            solved[k] = (tuple((payoff[k][1:] - ideal[1:]) / scale[1:]) if mode == 'epsilon' else
+                         tuple(np.eye(K)[k]), x, point)
+
+        if mode == 'epsilon':
+            grid = _snake([np.linspace(0, 1, steps)] * (K - 1))
+            wave = [('epsilon', ideal[1:] + np.array(c) * scale[1:], scale, c) for c in grid]
+        else:
+            grid = _weights(K, steps)
+            wave = [('weights', w, scale, w) for w in grid]
+        for i in range(0, len(wave), workers):
+            run_wave(wave[i:i + workers])
+            if verbose:
+                print(f"{min(i + workers, len(wave))}/{len(wave)} points, {time.perf_counter() - start:.2f}s")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        else:
+            _instance.pop('m').dispose()
+            _instance.pop('env').dispose()
+
+    table = pd.DataFrame(points)
+    feasible = table.index[table['_values'].notna()]
+    front = feasible[non_dominated(np.vstack(table.loc[feasible, '_values']), decimals)]
+    table['Front'] = table.index.isin(front)
+    table = table.drop(columns='_values').astype({'Neighbour': 'Int64'})
+    return table[table.Front].sort_values(names[0]).reset_index(drop=True), table
+
+
+# Cost, depth of discharge and grid purchase of the battery problem (see problem.py)
+
+
+def build_cost_depth_grid(env, depth=0.3):
+    fleet = BatteryFleet(['Battery0', 'Battery1'], [60, 80], [0.95, 0.9])
+    dm = build_dispatch(fleet, data.solar_values, data.total_demand, data.avg_price.price, env=env,
+                        name='pareto_dispatch')
+    m = dm.m
+    T = dm.periods
+    v = m.addMVar(T, vtype=GRB.BINARY, name='v')
+    b0 = fleet.index('Battery0')
+    for t in range(T):
+        m.addGenConstrIndicator(v[t].item(), False, dm.state[b0, t].item() >= depth * fleet.capacity[b0],
+                                name=f"discharge_depth[{t}]")
+    m.setObjectiveN(dm.total_cost, index=0, name='cost')
+    m.setObjectiveN(v.sum(), index=1, name='depth_count')
+    m.setObjectiveN(dm.total_grid, index=2, name='grid')
+    return m
+
+
+if __name__ == '__main__':
+    front, points = explore(build_cost_depth_grid, steps=5)
+    print(points.to_string(index=False))
+    print(front.to_string(index=False))
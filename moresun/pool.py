@@ -0,0 +1,134 @@
+from gurobipy import GRB
+import numpy as np
+import pandas as pd
+
+
+# Solution pool extraction and analytics.
+#
+# `SolutionPool(m)` reads the whole pool of a solved model at once: for every solution, the Xn of
+# all variables with one `getAttr` call, into a preallocated (solutions x variables) array, and
+# the pool objective values. Families of variables (e.g. flow_in, a batteries x periods MVar) are
+# registered with `add` as their positions in the model and the labels of their axes; `values`
+# gives a family as a (solutions, *shape) array, without going through a DataFrame. The
+# DataFrames are only made on request: `long` is one row per solution and variable of the
+# family (its axes as columns), `tidy` one row per solution and index of several families (one
+# column per family).
+#
+# Positions are what ties a family to the pool, so a family of one model can be registered on a
+# copy of it (`m.copy()` keeps the order of the variables), e.g. the MVars of a `DispatchModel`
+# on the copy that is solved for its pool.
+#
+# Analytics, all on the array: `spread` (per variable: min, max, mean, standard deviation and
+# number of distinct values over the pool), `distinct` (groups of solutions that are the same up
+# to `decimals`, optionally only on some families -- e.g. only the binaries; `clusters` gives the
+# size and objectives of each group) and `objectives` (the distribution of the objective values
+# and their gap to the best).
+
+
+class SolutionPool:
+    def __init__(self, m, decimals=None):
+        self.m = m
+        self.vars = m.getVars()
+        self.names = None                   # variable names, read on first use
+        self.families = {}                  # name -> (positions, axes)
+        count = m.SolCount
+        self.X = np.empty((count, len(self.vars)))
+        self.obj = np.empty(count)
+        for k in range(count):
+            m.Params.SolutionNumber = k
+            self.X[k] = m.getAttr(GRB.Attr.Xn, self.vars)
+            self.obj[k] = m.PoolObjVal
+        m.Params.SolutionNumber = 0
+        if decimals is not None:
+            self.X = self.X.round(decimals)
+
+    def __len__(self):
+        return len(self.obj)
+
+    def __str__(self):
+        return (f"Solution pool of {self.m.ModelName}: {len(self)} solutions, {self.X.shape[1]} variables, "
+                f"objective {self.obj.min():.4g} to {self.obj.max():.4g}" if len(self) else
+                f"Solution pool of {self.m.ModelName}: empty")
+
+    def add(self, name, mvar, axes=None):
+        # axes: per dimension of mvar, (name, labels); default: (name_i, positions)
+        positions = np.array([v.index for v in mvar.reshape(-1).tolist()]).reshape(mvar.shape)
+        if axes is None:
+            axes = [(f"{name}_{i}", range(n)) for i, n in enumerate(mvar.shape)]
+        self.families[name] = (positions, [(axis, list(labels)) for axis, labels in axes])
+        return self
+
+    def values(self, name):
+        # (solutions, *shape) array of a family
+        positions, _ = self.families[name]
+        return self.X[:, positions]
+
+    def long(self, name, solution='solution', value='value'):
+        positions, axes = self.families[name]
+        S, n = len(self), positions.size
+        grids = np.meshgrid(*(np.asarray(labels) for _, labels in axes), indexing='ij')
+        frame = {solution: np.repeat(np.arange(S), n)}
+        for (axis, _), grid in zip(axes, grids):
+            frame[axis] = np.tile(grid.ravel(), S)
+        frame[value] = self.X[:, positions.ravel()].ravel()
+        return pd.DataFrame(frame)
+
+    def tidy(self, names=None, solution='solution'):
+        # One column per family; the families need the same axes
+        names = list(self.families) if names is None else list(names)
+        frame = self.long(names[0], solution, names[0])
+        for name in names[1:]:
+            frame[name] = self.X[:, self.families[name][0].ravel()].ravel()
+        return frame
+
+    def _columns(self, names):
+        if names is None:
+            return np.arange(self.X.shape[1])
+        return np.concatenate([self.families[name][0].ravel() for name in names])
+
+    def spread(self, names=None, changed=False):
+        # Per variable over the pool; only the variables that differ between solutions with changed=True
+        columns = self._columns(names)
+        X = self.X[:, columns]
+        ordered = np.sort(X, axis=0)
+        distinct = 1 + (np.diff(ordered, axis=0) != 0).sum(axis=0) if len(X) else np.zeros(len(columns), int)
+        if self.names is None:
+            self.names = self.m.getAttr(GRB.Attr.VarName, self.vars)
+        frame = pd.DataFrame({'variable': [self.names[c] for c in columns], 'min': X.min(axis=0),
+                              'max': X.max(axis=0), 'mean': X.mean(axis=0), 'std': X.std(axis=0),
+                              'distinct': distinct})
+        return frame[frame.distinct > 1] if changed else frame
+
+    def distinct(self, names=None, decimals=6):
+        # Groups of identical solutions: (representative solution per group, group of every solution)
+        X = self.X[:, self._columns(names)].round(decimals)
+        _, first, group = np.unique(X, axis=0, return_index=True, return_inverse=True)
+        order = np.argsort(first)                   # groups numbered in pool order
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        return first[order], rank[group.ravel()]
+
+    def clusters(self, names=None, decimals=6):
+        # Size and objective range of each group of identical solutions
+        representative, group = self.distinct(names, decimals)
+        sizes = np.bincount(group, minlength=len(representative))
+        frame = pd.DataFrame({'solution': representative, 'size': sizes, 'objective': self.obj[representative]})
+        frame['worst'] = pd.Series(self.obj).groupby(group).max().to_numpy()
+        return frame
+
+    def objectives(self):
+        # Distribution of the pool objective values, and each one's gap to the best
+        best = self.obj.min() if self.m.ModelSense == GRB.MINIMIZE else self.obj.max()
+        gap = np.abs(self.obj - best) / max(abs(best), 1e-10)
+        return pd.DataFrame({'objective': self.obj, 'gap': gap}).describe()
+
+
+def dispatch_pool(m, dm, decimals=None):
+    # Pool of a solved dispatch model (or a copy of it), with its (battery, period) and period families
+    pool = SolutionPool(m, decimals)
+    batteries, periods = ('battery', dm.fleet.names), ('time_period', range(dm.periods))
+    for name in ('flow_in', 'flow_out', 'state', 'zwitch'):
+        pool.add(name, getattr(dm, name), [batteries, periods])
+    for name in ('grid', 'gen'):
+        pool.add(name, getattr(dm, name), [periods])
+    return pool
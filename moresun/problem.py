@@ -1,19 +1,26 @@
 from gurobipy import GRB
-import gurobipy as gp
-import pandas as pd
-
-
-# read in solar forecast data
-path = 'https://raw.githubusercontent.com/Gurobi/modeling-examples/master/optimization101/Modeling_Session_2/'
-solar_values_read = pd.read_csv(path + 'pred_solar_values.csv')
-solar_values = round(solar_values_read.yhat, 3)
-solar_values.reset_index(drop=True, inplace=True)
-
-# read in demand data, where total demand is a fixed building demand
-# and an estimated demand based on a proposed schedule for the building
-schedule = pd.read_csv(path + 'schedule_demand.csv')
-avg_building = pd.read_csv(path + 'building_demand.csv')
-total_demand = schedule.sched_demand + avg_building.build_demand
+import numpy as np
+
+from moresun import data
+from moresun.dispatch import BatteryFleet, build_dispatch
+from moresun.pool import dispatch_pool
+from telemetry import SolveTrace, traced
+
+# Every solve is traced (see `telemetry`) and its trace written to
+# `trace_dir`; reading the data and building the first model are timed as part of the first one.
+trace_dir = 'traces'
+# write the multi-scenario model to multi-scenario.lp (for debugging)
+write_lp = False
+first = SolveTrace('moresun_min_grid')
+
+# read in solar forecast data (see `data`)
+with first.stage('load'):
+    solar_values_read = data.solar_values_read
+    solar_values = data.solar_values
+
+    # read in demand data, where total demand is a fixed building demand
+    # and an estimated demand based on a proposed schedule for the building
+    total_demand = data.total_demand
 print(f"Total solar generation: {solar_values.sum()}")
 print(f"Total demand: {total_demand.sum()}")
 
@@ -22,87 +29,34 @@ batteries = ['Battery0', 'Battery1']
 capacity = {'Battery0': 60, 'Battery1': 80}   # kW
 p_loss = {'Battery0': 0.95, 'Battery1': 0.9}  # percentage
 initial = {'Battery0': 0, 'Battery1': 0}      # kW
+fleet = BatteryFleet(batteries, [capacity[b] for b in batteries], [p_loss[b] for b in batteries],
+                     [initial[b] for b in batteries])
 time_periods = range(len(solar_values_read))
 
-m = gp.Model()
-
-flow_in = m.addVars(batteries, time_periods, name='flow_in')
-flow_out = m.addVars(batteries, time_periods, name='flow_out')
-grid = m.addVars(time_periods, name='grid')
-state = m.addVars(batteries, time_periods, ub=[capacity[b] for b in batteries for t in time_periods], name='state')
-gen = m.addVars(time_periods, name='gen')
-zwitch = m.addVars(batteries, time_periods, vtype=GRB.BINARY, name='zwitch')
-
-# Power balance
-power_balance = m.addConstrs(
-    (gp.quicksum(flow_out[b, t] - (p_loss[b] * flow_in[b, t]) for b in batteries)
-     + gen[t]
-     + grid[t]
-     == total_demand[t]
-     for t in time_periods),
-    name='power_balance'
-)
+with first.stage('load'):
+    # read in estimated price of electricity for each time period
+    avg_price = data.avg_price
+    price = avg_price.price
 
-# Battery state
-initial_state = m.addConstrs(
-    (state[b, 0] ==
-     initial[b]
-     + (p_loss[b] * flow_in[b, 0])
-     - flow_out[b, 0]
-     for b in batteries),
-    name='initial_state'
-)
-subsequent_state = m.addConstrs(
-    (state[b, t] ==
-     state[b, t - 1]
-     + (p_loss[b] * flow_in[b, t - 1])
-     - flow_out[b, t - 1]
-     for b in batteries
-     for t in time_periods if t >= 1),
-    name='subsequent_state'
-)
+# the battery dispatch model (see `dispatch.build_dispatch`), initially minimizing the grid purchase
+with first.stage('build'):
+    dm = build_dispatch(fleet, solar_values, total_demand, price)
+    m = dm.m
+    state = dm.state
+    # linear expressions for total energy purchased from the grid and total cost
+    total_grid = dm.total_grid
+    total_cost = dm.total_cost
 
-# Solar availability
-solar_avail = m.addConstrs(
-    (flow_in['Battery0', t] + flow_in['Battery1', t] + gen[t]
-     <= solar_values[t]
-     for t in time_periods),
-    name='solar_avail'
-)
-
-# Charge/discharge
-to_charge = m.addConstrs(
-    (flow_in[b, t] <= 20 * zwitch[b, t]
-     for b in batteries
-     for t in time_periods),
-    name='to_charge'
-)
-or_not_to_charge = m.addConstrs(
-    (flow_out[b, t] <= 20 * (1 - zwitch[b, t])
-     for b in batteries
-     for t in time_periods),
-    name='or_not_to_charge'
-)
-
-# read in estimated price of electricity for each time period
-avg_price = pd.read_csv(path + 'expected_price.csv')
-price = avg_price.price
-
-# define a linear expression for total energy purchased from the grid
-total_grid = grid.sum()
-# define a linear expression for total cost
-total_cost = gp.quicksum(avg_price.price[t] * grid[t] for t in time_periods)
-
-# initial objective: min grid purchase
-m.setObjective(total_grid, GRB.MINIMIZE)
-
-m.optimize()
+first.optimize(m)
+print(first)
+first.save(trace_dir)
 
 # now, minimize total cost
 m.setObjective(total_cost, GRB.MINIMIZE)
 mp = m.copy()
 
-m.optimize()
+with traced('moresun_min_cost', trace_dir) as trace:
+    trace.optimize(m)
 
 
 # now, multiple objectives of cost and energy purchased
@@ -110,14 +64,16 @@ m.setObjectiveN(total_cost, index=0, weight=1, name='total_cost')
 m.setObjectiveN(total_grid, index=1, weight=10, name='total_grid')
 m.ModelSense = GRB.MINIMIZE
 
-m.optimize()
+with traced('moresun_blended', trace_dir) as trace:
+    trace.optimize(m)
 
 
 v = m.addVars(time_periods, vtype=GRB.BINARY, name='v')
 # Define a linear expression for the total depth count
 total_depth_count = v.sum()
+b0 = fleet.index('Battery0')
 m.addConstrs(
-    ((v[t] == 0) >> (state['Battery0', t] >= 0.3 * capacity['Battery0'])
+    ((v[t] == 0) >> (state[b0, t].item() >= 0.3 * capacity['Battery0'])
      for t in time_periods),
     name='discharge_depth'
 )
@@ -128,113 +84,53 @@ m.setObjectiveN(total_depth_count, index=1, priority=1, reltol=0.2, name='depth_
 m.setObjectiveN(total_grid, index=2, priority=0, name='grid')
 
 
-m.optimize()
+with traced('moresun_hierarchical', trace_dir) as trace:
+    trace.optimize(m)
 
 for i in range(m.NumObj):
     m.params.ObjNumber = i
     print(' ', round(m.ObjNVal, 2), end='')
 
 
-mm = gp.Model()
-
-flow_in = mm.addVars(batteries, time_periods, name='flow_in')
-flow_out = mm.addVars(batteries, time_periods, name='flow_out')
-grid = mm.addVars(time_periods, name='grid')
-state = mm.addVars(batteries, time_periods, ub=[capacity[b] for b in batteries for t in time_periods], name='state')
-gen = mm.addVars(time_periods, name='gen')
-zwitch = mm.addVars(batteries, time_periods, vtype=GRB.BINARY, name='zwitch')
-
-# Power balance
-power_balance = mm.addConstrs(
-    (gp.quicksum(flow_out[b, t] - (p_loss[b] * flow_in[b, t]) for b in batteries)
-     + gen[t]
-     + grid[t]
-     == total_demand[t]
-     for t in time_periods),
-    name='power_balance'
-)
-
-# Battery state
-initial_state = mm.addConstrs(
-    (state[b, 0] ==
-     initial[b]
-     + (p_loss[b] * flow_in[b, 0])
-     - flow_out[b, 0]
-     for b in batteries),
-    name='initial_state'
-)
-subsequent_state = mm.addConstrs(
-    (state[b, t] ==
-     state[b, t - 1]
-     + (p_loss[b] * flow_in[b, t - 1])
-     - flow_out[b, t - 1]
-     for b in batteries
-     for t in time_periods if t >= 1),
-    name='subsequent_state'
-)
-
-# Solar availability
-solar_avail = mm.addConstrs(
-    (flow_in['Battery0', t] + flow_in['Battery1', t] + gen[t]
-     <= solar_values[t]
-     for t in time_periods),
-    name='solar_avail'
-)
-
-# Charge/discharge
-to_charge = mm.addConstrs(
-    (flow_in[b, t] <= 20 * zwitch[b, t]
-     for b in batteries
-     for t in time_periods),
-    name='to_charge'
-)
-or_not_to_charge = mm.addConstrs(
-    (flow_out[b, t] <= 20 * (1 - zwitch[b, t])
-     for b in batteries
-     for t in time_periods),
-    name='or_not_to_charge'
-)
-
-# define a linear expression for total energy purchased from the grid
-total_grid = grid.sum()
-# define a linear expression for total cost
-total_cost = gp.quicksum(avg_price.price[t] * grid[t] for t in time_periods)
-
-# initial objective: min grid purchase
-mm.setObjective(total_grid, GRB.MINIMIZE)
-
-mm.update()
-
-mm.NumScenarios = 4
-mm.Params.ScenarioNumber = 0
-mm.ScenNName = 'Base model'
-
-price2 = avg_price.price2
-mm.Params.ScenarioNumber = 1
-mm.ScenNName = 'Increased price'
-for t in time_periods:
-    grid[t].ScenNObj = price2[t]
-
-capacity2 = {'Battery0': 40, 'Battery1': 64}
-mm.Params.ScenarioNumber = 2
-mm.ScenNName = 'Low battery'
-for b in batteries:
-    for t in time_periods:
-        state[b, t].ScenNObj = capacity2[b]
-
-solar_values2 = round(
-    0.1 * solar_values_read.yhat_lower
-    + 0.6 * solar_values_read.yhat
-    + 0.3 * solar_values_read.yhat_upper
-)
-solar_values2[solar_values2 < 0] = 0
-mm.Params.ScenarioNumber = 3
-mm.ScenNName = 'High solar'
-for t in time_periods:
-    solar_avail[t].ScenNRhs = solar_values2[t]
-
-mm.write('multi-scenario.lp')
-mm.optimize()
+scenarios = SolveTrace('moresun_scenarios')
+with scenarios.stage('build'):
+    dm_scenarios = build_dispatch(fleet, solar_values, total_demand, price)
+    mm = dm_scenarios.m
+    flow_in, flow_out, grid, state = dm_scenarios.flow_in, dm_scenarios.flow_out, dm_scenarios.grid, dm_scenarios.state
+    solar_avail = dm_scenarios.constrs['solar_avail']
+    mm.update()
+
+with scenarios.stage('scenarios'):
+    mm.NumScenarios = 4
+    mm.Params.ScenarioNumber = 0
+    mm.ScenNName = 'Base model'
+
+    price2 = avg_price.price2
+    mm.Params.ScenarioNumber = 1
+    mm.ScenNName = 'Increased price'
+    grid.ScenNObj = price2.to_numpy()
+
+    capacity2 = {'Battery0': 40, 'Battery1': 64}
+    mm.Params.ScenarioNumber = 2
+    mm.ScenNName = 'Low battery'
+    state.ScenNUB = np.repeat([[capacity2[b]] for b in batteries], len(time_periods), axis=1)
+
+    solar_values2 = round(
+        0.1 * solar_values_read.yhat_lower
+        + 0.6 * solar_values_read.yhat
+        + 0.3 * solar_values_read.yhat_upper
+    )
+    solar_values2[solar_values2 < 0] = 0
+    mm.Params.ScenarioNumber = 3
+    mm.ScenNName = 'High solar'
+    solar_avail.ScenNRhs = solar_values2.to_numpy()
+
+if write_lp:
+    with scenarios.stage('write'):
+        mm.write('multi-scenario.lp')
+scenarios.optimize(mm)
+print(scenarios)
+scenarios.save(trace_dir)
 
 for s in range(mm.NumScenarios):
     mm.Params.ScenarioNumber = s
@@ -244,17 +140,15 @@ mp.setParam(GRB.Param.PoolSolutions, 250)
 mp.setParam(GRB.Param.PoolGap, 0.05)
 mp.setParam(GRB.Param.PoolSearchMode, 2)
 
-mp.optimize()
+with traced('moresun_pool', trace_dir) as trace:
+    trace.optimize(mp)
 
-flow_250 = pd.DataFrame()
-for i in range(250):
-    mp.setParam(GRB.Param.SolutionNumber, i)
-    tmp = pd.DataFrame(
-        ([b, t, flow_in[b, t].Xn, flow_out[b, t].Xn, i]
-         for b in batteries
-         for t in time_periods),
-        columns=['battery', 'time_period', 'out', 'in', 'scenario']
-    )
-    flow_250 = pd.concat([flow_250, tmp], axis=0, ignore_index=True)
+    with trace.stage('extract'):
+        # the whole pool at once (see `pool`); mp is a copy of m, so dm's variables are its own
+        pool = dispatch_pool(mp, dm)
+        flow_pool = pool.tidy(['flow_in', 'flow_out']).rename(columns={'flow_in': 'in', 'flow_out': 'out'})
 
-print(flow_250)
+print(pool)
+print(flow_pool)
+print(pool.objectives())
+print(pool.clusters(['zwitch']))
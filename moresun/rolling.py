@@ -0,0 +1,157 @@
+from gurobipy import GRB
+import gurobipy as gp
+import numpy as np
+import pandas as pd
+import time
+
+from moresun import data
+from moresun.dispatch import BatteryFleet, build_dispatch
+
+
+# Rolling-horizon battery dispatch.
+#
+# Every step, a forecast for the next `window` periods comes in (solar, demand and prices); the
+# dispatch model for those periods is solved at minimum cost, its first period is committed (the
+# charge/discharge of every battery and the energy bought from the grid), and the horizon moves
+# on by one period, with the batteries' state of charge after the committed period as the new
+# initial state.
+#
+# The model is built once (see `dispatch.build_dispatch`) and updated in place: a new forecast
+# only changes right-hand sides (demand, solar, initial state) and the grid prices in the
+# objective. The previous plan is reused as a MIP start -- the rolling horizon warm start from
+# notes.md: its charge/discharge decisions for the periods that overlap the new window are the
+# Start of zwitch, shifted by one period (the last period is left for Gurobi to fill in). Only
+# the binaries are given: Gurobi completes the start by solving an LP, which also fits the new
+# forecast. Each step's latency, from receiving the forecast to having the committed decisions,
+# is recorded, and steps slower than the control interval are flagged.
+#
+# At the end of the stream the rest of the last plan is committed as it is, so the whole horizon
+# is planned.
+
+step_cols = ['Step', 'Latency', 'Runtime', 'Nodes', 'Objective', 'Gap', 'Grid', 'Gen', 'Over Interval']
+
+
+class Forecast:
+    def __init__(self, step, solar, demand, price):
+        self.step = step                                # first period of the forecast
+        self.solar = np.asarray(solar, dtype=float)
+        self.demand = np.asarray(demand, dtype=float)
+        self.price = np.asarray(price, dtype=float)
+
+    def __str__(self):
+        return f"Forecast for periods {self.step}-{self.step + len(self.demand) - 1}"
+
+
+class RollingHorizon:
+    def __init__(self, fleet, window, initial=None, warm=True, interval=None, env=None, params=None):
+        self.fleet = fleet
+        self.window = window
+        self.warm = warm
+        self.interval = interval            # control interval (s)
+        zeros = np.zeros(window)
+        self.dm = build_dispatch(fleet, zeros, zeros, zeros, env=env, name='rolling_dispatch')
+        self.m = self.dm.m
+        self.m.setObjective(self.dm.total_cost, GRB.MINIMIZE)
+        for name, value in (params or {}).items():
+            self.m.setParam(name, value)
+        self.state = fleet.initial.copy() if initial is None else np.asarray(initial, dtype=float)
+        self.steps = []
+        self.committed = []                 # per committed period: (period, flow_in, flow_out, state, grid, gen)
+        self.plan = None                    # last solution, as above for every period of the window
+
+    def __str__(self):
+        return (f"Rolling horizon: {len(self.fleet)} batteries, window of {self.window} periods, "
+                f"{len(self.committed)} periods committed")
+
+    def update(self, forecast):
+        # New forecast and initial state in the model, and the previous plan as MIP start
+        dm, T = self.dm, self.window
+        dm.constrs['power_balance'].RHS = forecast.demand
+        dm.constrs['solar_avail'].RHS = forecast.solar
+        dm.constrs['battery_state'].RHS = np.repeat(self.state, T) * np.tile(np.r_[1.0, np.zeros(T - 1)], len(self.fleet))
+        dm.grid.Obj = forecast.price
+        if self.warm and self.plan is not None:
+            zwitch = np.full((len(self.fleet), T), GRB.UNDEFINED)
+            zwitch[:, :-1] = self.plan['zwitch'][:, 1:]
+            dm.zwitch.Start = zwitch
+
+    def solve(self, forecast):
+        start = time.perf_counter()
+        self.update(forecast)
+        self.m.optimize()
+        if self.m.SolCount == 0:
+            raise RuntimeError(f"No dispatch found for step {forecast.step} (status {self.m.Status})")
+        dm = self.dm
+        self.plan = {'flow_in': dm.flow_in.X, 'flow_out': dm.flow_out.X, 'state': dm.state.X,
+                     'grid': dm.grid.X, 'gen': dm.gen.X, 'zwitch': np.round(dm.zwitch.X)}
+        self.commit(forecast.step, 0)
+        latency = time.perf_counter() - start
+        self.steps.append({'Step': forecast.step, 'Latency': latency, 'Runtime': self.m.Runtime,
+                           'Nodes': self.m.NodeCount, 'Objective': self.m.ObjVal, 'Gap': self.m.MIPGap,
+                           'Grid': self.plan['grid'][0], 'Gen': self.plan['gen'][0],
+                           'Over Interval': self.interval is not None and latency > self.interval})
+        return latency
+
+    def commit(self, step, t):
+        plan = self.plan
+        self.committed.append((step + t, plan['flow_in'][:, t], plan['flow_out'][:, t], plan['state'][:, t],
+                               plan['grid'][t], plan['gen'][t]))
+        self.state = plan['state'][:, t].copy()
+
+    def run(self, forecasts, verbose=True):
+        for forecast in forecasts:
+            latency = self.solve(forecast)
+            if verbose:
+                print(f"Step {forecast.step}: {latency:.3f}s, objective {self.m.ObjVal:.2f}")
+        # the rest of the last plan
+        if self.plan is not None:
+            for t in range(1, self.window):
+                self.commit(self.steps[-1]['Step'], t)
+        return pd.DataFrame.from_records(self.steps, columns=step_cols), self.dispatch()
+
+    def dispatch(self):
+        # Committed dispatch, one row per battery and period
+        rows = [(period, b, flow_in[i], flow_out[i], state[i])
+                for period, flow_in, flow_out, state, _, _ in self.committed
+                for i, b in enumerate(self.fleet.names)]
+        return pd.DataFrame(rows, columns=['Period', 'Battery', 'Flow In', 'Flow Out', 'State'])
+
+    def close(self):
+        self.m.dispose()
+
+
+# Forecast updates for the course data: the realized solar generation is drawn between
+# yhat_lower and yhat_upper, and the forecast issued at step s for a later period t moves from
+# yhat towards it the closer t gets (fully known at t = s). Demand is as planned and prices vary
+# by up to `price_noise` around the expected price.
+
+
+def forecast_updates(window, seed=0, price_noise=0.1):
+    rng = np.random.default_rng(seed)
+    solar_read, demand, price = data.solar_values_read, data.total_demand.to_numpy(), data.avg_price.price.to_numpy()
+    yhat = solar_read.yhat.to_numpy()
+    weight = rng.uniform(size=len(yhat))
+    realized = solar_read.yhat_lower.to_numpy() * (1 - weight) + solar_read.yhat_upper.to_numpy() * weight
+    for s in range(len(yhat) - window + 1):
+        t = np.arange(s, s + window)
+        known = np.clip(1 - (t - s) / window, 0, 1)
+        solar = np.clip(yhat[t] + known * (realized[t] - yhat[t]), 0, None)
+        yield Forecast(s, np.round(solar, 3), demand[t], price[t] * rng.uniform(1 - price_noise, 1 + price_noise, window))
+
+
+if __name__ == '__main__':
+    batteries = ['Battery0', 'Battery1']
+    fleet = BatteryFleet(batteries, [60, 80], [0.95, 0.9])
+    env = gp.Env(empty=True)
+    env.setParam('OutputFlag', 0)
+    env.start()
+    for warm in (False, True):
+        rolling = RollingHorizon(fleet, 12, warm=warm, interval=1.0, env=env)
+        steps, dispatch = rolling.run(forecast_updates(12), verbose=False)
+        print(f"{'Warm' if warm else 'Cold'} starts: {len(steps)} steps, latency mean {steps.Latency.mean():.3f}s, "
+              f"max {steps.Latency.max():.3f}s, {int(steps['Over Interval'].sum())} over the interval, "
+              f"{steps.Nodes.sum():.0f} nodes")
+        rolling.close()
+    print(steps.to_string(index=False))
+    print(dispatch.pivot(index='Period', columns='Battery', values='State'))
+    env.dispose()
@@ -0,0 +1,202 @@
+from gurobipy import GRB
+import gurobipy as gp
+import multiprocessing
+import numpy as np
+import os
+import pandas as pd
+import time
+
+from moresun import data
+from moresun.dispatch import BatteryFleet, build_dispatch
+
+
+# Scenario engine for the battery dispatch model.
+#
+# A scenario is a solar profile, a price profile and the batteries' usable capacities.
+# `generate_scenarios` draws any number of them: solar between the forecast quantiles
+# (yhat_lower, yhat, yhat_upper) at a quantile level that is drawn per scenario and varies a
+# little from period to period; prices around the expected price with a common level and
+# per-period noise (lognormal); and, with probability `p_degraded`, a battery that only has part
+# of its capacity ("low battery").
+#
+# The scenarios are solved as Gurobi multi-scenario models at minimum cost: the base model is the
+# dispatch model (see `dispatch.build_dispatch`) with the expected data, and each scenario is
+# applied with one bulk attribute call per family -- ScenNObj of the grid purchases (prices),
+# ScenNRhs of the solar availability constraints and ScenNUB of the battery states
+# (capacities). As one multi-scenario model gets slow to solve when it has many scenarios,
+# they are split into chunks of `chunk_size`, solved as separate multi-scenario models in
+# parallel worker processes. `solve_independent` solves every scenario as a model of its own,
+# for comparison.
+#
+# Both give one row per scenario (objective, bound, energy bought, charged and discharged) and
+# the dispatch of each scenario, one row per scenario, battery and period.
+
+result_cols = ['Scenario', 'Name', 'Objective', 'Bound', 'Grid', 'Charge', 'Discharge']
+dispatch_cols = ['Scenario', 'Battery', 'Period', 'Flow In', 'Flow Out', 'State', 'Grid']
+
+
+class Scenario:
+    def __init__(self, name, solar, price, capacity):
+        self.name = name
+        self.solar = np.asarray(solar, dtype=float)
+        self.price = np.asarray(price, dtype=float)
+        self.capacity = np.asarray(capacity, dtype=float)    # per battery
+
+    def __str__(self):
+        return f"Scenario {self.name}: solar {self.solar.sum():.1f}, mean price {self.price.mean():.2f}"
+
+
+def generate_scenarios(n, fleet, solar_read=None, price=None, seed=0, spread=0.1, price_level=0.15,
+                       price_noise=0.05, p_degraded=0.1, degraded=(0.6, 0.9)):
+    rng = np.random.default_rng(seed)
+    solar_read = data.solar_values_read if solar_read is None else solar_read
+    price = data.avg_price.price.to_numpy() if price is None else np.asarray(price, dtype=float)
+    lower, mid, upper = (np.clip(solar_read[c].to_numpy(), 0, None) for c in ('yhat_lower', 'yhat', 'yhat_upper'))
+    T = len(mid)
+
+    # quantile level per scenario and period, in [0, 1] (0.5 is yhat)
+    q = np.clip(rng.uniform(size=(n, 1)) + rng.normal(0, spread, (n, T)), 0, 1)
+    solar = np.where(q < 0.5, lower + (mid - lower) * 2 * q, mid + (upper - mid) * (2 * q - 1))
+    prices = price * np.exp(rng.normal(0, price_level, (n, 1)) + rng.normal(0, price_noise, (n, T)))
+    capacity = np.repeat(fleet.capacity[None, :], n, axis=0)
+    low = rng.uniform(size=capacity.shape) < p_degraded
+    capacity[low] *= rng.uniform(*degraded, size=int(low.sum()))
+    return [Scenario(f"S{s}", np.round(solar[s], 3), prices[s], capacity[s]) for s in range(n)]
+
+
+_instance = {}
+
+
+def _init_worker(fleet, solar, demand, price, threads=1):
+    env = gp.Env(empty=True)
+    env.setParam('OutputFlag', 0)
+    env.setParam('Threads', threads)
+    env.start()
+    _instance.update(fleet=fleet, solar=solar, demand=demand, price=price, env=env)
+
+
+def _build():
+    dm = build_dispatch(_instance['fleet'], _instance['solar'], _instance['demand'], _instance['price'],
+                        env=_instance['env'])
+    dm.m.setObjective(dm.total_cost, GRB.MINIMIZE)
+    return dm
+
+
+def apply_scenarios(dm, scenarios):
+    # Scenarios of a multi-scenario model, one bulk attribute call per family and scenario
+    m, T = dm.m, dm.periods
+    m.NumScenarios = len(scenarios)
+    for s, scen in enumerate(scenarios):
+        m.Params.ScenarioNumber = s
+        m.ScenNName = scen.name
+        dm.grid.ScenNObj = scen.price
+        dm.constrs['solar_avail'].ScenNRhs = scen.solar
+        dm.state.ScenNUB = np.repeat(scen.capacity[:, None], T, axis=1)
+
+
+def _rows(s, scen, fleet, objective, bound, flow_in, flow_out, state, grid):
+    result = [s, scen.name, objective, bound, grid.sum(), flow_in.sum(), flow_out.sum()]
+    B, T = flow_in.shape
+    dispatch = pd.DataFrame({'Scenario': scen.name, 'Battery': np.repeat(fleet.names, T), 'Period': np.tile(np.arange(T), B),
+                             'Flow In': flow_in.ravel(), 'Flow Out': flow_out.ravel(), 'State': state.ravel(),
+                             'Grid': np.tile(grid, B)})
+    return result, dispatch
+
+
+def solve_chunk(task):
+    # One multi-scenario model for a chunk of scenarios: (result rows, dispatch)
+    first, scenarios = task
+    dm = _build()
+    apply_scenarios(dm, scenarios)
+    dm.m.optimize()
+    rows, dispatch = [], []
+    for s, scen in enumerate(scenarios):
+        dm.m.Params.ScenarioNumber = s
+        if dm.m.ScenNObjVal >= GRB.INFINITY:
+            rows.append([first + s, scen.name, None, dm.m.ScenNObjBound, None, None, None])
+            continue
+        row, frame = _rows(first + s, scen, _instance['fleet'], dm.m.ScenNObjVal, dm.m.ScenNObjBound,
+                           dm.flow_in.ScenNX, dm.flow_out.ScenNX, dm.state.ScenNX, dm.grid.ScenNX)
+        rows.append(row)
+        dispatch.append(frame)
+    dm.m.dispose()
+    return rows, dispatch
+
+
+def solve_single(task):
+    # One scenario as a model of its own
+    s, scen = task
+    dm = _build()
+    dm.grid.Obj = scen.price
+    dm.constrs['solar_avail'].RHS = scen.solar
+    dm.state.UB = np.repeat(scen.capacity[:, None], dm.periods, axis=1)
+    dm.m.optimize()
+    if dm.m.SolCount == 0:
+        rows, dispatch = [[s, scen.name, None, None, None, None, None]], []
+    else:
+        row, frame = _rows(s, scen, _instance['fleet'], dm.m.ObjVal, dm.m.ObjBound,
+                           dm.flow_in.X, dm.flow_out.X, dm.state.X, dm.grid.X)
+        rows, dispatch = [row], [frame]
+    dm.m.dispose()
+    return rows, dispatch
+
+
+def _run(solve, tasks, fleet, workers, base):
+    solar, demand, price = base
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers > 1:
+        with multiprocessing.Pool(workers, _init_worker, (fleet, solar, demand, price)) as pool:
+            parts = pool.map(solve, tasks)
+    else:
+        _init_worker(fleet, solar, demand, price, threads=0)
+        parts = [solve(task) for task in tasks]
+        _instance.pop('env').dispose()
+    results = pd.DataFrame([row for rows, _ in parts for row in rows], columns=result_cols)
+    frames = [frame for _, dispatch in parts for frame in dispatch]
+    dispatch = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=dispatch_cols)
+    return results, dispatch
+
+
+def base_data():
+    # The expected solar, demand and prices of the base model
+    return data.solar_values.to_numpy(), data.total_demand.to_numpy(), data.avg_price.price.to_numpy()
+
+
+def solve_scenarios(fleet, scenarios, chunk_size=50, workers=None, base=None):
+    chunks = [(c, scenarios[c:c + chunk_size]) for c in range(0, len(scenarios), chunk_size)]
+    return _run(solve_chunk, chunks, fleet, workers, base or base_data())
+
+
+def solve_independent(fleet, scenarios, workers=None, base=None):
+    return _run(solve_single, list(enumerate(scenarios)), fleet, workers, base or base_data())
+
+
+# One multi-scenario model for all scenarios, chunks of multi-scenario models in parallel, and
+# every scenario on its own
+
+
+def compare_strategies(fleet, scenarios, chunk_size=50, workers=None):
+    timings = {}
+    runs = {'one model': lambda: solve_scenarios(fleet, scenarios, chunk_size=len(scenarios), workers=1),
+            f"chunks of {chunk_size}": lambda: solve_scenarios(fleet, scenarios, chunk_size, workers),
+            'independent': lambda: solve_independent(fleet, scenarios, workers)}
+    objectives = {}
+    for name, run in runs.items():
+        start = time.perf_counter()
+        results, _ = run()
+        timings[name] = time.perf_counter() - start
+        objectives[name] = results.Objective.to_numpy()
+        print(f"{name}: {timings[name]:.3f}s, mean objective {results.Objective.mean():.2f}")
+    reference = objectives['independent']
+    for name, objective in objectives.items():
+        print(f"{name}: largest difference from independent solves "
+              f"{np.nanmax(np.abs(objective - reference) / np.maximum(np.abs(reference), 1)):.2e} (relative)")
+    return timings
+
+
+if __name__ == '__main__':
+    fleet = BatteryFleet(['Battery0', 'Battery1'], [60, 80], [0.95, 0.9])
+    scenarios = generate_scenarios(200, fleet)
+    results, dispatch = solve_scenarios(fleet, scenarios)
+    print(results.describe().to_string())
+    compare_strategies(fleet, scenarios)
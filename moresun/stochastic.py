@@ -0,0 +1,257 @@
+from gurobipy import GRB
+import gurobipy as gp
+import multiprocessing
+import numpy as np
+import os
+import pandas as pd
+import sys
+import time
+import warnings
+
+from moresun import data
+from moresun.dispatch import BatteryFleet, add_dispatch
+from moresun.scenarios import generate_scenarios
+
+
+# Two-stage stochastic battery planning.
+#
+# First stage: the day-ahead grid purchase plan, grid[t], at the expected price. Second stage,
+# once the solar generation of scenario s is known: the battery dispatch (flow_in, flow_out,
+# state, gen; see `dispatch.add_dispatch`), energy bought on the spot market, spot[t], at the
+# scenario's price times `premium`, and energy of the plan that is not needed, spill[t] (free):
+#
+#   min  price @ grid + sum_s p_s * premium * spot_price_s @ spot_s
+#   s.t. the dispatch constraints of every scenario, with grid + spot_s - spill_s from the grid
+#
+# Every plan can be completed in every scenario (complete recourse). The second stage is the LP
+# without the charge/discharge binaries (see `lp_first`: with losses, charging and discharging at
+# once does not pay), so that its duals give the cuts.
+#
+# `solve_extensive` solves the whole model at once. `solve_benders` solves it by L-shaped
+# (Benders) decomposition: the master problem has the plan and one variable theta_s per scenario
+# (multi-cut; one in all with multicut=False) for its expected recourse cost, initially only
+# bounded by 0 (the recourse costs are not negative); the scenario subproblems are solved for the
+# master's plan, in a process pool, and each gives the optimality cut
+#
+#   theta_s >= Q_s(g) - pi_s @ (grid - g)
+#
+# with Q_s(g) its cost and pi_s the duals of its power balance constraints (its right-hand side
+# is demand - g). The master's objective is a lower bound, the plan's cost with the subproblems
+# an upper bound; the loop ends when they are within `gap`. Every worker keeps the subproblem
+# models of its scenarios and only changes their right-hand sides, so each is re-solved from its
+# previous basis, as is the master after new cuts.
+#
+# The plain cutting-plane master jumps between extreme plans, and takes hundreds of iterations
+# on longer horizons. With `level` (the default), the master is stabilized by the level method:
+# after the LP master gives the lower bound, the plan to evaluate next is the one closest to the
+# best plan so far (least squares, a QP) whose master objective is at most
+#   lower + level * (upper - lower)
+# The lower bound is still the LP master's, so the stopping rule is unchanged. A run that stops
+# at `max_iterations` before the bounds meet warns and reports converged=False with its gap.
+
+iteration_cols = ['Iteration', 'Lower', 'Upper', 'Gap', 'Cuts', 'Master', 'Subproblems']
+
+
+class StochasticResult:
+    def __init__(self, method, grid, objective, runtime, iterations=None, gap=0.0, converged=True):
+        self.method = method
+        self.grid = grid                    # first-stage plan
+        self.objective = objective
+        self.runtime = runtime
+        self.iterations = iterations        # Benders iterations (DataFrame)
+        self.gap = gap                      # final relative gap between the bounds (Benders)
+        self.converged = converged
+
+    def __str__(self):
+        steps = '' if self.iterations is None else f", {len(self.iterations)} iterations"
+        status = '' if self.converged else f" (not converged, gap {self.gap:.2e})"
+        return f"{self.method}: objective {self.objective:.4f}{status}, {self.runtime:.3f}s{steps}"
+
+
+def sample_scenarios(n, fleet, seed=0):
+    # Solar between yhat_lower and yhat_upper, spot prices around the expected price (see `scenarios`)
+    return generate_scenarios(n, fleet, seed=seed, p_degraded=0)
+
+
+def solve_extensive(fleet, scenarios, demand, price, premium=1.5, env=None):
+    start = time.perf_counter()
+    T, p = len(demand), 1 / len(scenarios)
+    m = gp.Model('stochastic_dispatch', env=env)
+    grid = m.addMVar(T, name='grid')
+    recourse = []
+    for s, scen in enumerate(scenarios):
+        spot = m.addMVar(T, name=f"spot[{s}]")
+        spill = m.addMVar(T, name=f"spill[{s}]")
+        add_dispatch(m, fleet, scen.solar, demand, grid=grid + spot - spill, binaries=False, suffix=f"[{s}]")
+        recourse.append(p * premium * scen.price @ spot)
+    m.setObjective(price @ grid + gp.quicksum(recourse), GRB.MINIMIZE)
+    m.optimize()
+    result = StochasticResult('extensive form', grid.X, m.ObjVal, time.perf_counter() - start)
+    m.dispose()
+    return result
+
+
+_instance = {}
+
+
+def _init_worker(fleet, scenarios, demand, premium, threads=1):
+    env = gp.Env(empty=True)
+    env.setParam('OutputFlag', 0)
+    env.setParam('Threads', threads)
+    env.start()
+    _instance.update(fleet=fleet, scenarios=scenarios, demand=np.asarray(demand, dtype=float),
+                     premium=premium, env=env, models={})
+
+
+def _subproblem(s):
+    if s not in _instance['models']:
+        scen, T = _instance['scenarios'][s], len(_instance['demand'])
+        m = gp.Model(f"recourse[{s}]", env=_instance['env'])
+        spot = m.addMVar(T, name='spot')
+        spill = m.addMVar(T, name='spill')
+        dm = add_dispatch(m, _instance['fleet'], scen.solar, _instance['demand'], grid=spot - spill, binaries=False)
+        m.setObjective(_instance['premium'] * scen.price @ spot, GRB.MINIMIZE)
+        _instance['models'][s] = (m, dm.constrs['power_balance'])
+    return _instance['models'][s]
+
+
+def solve_subproblems(task):
+    # Recourse cost and power balance duals of the given scenarios for the plan
+    indices, plan = task
+    costs, duals = [], []
+    for s in indices:
+        m, balance = _subproblem(s)
+        balance.RHS = _instance['demand'] - plan
+        m.optimize()
+        if m.Status != GRB.OPTIMAL:
+            raise RuntimeError(f"Recourse problem of scenario {s} not solved (status {m.Status})")
+        costs.append(m.ObjVal)
+        duals.append(balance.Pi)
+    return indices, np.array(costs), np.array(duals)
+
+
+def _close_worker():
+    for m, _ in _instance.pop('models').values():
+        m.dispose()
+    _instance.pop('env').dispose()
+
+
+def solve_benders(fleet, scenarios, demand, price, premium=1.5, multicut=True, gap=1e-6, max_iterations=500,
+                  level=0.5, workers=None, env=None, verbose=False):
+    start = time.perf_counter()
+    S, T = len(scenarios), len(demand)
+    prob = np.full(S, 1 / S)
+    price = np.asarray(price, dtype=float)
+
+    master = gp.Model('benders_master', env=env)
+    grid = master.addMVar(T, name='grid')
+    theta = master.addMVar(S if multicut else 1, name='theta')
+    cost = price @ grid + (prob if multicut else np.ones(1)) @ theta
+    master.setObjective(cost, GRB.MINIMIZE)
+    # level constraint of the stabilized master: at the upper bound, where it cannot cut off the
+    # master's optimum, while solving for the lower bound
+    at_level = None
+
+    workers = min(workers or os.cpu_count() or 1, S)
+    chunks = [list(c) for c in np.array_split(np.arange(S), workers)]
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, _init_worker, (fleet, scenarios, demand, premium))
+        run = lambda plan: pool.map(solve_subproblems, [(c, plan) for c in chunks])
+    else:
+        _init_worker(fleet, scenarios, demand, premium, threads=0)
+        run = lambda plan: [solve_subproblems((c, plan)) for c in chunks]
+
+    rows, best, best_plan, rel = [], np.inf, None, np.inf
+    costs, duals = np.empty(S), np.empty((S, T))
+    try:
+        for k in range(max_iterations):
+            master.optimize()
+            plan, lower = grid.X, master.ObjVal
+            master_time = master.Runtime
+            if best_plan is not None:
+                # the new cuts may have closed the gap
+                rel = (best - lower) / max(abs(best), 1)
+                if rel <= gap:
+                    rows.append([k, lower, best, rel, 0, master_time, 0.0])
+                    break
+            if level and best_plan is not None:
+                # the plan closest to the best one, with a master objective at the level
+                if at_level is None:
+                    at_level = master.addConstr(cost <= best, name='level')
+                at_level.RHS = lower + level * (best - lower)
+                master.setObjective((grid - best_plan) @ (grid - best_plan), GRB.MINIMIZE)
+                master.optimize()
+                if master.Status == GRB.OPTIMAL:
+                    plan = grid.X
+                master_time += master.Runtime
+                at_level.RHS = best
+                master.setObjective(cost, GRB.MINIMIZE)
+            sub_start = time.perf_counter()
+            for indices, c, d in run(plan):
+                costs[indices], duals[indices] = c, d
+            sub_time = time.perf_counter() - sub_start
+            upper = price @ plan + prob @ costs
+            if upper < best:
+                best, best_plan = upper, plan
+            # theta_s >= Q_s - pi_s @ (grid - plan)
+            if multicut:
+                master.addConstr(duals @ grid + theta >= costs + duals @ plan, name=f"cut[{k}]")
+            else:
+                d = prob @ duals
+                master.addConstr(d @ grid + theta >= np.array([prob @ costs + d @ plan]), name=f"cut[{k}]")
+            rel = (best - lower) / max(abs(best), 1)
+            rows.append([k, lower, best, rel, S if multicut else 1, master_time, sub_time])
+            if verbose:
+                print(f"Iteration {k}: lower {lower:.4f}, upper {best:.4f}, gap {rel:.2e}")
+            if rel <= gap:
+                break
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        else:
+            _close_worker()
+        master.dispose()
+    iterations = pd.DataFrame(rows, columns=iteration_cols)
+    method = 'benders' if multicut else 'benders (single cut)'
+    converged = rel <= gap
+    if not converged:
+        warnings.warn(f"{method} stopped after {max_iterations} iterations with gap {rel:.2e} (> {gap:.0e}); "
+                      f"the objective is an upper bound")
+    return StochasticResult(method, best_plan, best, time.perf_counter() - start, iterations, rel, converged)
+
+
+# Extensive form against Benders as the number of scenarios grows
+
+
+def compare(counts=(5, 20, 50, 100), seed=0, premium=1.5, workers=None):
+    fleet = BatteryFleet(['Battery0', 'Battery1'], [60, 80], [0.95, 0.9])
+    demand, price = data.total_demand.to_numpy(), data.avg_price.price.to_numpy()
+    env = gp.Env(empty=True)
+    env.setParam('OutputFlag', 0)
+    env.start()
+    rows = []
+    for n in counts:
+        scenarios = sample_scenarios(n, fleet, seed)
+        for method in ('extensive', 'benders', 'single'):
+            try:
+                if method == 'extensive':
+                    result = solve_extensive(fleet, scenarios, demand, price, premium, env)
+                else:
+                    result = solve_benders(fleet, scenarios, demand, price, premium, method == 'benders',
+                                           workers=workers, env=env)
+            except gp.GurobiError as e:
+                print(f"{n} scenarios, {method}: {e}")
+                continue
+            print(f"{n} scenarios, {result}")
+            rows.append([n, result.method, result.objective, result.runtime,
+                         None if result.iterations is None else len(result.iterations), result.gap, result.converged])
+    env.dispose()
+    return pd.DataFrame(rows, columns=['Scenarios', 'Method', 'Objective', 'Runtime', 'Iterations', 'Gap',
+                                       'Converged']).astype({'Iterations': 'Int64'})
+
+
+if __name__ == '__main__':
+    counts = [int(n) for n in sys.argv[1:]] or [5, 20, 50, 100]
+    print(compare(counts).to_string(index=False))
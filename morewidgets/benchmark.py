@@ -0,0 +1,172 @@
+from gurobipy import GRB
+import argparse
+import gurobipy as gp
+import multiprocessing
+import os
+import pandas as pd
+import resource
+import time
+
+from morewidgets.facility import build_facility, random_network
+
+
+# Formulation benchmark for the disjunctive constraints of the facility model.
+#
+# "Ship nothing or at least C" on every lane is written three ways (see `facility`): big-M
+# binaries (min_ship1/2), indicator constraints (zis1/zis0) and semi-continuous shipments.
+# "Maximize the smallest shipment" is written two ways: r == min(x) as a general constraint
+# (addGenConstrMin, as in problem.py) and linearly, r <= x[l] for every lane (the commented-out
+# version in problem.py; enough, as r is maximized).
+#
+# Every variant is solved on generated networks of increasing size (see
+# `facility.random_network`; lanes per customer from the nearest plants), for every instance
+# seed and `repeats` times with Gurobi's Seed parameter set to the repeat, each in a fresh
+# worker process. The results table records the build time, the model size, the root bound (the
+# bound when the first node is explored, or the final bound if the model is solved at the root),
+# the runtime, nodes, work units, final objective, bound and gap, and the Gurobi version, so
+# results from before and after an upgrade can be set side by side (`compare_runs`).
+
+results_cols = [
+    'Plants', 'Customers', 'Lanes', 'Seed', 'Variant', 'Repeat', 'Gurobi', 'Status', 'Build Time', 'Variables',
+    'Constraints', 'General Constraints', 'Root Bound', 'Runtime', 'Nodes', 'Work', 'Objective', 'Bound', 'Gap',
+    'Peak RSS (MB)', 'Error'
+]
+case_cols = ['Plants', 'Customers', 'Seed', 'Variant', 'Repeat']
+min_ship_variants = ('bigm', 'indicator', 'semicont')
+max_min_variants = ('maxmin_genconstr', 'maxmin_linear')
+variants = min_ship_variants + max_min_variants
+
+default_grid = [(5, 20), (10, 50), (20, 100), (50, 500)]
+
+
+def build_variant(variant, cost, max_prod, demand, min_ship=30, open_plants=False, env=None):
+    if variant in min_ship_variants:
+        fm = build_facility(cost, max_prod, demand, min_ship=min_ship, formulation=variant, open_plants=open_plants,
+                            env=env)
+        return fm.m
+    fm = build_facility(cost, max_prod, demand, open_plants=open_plants, env=env)
+    m = fm.m
+    r = m.addVar(vtype=GRB.INTEGER, name='r')
+    if variant == 'maxmin_genconstr':
+        m.addGenConstrMin(r, fm.x.tolist(), name='min_constr')
+    elif variant == 'maxmin_linear':
+        m.addConstr(fm.x >= r, name='min_constr')
+    else:
+        raise ValueError(f"Unknown variant {variant!r}")
+    m.setObjective(r, GRB.MAXIMIZE)
+    return m
+
+
+def run_case(plants, customers, seed, variant, repeat, lanes=10, min_ship=30, open_plants=False, time_limit=60,
+             threads=1):
+    row = dict(zip(case_cols, (plants, customers, seed, variant, repeat)))
+    row['Gurobi'] = '.'.join(map(str, gp.gurobi.version()))
+    try:
+        cost, max_prod, demand = random_network(plants, customers, lanes, seed=seed)
+        env = gp.Env(empty=True)
+        env.setParam('OutputFlag', 0)
+        env.setParam('Threads', threads)
+        env.setParam('TimeLimit', time_limit)
+        env.setParam('Seed', repeat)
+        env.start()
+        try:
+            start = time.perf_counter()
+            m = build_variant(variant, cost, max_prod, demand, min_ship, open_plants, env)
+            m.update()
+            row.update({'Lanes': len(cost), 'Build Time': time.perf_counter() - start, 'Variables': m.NumVars,
+                        'Constraints': m.NumConstrs, 'General Constraints': m.NumGenConstrs})
+
+            root = []
+
+            def callback(model, where):
+                if where == GRB.Callback.MIP and model.cbGet(GRB.Callback.MIP_NODCNT) == 0:
+                    root[:] = [model.cbGet(GRB.Callback.MIP_OBJBND)]
+
+            m.optimize(callback)
+            solved = m.SolCount > 0
+            row.update({'Status': 'optimal' if m.Status == GRB.OPTIMAL else f"status {m.Status}",
+                        'Root Bound': root[0] if root and m.NodeCount > 0 else m.ObjBound,
+                        'Runtime': m.Runtime, 'Nodes': m.NodeCount, 'Work': m.Work,
+                        'Objective': m.ObjVal if solved else None, 'Bound': m.ObjBound,
+                        'Gap': m.MIPGap if solved else None})
+            m.dispose()
+        finally:
+            env.dispose()
+    except Exception as e:
+        row.update({'Status': 'failed', 'Error': repr(e)})
+    row['Peak RSS (MB)'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return row
+
+
+def run_benchmark(grid=None, seeds=(0,), repeats=3, variants=variants, lanes=10, min_ship=30, open_plants=False,
+                  time_limit=60, threads=1, output='formulation_results.csv'):
+    cases = [(p, d, seed, variant, repeat) for p, d in (grid or default_grid) for seed in seeds
+             for variant in variants for repeat in range(repeats)]
+    rows = []
+    for case in cases:
+        with multiprocessing.Pool(1) as pool:
+            rows.append(pool.apply(run_case, case + (lanes, min_ship, open_plants, time_limit, threads)))
+        row = rows[-1]
+        print(f"{row['Plants']} plants, {row['Customers']} customers, seed {row['Seed']}, {row['Variant']} "
+              f"#{row['Repeat']}: {row['Status']}, {row.get('Runtime') or 0:.3f}s")
+    results = pd.DataFrame.from_records(rows, columns=results_cols)
+    results.to_csv(output, index=False)
+    return results
+
+
+def report(results):
+    # Per size and variant, over seeds and repeats: medians, and the fastest variant of each problem
+    solved = results[results.Status != 'failed']
+    summary = solved.groupby(['Plants', 'Customers', 'Variant']).agg(
+        Runs=('Runtime', 'size'), Build=('Build Time', 'median'), Runtime=('Runtime', 'median'),
+        Slowest=('Runtime', 'max'), Nodes=('Nodes', 'median'), Work=('Work', 'median'),
+        RootBound=('Root Bound', 'median'), Objective=('Objective', 'median'), Gap=('Gap', 'max'))
+    summary = summary.reset_index()
+    summary['Problem'] = summary.Variant.map(lambda v: 'max-min' if v in max_min_variants else 'min ship')
+    fastest = summary.loc[summary.groupby(['Plants', 'Customers', 'Problem']).Runtime.idxmin()]
+    failed = results[results.Status == 'failed'].groupby(['Plants', 'Customers', 'Variant']).size()
+    print(summary.to_string(index=False))
+    print('Fastest variant:')
+    print(fastest[['Plants', 'Customers', 'Problem', 'Variant', 'Runtime']].to_string(index=False))
+    if len(failed):
+        print('Failed runs:')
+        print(failed.to_string())
+    return summary
+
+
+def compare_runs(results, previous):
+    # Median runtime and work per size and variant, before (previous results file) and now
+    before = pd.read_csv(previous) if isinstance(previous, str) else previous
+    key = ['Plants', 'Customers', 'Variant']
+    medians = [r[r.Status != 'failed'].groupby(key).agg(Gurobi=('Gurobi', 'first'), Runtime=('Runtime', 'median'),
+                                                        Work=('Work', 'median'))
+               for r in (before, results)]
+    both = medians[0].join(medians[1], lsuffix=' (before)', rsuffix=' (now)', how='outer')
+    both['Runtime Ratio'] = both['Runtime (now)'] / both['Runtime (before)']
+    both['Work Ratio'] = both['Work (now)'] / both['Work (before)']
+    print(both.reset_index().to_string(index=False))
+    return both
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Formulation benchmark for the disjunctive constraints of the '
+                                                 'facility model')
+    parser.add_argument('--sizes', nargs='+', default=None,
+                        help='grid of PLANTSxCUSTOMERS sizes, e.g. 10x50 20x100 (default: 5x20 10x50 20x100 50x500)')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0], help='instance seeds')
+    parser.add_argument('--repeats', type=int, default=3, help='solves per instance and variant (Gurobi Seed)')
+    parser.add_argument('--variants', nargs='+', default=list(variants), choices=variants, help='variants to solve')
+    parser.add_argument('--lanes', type=int, default=10, help='lanes per customer')
+    parser.add_argument('--min-ship', type=float, default=30, help='minimum shipment on a used lane')
+    parser.add_argument('--open-plants', action='store_true', help='with plant opening binaries')
+    parser.add_argument('--time-limit', type=float, default=60, help='Gurobi time limit per run (s)')
+    parser.add_argument('--threads', type=int, default=1, help='Gurobi threads per run')
+    parser.add_argument('--output', default='formulation_results.csv', help='results file')
+    parser.add_argument('--previous', default=None, help='results of an earlier run (e.g. another Gurobi version)')
+    args = parser.parse_args()
+    grid = [tuple(int(v) for v in size.split('x')) for size in args.sizes] if args.sizes else None
+    results = run_benchmark(grid, args.seeds, args.repeats, args.variants, args.lanes, args.min_ship,
+                            args.open_plants, args.time_limit, args.threads, args.output)
+    report(results)
+    if args.previous and os.path.exists(args.previous):
+        compare_runs(results, args.previous)
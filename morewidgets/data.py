@@ -0,0 +1,29 @@
+import cache
+
+
+# Transportation costs between the production and distribution facilities, read the first time
+# they are used (`data.transp_cost`, `from morewidgets.data import production`, ...), not when
+# the module is imported, and through the data cache (see `cache`), so the
+# file is downloaded and parsed once and afterwards loaded from disk, also in offline mode.
+
+path = 'https://raw.githubusercontent.com/Gurobi/modeling-examples/master/optimization101/Modeling_Session_1/'
+_data = {}
+
+
+def load():
+    if not _data:
+        transp_cost = cache.read_csv(path + 'cost.csv')
+        _data['production'] = list(transp_cost['production'].unique())
+        _data['distribution'] = list(transp_cost['distribution'].unique())
+        _data['transp_cost'] = transp_cost.set_index(['production', 'distribution']).squeeze()
+    return _data
+
+
+def __getattr__(name):
+    if name in ('transp_cost', 'production', 'distribution'):
+        return load()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == '__main__':
+    print(load()['transp_cost'])
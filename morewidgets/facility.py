@@ -0,0 +1,189 @@
+from gurobipy import GRB
+import gurobipy as gp
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import sys
+import time
+
+
+# Production/distribution model, for any number of plants and customers.
+#
+# The lanes are the (production, distribution) pairs of the cost data -- a Series indexed by
+# (production, distribution), as `data.transp_cost`, or a DataFrame with production,
+# distribution and cost columns, as cost.csv -- and only those: a network where every plant
+# serves a few customers has only those lanes, not the full cross product. x[l] is the number of
+# widgets shipped on lane l, a one-dimensional MVar in the order of the cost data.
+#
+#   sum_{l from p} x[l] <= max_prod[p]                 (can_produce)
+#   sum_{l from p} x[l] >= frac * max_prod[p]          (must_produce, with frac)
+#   sum_{l to d} x[l] >= demand[d]                     (meet_demand)
+#   x[l] <= max_prod[p] * y[p]                         (link_between_x_and_y, with open_plants)
+#   x[l] == 0 or x[l] >= min_ship                      (with min_ship, see below)
+#
+# Every family is added with one sparse incidence matrix (plants x lanes, customers x lanes,
+# lanes x plants), as in `moresun.dispatch`, not by a quicksum per plant or customer, and the
+# costs are one vector: building is linear in the number of lanes.
+#
+# Minimum shipments, in one of three formulations (see problem.py and notes.md):
+#   'bigm':       a binary z[l] (1 if nothing is shipped), x[l] <= max_prod[p] * (1 - z[l]) and
+#                 x[l] + min_ship * z[l] >= min_ship (min_ship1/2)
+#   'indicator':  the same binary with z[l] == 1 -> x[l] >= min_ship and z[l] == 0 -> x[l] <= 0
+#                 (zis1/zis0, added lane by lane; z[l] is 1 if something is shipped, as in problem.py)
+#   'semicont':   x[l] semi-continuous, 0 or between min_ship and its upper bound (no binaries)
+
+formulations = ('bigm', 'indicator', 'semicont')
+
+
+class FacilityModel:
+    def __init__(self, m, lanes, plants, customers, lane_plant, capacity, x, constrs, total_cost):
+        self.m = m
+        self.lanes = lanes              # MultiIndex (production, distribution), in the order of x
+        self.plants = plants
+        self.customers = customers
+        self.lane_plant = lane_plant    # position of each lane's plant
+        self.capacity = capacity        # max production per plant
+        self.x = x
+        self.z = None                   # minimum shipment binaries (None without)
+        self.y = None                   # open plants (None without)
+        self.constrs = constrs          # constraint family name -> MConstr, or a list of GenConstr
+        self.total_cost = total_cost
+
+    def __str__(self):
+        return (f"Facility model: {len(self.plants)} plants, {len(self.customers)} customers, {len(self.lanes)} lanes\n"
+                f"  Variables: {self.m.NumVars}\n  Constraints: {self.m.NumConstrs + self.m.NumGenConstrs}")
+
+    @property
+    def lane_capacity(self):
+        return self.capacity[self.lane_plant]
+
+    def lanes_from(self):
+        # Plants x lanes incidence
+        L = len(self.lanes)
+        return sp.csr_matrix((np.ones(L), (self.lane_plant, np.arange(L))), shape=(len(self.plants), L))
+
+    def shipments(self):
+        return pd.Series(self.x.X, index=self.lanes, name='shipment')
+
+
+def _lanes(cost):
+    # (lanes, cost per lane) from a Series or a DataFrame of costs; lanes without a cost are dropped
+    if isinstance(cost, pd.DataFrame):
+        cost = cost.set_index(['production', 'distribution'])['cost']
+    cost = cost.dropna()
+    return cost.index, cost.to_numpy(dtype=float)
+
+
+def build_facility(cost, max_prod, demand, frac=None, min_ship=None, formulation='bigm', open_plants=False,
+                   env=None, name='more_widgets'):
+    lanes, c = _lanes(cost)
+    plants, customers = pd.Index(max_prod.index), pd.Index(demand.index)
+    p, d = plants.get_indexer(lanes.get_level_values(0)), customers.get_indexer(lanes.get_level_values(1))
+    if (p < 0).any() or (d < 0).any():
+        raise ValueError("Cost data has lanes from or to unknown facilities")
+    L, D = len(lanes), len(customers)
+    cap = max_prod.to_numpy(dtype=float)
+
+    m = gp.Model(name, env=env)
+
+    # Decision variables
+    x = m.addMVar(L, name='prod_ship')
+
+    # Lanes to each customer
+    lanes_to = sp.csr_matrix((np.ones(L), (d, np.arange(L))), shape=(D, L))
+
+    fm = FacilityModel(m, lanes, plants, customers, p, cap, x, {}, c @ x)
+    fm.constrs['can_produce'] = m.addConstr(fm.lanes_from() @ x <= cap, name='can_produce')
+    if frac is not None:
+        add_must_produce(fm, frac)
+    fm.constrs['meet_demand'] = m.addConstr(lanes_to @ x >= demand.to_numpy(dtype=float), name='meet_demand')
+    if min_ship is not None:
+        add_min_ship(fm, min_ship, formulation)
+    if open_plants:
+        add_open_plants(fm)
+
+    m.setObjective(fm.total_cost, GRB.MINIMIZE)
+    return fm
+
+
+# Constraint families that can also be added to a built model (see `session`); each returns
+# what it added to the model
+
+
+def add_must_produce(fm, frac):
+    fm.constrs['must_produce'] = fm.m.addConstr(fm.lanes_from() @ fm.x >= frac * fm.capacity, name='must_produce')
+    return {'must_produce': fm.constrs['must_produce']}
+
+
+def add_min_ship(fm, min_ship, formulation='bigm'):
+    m, x, L = fm.m, fm.x, len(fm.lanes)
+    lane_cap = fm.lane_capacity
+    if formulation == 'bigm':
+        fm.z = m.addMVar(L, vtype=GRB.BINARY, name='min_distribution')
+        fm.constrs['min_ship1'] = m.addConstr(x + sp.diags(lane_cap) @ fm.z <= lane_cap, name='min_ship1')
+        fm.constrs['min_ship2'] = m.addConstr(x + min_ship * fm.z >= min_ship, name='min_ship2')
+        return {'min_distribution': fm.z, 'min_ship1': fm.constrs['min_ship1'], 'min_ship2': fm.constrs['min_ship2']}
+    if formulation == 'indicator':
+        fm.z = m.addMVar(L, vtype=GRB.BINARY, name='min_distribution')
+        # one indicator per lane (the matrix form of addGenConstrIndicator needs gurobipy 11)
+        z, xs = fm.z.tolist(), x.tolist()
+        fm.constrs['zis1'] = [m.addGenConstrIndicator(z[l], True, xs[l], GRB.GREATER_EQUAL, min_ship, name=f"zis1[{l}]")
+                              for l in range(L)]
+        fm.constrs['zis0'] = [m.addGenConstrIndicator(z[l], False, xs[l], GRB.LESS_EQUAL, 0, name=f"zis0[{l}]")
+                              for l in range(L)]
+        return {'min_distribution': fm.z, 'zis1': fm.constrs['zis1'], 'zis0': fm.constrs['zis0']}
+    if formulation == 'semicont':
+        # nothing is added: the shipments become semi-continuous
+        x.VType = GRB.SEMICONT
+        x.LB = min_ship
+        x.UB = lane_cap
+        return {}
+    raise ValueError(f"Unknown minimum shipment formulation {formulation!r}")
+
+
+def add_open_plants(fm):
+    m, L, P = fm.m, len(fm.lanes), len(fm.plants)
+    fm.y = m.addMVar(P, vtype=GRB.BINARY, name='prod_on')
+    link = sp.csr_matrix((fm.lane_capacity, (np.arange(L), fm.lane_plant)), shape=(L, P))
+    fm.constrs['link_between_x_and_y'] = m.addConstr(fm.x - link @ fm.y <= 0, name='link_between_x_and_y')
+    return {'prod_on': fm.y, 'link_between_x_and_y': fm.constrs['link_between_x_and_y']}
+
+
+# A random network: `lanes` lanes per customer, from the closest plants (points in the unit
+# square, cost proportional to the distance), and capacity for `slack` times the demand
+
+
+def random_network(plants, customers, lanes=10, slack=1.3, seed=0):
+    rng = np.random.default_rng(seed)
+    plant_xy, customer_xy = rng.uniform(size=(plants, 2)), rng.uniform(size=(customers, 2))
+    distance = np.linalg.norm(customer_xy[:, None, :] - plant_xy[None, :, :], axis=2)
+    nearest = np.argsort(distance, axis=1)[:, :min(lanes, plants)]
+    customer = np.repeat(np.arange(customers), nearest.shape[1])
+    plant = nearest.ravel()
+    plant_names = pd.Index([f"P{i}" for i in range(plants)], name='production')
+    customer_names = pd.Index([f"D{j}" for j in range(customers)], name='distribution')
+    cost = pd.Series(np.round(10 * distance[customer, plant], 2), name='cost',
+                     index=pd.MultiIndex.from_arrays([plant_names[plant], customer_names[customer]]))
+    demand = pd.Series(rng.integers(50, 200, customers).astype(float), index=customer_names, name='demand')
+    share = rng.uniform(0.5, 1.5, plants)
+    max_prod = pd.Series(np.ceil(slack * demand.sum() * share / share.sum()), index=plant_names, name='max_prod')
+    return cost.sort_index(), max_prod, demand
+
+
+def build_time(plants, customers, lanes=10, formulation='bigm', seed=0):
+    cost, max_prod, demand = random_network(plants, customers, lanes, seed=seed)
+    start = time.perf_counter()
+    fm = build_facility(cost, max_prod, demand, min_ship=30, formulation=formulation, open_plants=True)
+    fm.m.update()
+    elapsed = time.perf_counter() - start
+    print(f"{plants} plants, {customers} customers, {len(fm.lanes)} lanes, {formulation}: {fm.m.NumVars} variables, "
+          f"{fm.m.NumConstrs} constraints, {fm.m.NumGenConstrs} general constraints, built in {elapsed:.3f}s")
+    fm.m.dispose()
+    return elapsed
+
+
+if __name__ == '__main__':
+    sizes = [tuple(int(v) for v in size.split('x')) for size in sys.argv[1:]] or [(5, 6), (500, 5000)]
+    for plants, customers in sizes:
+        for formulation in formulations:
+            build_time(plants, customers, formulation=formulation)
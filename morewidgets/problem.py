@@ -2,46 +2,56 @@ from gurobipy import GRB
 import gurobipy as gp
 import pandas as pd
 
+from morewidgets import data
+from telemetry import SolveTrace, traced
+
+# Every solve is traced (see `telemetry`) and its trace written to
+# `trace_dir`; reading the data and building the first model are timed as part of the first one.
+trace_dir = 'traces'
+first = SolveTrace('morewidgets_original')
 
 P = {'Baltimore', 'Cleveland', 'Little Rock', 'Birmingham', 'Charleston'}
 D = {'Columbia', 'Indianapolis', 'Lexington', 'Nashville', 'Richmond', 'St. Louis'}
 
-path = 'https://raw.githubusercontent.com/Gurobi/modeling-examples/master/optimization101/Modeling_Session_1/'
-transp_cost = pd.read_csv(path + 'cost.csv')
-production = list(transp_cost['production'].unique())
-distribution = list(transp_cost['distribution'].unique())
-transp_cost = transp_cost.set_index(['production', 'distribution']).squeeze()
+# transportation costs (see `data`)
+with first.stage('load'):
+    transp_cost = data.transp_cost
+    production = data.production
+    distribution = data.distribution
 max_prod = pd.Series([180, 200, 140, 80, 180], index=production, name='max_prod')
 n_demand = pd.Series([89, 95, 121, 101, 116, 181], index=distribution, name='demand')
 # min production is a fraction of the max
 frac = 0.75
 
 
-m = gp.Model('more_widgets')
-
-x = m.addVars(production, distribution, name='prod_ship')
-
-can_produce = m.addConstrs(
-    (gp.quicksum(x[p, d] for d in distribution) <= max_prod[p]
-     for p in production),
-    name='can_produce'
-)
-must_produce = m.addConstrs(
-    (gp.quicksum(x[p, d] for d in distribution) >= frac * max_prod[p]
-     for p in production),
-    name='must_produce'
-)
-meet_demand = m.addConstrs(
-    (x.sum('*', d) >= n_demand[d] for d in distribution),
-    name='meet_demand'
-)
-
-m.setObjective(
-    gp.quicksum(
-        transp_cost[p, d] * x[p, d] for p in production for d in distribution),
-    GRB.MINIMIZE
-)
-m.optimize()
+with first.stage('build'):
+    m = gp.Model('more_widgets')
+
+    x = m.addVars(production, distribution, name='prod_ship')
+
+    can_produce = m.addConstrs(
+        (gp.quicksum(x[p, d] for d in distribution) <= max_prod[p]
+         for p in production),
+        name='can_produce'
+    )
+    must_produce = m.addConstrs(
+        (gp.quicksum(x[p, d] for d in distribution) >= frac * max_prod[p]
+         for p in production),
+        name='must_produce'
+    )
+    meet_demand = m.addConstrs(
+        (x.sum('*', d) >= n_demand[d] for d in distribution),
+        name='meet_demand'
+    )
+
+    m.setObjective(
+        gp.quicksum(
+            transp_cost[p, d] * x[p, d] for p in production for d in distribution),
+        GRB.MINIMIZE
+    )
+first.optimize(m)
+print(first)
+first.save(trace_dir)
 
 x_values = pd.Series(m.getAttr('X', x), name='shipment', index=transp_cost.index)
 soln = pd.concat([transp_cost, x_values], axis=1)
@@ -78,7 +88,9 @@ min_ship2 = m.addConstrs(
      for d in distribution),
     name='min_ship2'
 )
-m.optimize()
+with traced('morewidgets_min_ship', trace_dir) as trace:
+    trace.optimize(m)
+x_values = pd.Series(m.getAttr('X', x), name='shipment', index=transp_cost.index)
 soln2 = pd.concat([transp_cost, x_values], axis=1)
 obj2 = m.getObjective()
 obj2_value = obj2.getValue()
@@ -99,7 +111,9 @@ zis0 = m.addConstrs(
      for d in distribution),
     name='zis0'
 )
-m.optimize()
+with traced('morewidgets_indicator', trace_dir) as trace:
+    trace.optimize(m)
+x_values = pd.Series(m.getAttr('X', x), name='shipment', index=transp_cost.index)
 soln3 = pd.concat([transp_cost, x_values], axis=1)
 obj3 = m.getObjective()
 obj3_value = obj3.getValue()
@@ -135,7 +149,8 @@ m.setObjective(
     GRB.MINIMIZE
 )
 
-m.optimize()
+with traced('morewidgets_semicont', trace_dir) as trace:
+    trace.optimize(m)
 
 x_values = pd.Series(m.getAttr('X', x), name='shipment', index=transp_cost.index)
 soln4 = pd.concat([transp_cost, x_values], axis=1)
@@ -145,6 +160,7 @@ print(f"The next model had a total cost of {round(obj4_value, 2)}")
 
 
 # Constraining production facilities:
+# (`session.WhatIfSession` runs these what-ifs on one model, with warm starts and a comparison table)
 max_prod2 = pd.Series([210, 225, 140, 130, 220], index=production, name='max_production')
 
 m2 = gp.Model('more_widgets2')
@@ -165,7 +181,8 @@ meet_demand = m2.addConstrs(
 )
 m2.setObjective(total_cost, GRB.MINIMIZE)
 
-m2.optimize()
+with traced('morewidgets_capacity', trace_dir) as trace:
+    trace.optimize(m2)
 x_values = pd.Series(m2.getAttr('X', x), name='shipment', index=transp_cost.index)
 soln5 = pd.concat([transp_cost, x_values], axis=1)
 obj5 = m2.getObjective()
@@ -181,7 +198,8 @@ m2.addConstrs(
 )
 m2.update()
 
-m2.optimize()
+with traced('morewidgets_open', trace_dir) as trace:
+    trace.optimize(m2)
 x_values = pd.Series(m2.getAttr('X', x), name='shipment', index=transp_cost.index)
 soln6 = pd.concat([transp_cost, x_values], axis=1)
 obj6 = m2.getObjective()
@@ -195,7 +213,8 @@ reg_cond = m2.addConstr(
     (y['Charleston'] == 1) >> (y['Cleveland'] + y['Baltimore'] == 0),
     name='regional_production_constraint'
 )
-m2.optimize()
+with traced('morewidgets_regional', trace_dir) as trace:
+    trace.optimize(m2)
 x_values = pd.Series(m2.getAttr('X', x), name='shipment', index=transp_cost.index)
 soln7 = pd.concat([transp_cost, x_values], axis=1)
 obj7 = m2.getObjective()
@@ -205,14 +224,16 @@ print(f"The next model had a total cost of {round(obj7_value, 2)}")
 
 m2.remove(reg_cond)
 m2.setObjective(y.sum(), GRB.MINIMIZE)
-m2.optimize()
+with traced('morewidgets_fewest_open', trace_dir) as trace:
+    trace.optimize(m2)
 
 only_four = m2.addConstr(
     y.sum() == 4,
     name='only_four'
 )
 m2.setObjective(total_cost, GRB.MINIMIZE)
-m2.optimize()
+with traced('morewidgets_only_four', trace_dir) as trace:
+    trace.optimize(m2)
 
 
 m2.remove(only_four)
@@ -229,4 +250,5 @@ min_constr = m2.addGenConstrMin(
 )
 # min_constrs = m2.addConstrs(r <= x[p, d] for p in production for d in distribution, name='min_constr')
 m2.setObjective(r, GRB.MAXIMIZE)
-m2.optimize()
+with traced('morewidgets_max_min', trace_dir) as trace:
+    trace.optimize(m2)
@@ -0,0 +1,247 @@
+from gurobipy import GRB
+import gurobipy as gp
+import pandas as pd
+import time
+
+from morewidgets import data
+from morewidgets.facility import add_min_ship, add_must_produce, add_open_plants, build_facility
+
+
+# What-if session for the facility model.
+#
+# The session holds one model (see `facility.build_facility`) and applies named deltas to it in
+# place: constraint groups are added and removed (`add`, `remove`; a group is a function that
+# adds variables and constraints to the model and returns them, e.g. the minimum shipment rule
+# in one of its formulations), the objective is swapped (`set_objective`, from a table of named
+# objectives) and the plants' capacities change (`set_capacity`: right-hand sides, and the
+# groups whose coefficients depend on them are rebuilt). Every delta is logged with its undo, so
+# `revert(label)` goes back to the state of `checkpoint(label)` without rebuilding the model.
+#
+# `solve(variant)` re-optimizes from the previous solve: the previous incumbent as Start of the
+# variables that are still there when the model is a MIP, the previous basis (VBasis/CBasis,
+# new variables at their bound and new constraints basic) when it is an LP. Each variant's
+# result -- objective, bound, status, runtime, nodes, active groups and the shipments -- is
+# kept for the comparison table.
+
+result_cols = ['Variant', 'Objective', 'Groups', 'Status', 'Value', 'Bound', 'Runtime', 'Nodes', 'Iterations',
+               'Warm Start', 'Open Plants']
+_shipment_attrs = ('VType', 'LB', 'UB')
+
+
+class WhatIfSession:
+    def __init__(self, fm, groups, objectives=None, params=None):
+        self.fm = fm
+        self.m = fm.m
+        self.groups = dict(groups)          # name -> build(fm), returning {name: what was added}
+        self.objectives = {'cost': lambda s: (s.fm.total_cost, GRB.MINIMIZE), **(objectives or {})}
+        self.active = {}                    # group -> (what was added, shipment attributes before)
+        self.objective = 'cost'
+        self.log = []                       # deltas as (kind, undo argument)
+        self.checkpoints = {}
+        self.results = []
+        self.shipments = {}                 # variant -> shipments
+        self.last = None                    # previous solve: variables, values and basis
+        for name, value in (params or {}).items():
+            self.m.setParam(name, value)
+
+    def __str__(self):
+        return (f"What-if session: groups {', '.join(self.active) or 'none'}, objective {self.objective}, "
+                f"{len(self.results)} variants solved")
+
+    # Deltas
+
+    def add(self, name, _log=True):
+        if name in self.active:
+            raise ValueError(f"Group {name} is already in the model")
+        self.m.update()
+        before = {a: self.fm.x.getAttr(a) for a in _shipment_attrs}
+        self.active[name] = (self.groups[name](self.fm), before)
+        if _log:
+            self.log.append(('add', name))
+
+    def remove(self, name, _log=True):
+        added, before = self.active.pop(name)
+        fm = self.fm
+        self.m.update()
+        # constraints first: removing a variable also removes the general constraints on it
+        for obj in sorted(added.values(), key=lambda obj: isinstance(obj, (gp.Var, gp.MVar))):
+            self.m.remove(obj)
+        fm.constrs = {k: c for k, c in fm.constrs.items() if all(c is not obj for obj in added.values())}
+        if any(fm.z is obj for obj in added.values()):
+            fm.z = None
+        if any(fm.y is obj for obj in added.values()):
+            fm.y = None
+        self.m.update()
+        for attr, values in before.items():
+            if (fm.x.getAttr(attr) != values).any():
+                fm.x.setAttr(attr, values)
+        if _log:
+            self.log.append(('remove', name))
+
+    def set_objective(self, name, _log=True):
+        expr, sense = self.objectives[name](self)
+        self.m.setObjective(expr, sense)
+        if _log:
+            self.log.append(('objective', self.objective))
+        self.objective = name
+
+    def set_capacity(self, max_prod, _log=True):
+        old = self.fm.capacity
+        self.fm.capacity = pd.Series(max_prod).reindex(self.fm.plants).to_numpy(dtype=float)
+        self.fm.constrs['can_produce'].RHS = self.fm.capacity
+        # groups built with the old capacities (big-Ms, production minimums), in their order
+        names = list(self.active)
+        for name in reversed(names):
+            self.remove(name, _log=False)
+        for name in names:
+            self.add(name, _log=False)
+        self.set_objective(self.objective, _log=False)
+        if _log:
+            self.log.append(('capacity', pd.Series(old, index=self.fm.plants)))
+
+    def checkpoint(self, label):
+        self.checkpoints[label] = len(self.log)
+
+    def revert(self, label):
+        position = self.checkpoints[label]
+        while len(self.log) > position:
+            kind, arg = self.log.pop()
+            if kind == 'add':
+                self.remove(arg, _log=False)
+            elif kind == 'remove':
+                self.add(arg, _log=False)
+            elif kind == 'objective':
+                self.set_objective(arg, _log=False)
+            else:
+                self.set_capacity(arg, _log=False)
+        # the groups of a reverted objective may have been rebuilt since
+        self.set_objective(self.objective, _log=False)
+
+    # Solving
+
+    def warm_start(self):
+        m, last = self.m, self.last
+        m.update()
+        if last is None:
+            return None
+        keep = [i for i, v in enumerate(last['vars']) if v.index >= 0]
+        if m.IsMIP:
+            m.setAttr(GRB.Attr.Start, [last['vars'][i] for i in keep], [last['X'][i] for i in keep])
+            return 'start'
+        if last['VBasis'] is None:
+            return None
+        vbasis = {last['vars'][i]: last['VBasis'][i] for i in keep}
+        cbasis = {c: b for c, b in zip(last['constrs'], last['CBasis']) if c.index >= 0}
+        variables, constrs = m.getVars(), m.getConstrs()
+        m.setAttr(GRB.Attr.VBasis, variables, [vbasis.get(v, -1) for v in variables])
+        m.setAttr(GRB.Attr.CBasis, constrs, [cbasis.get(c, 0) for c in constrs])
+        return 'basis'
+
+    def solve(self, variant):
+        m = self.m
+        start = time.perf_counter()
+        warm = self.warm_start()
+        m.optimize()
+        elapsed = time.perf_counter() - start
+        solved = m.SolCount > 0
+        row = {'Variant': variant, 'Objective': self.objective, 'Groups': ', '.join(self.active), 'Status': m.Status,
+               'Value': m.ObjVal if solved else None, 'Bound': m.ObjBound if m.IsMIP else (m.ObjVal if solved else None),
+               'Runtime': elapsed, 'Nodes': m.NodeCount if m.IsMIP else 0, 'Iterations': m.IterCount,
+               'Warm Start': warm, 'Open Plants': int(round(self.fm.y.X.sum())) if solved and self.fm.y is not None else None}
+        self.results.append(row)
+        if solved:
+            self.shipments[variant] = self.fm.shipments()
+            variables = m.getVars()
+            basis = not m.IsMIP and m.Status == GRB.OPTIMAL
+            constrs = m.getConstrs() if basis else None
+            self.last = {'vars': variables, 'X': m.getAttr(GRB.Attr.X, variables),
+                         'VBasis': m.getAttr(GRB.Attr.VBasis, variables) if basis else None,
+                         'constrs': constrs, 'CBasis': m.getAttr(GRB.Attr.CBasis, constrs) if basis else None}
+        return row
+
+    def table(self):
+        return pd.DataFrame(self.results, columns=result_cols)
+
+    def shipment_table(self):
+        return pd.DataFrame(self.shipments)
+
+    def close(self):
+        self.m.dispose()
+
+
+# The what-ifs of problem.py: groups and objectives
+
+
+def add_regional(fm, plant='Charleston', excluded=('Cleveland', 'Baltimore')):
+    # If `plant` is open, none of `excluded` can be
+    y, at = fm.y, fm.plants.get_loc
+    constr = fm.m.addConstr((y[at(plant)].item() == 1) >> (gp.quicksum(y[at(p)].item() for p in excluded) == 0),
+                            name='regional_production_constraint')
+    return {'regional_production_constraint': constr}
+
+
+def add_max_min(fm):
+    # r: the smallest shipment
+    r = fm.m.addVar(vtype=GRB.INTEGER, name='r')
+    constr = fm.m.addGenConstrMin(r, fm.x.tolist(), name='min_constr')
+    return {'r': r, 'min_constr': constr}
+
+
+def widget_groups(frac=0.75, min_ship=30, fixed_open=4):
+    return {
+        'must_produce': lambda fm: add_must_produce(fm, frac),
+        'min_ship_bigm': lambda fm: add_min_ship(fm, min_ship, 'bigm'),
+        'min_ship_indicator': lambda fm: add_min_ship(fm, min_ship, 'indicator'),
+        'min_ship_semicont': lambda fm: add_min_ship(fm, min_ship, 'semicont'),
+        'open_plants': add_open_plants,
+        'regional': add_regional,
+        'only_four': lambda fm: {'only_four': fm.m.addConstr(fm.y.sum() == fixed_open, name='only_four')},
+        'max_min': add_max_min,
+    }
+
+
+widget_objectives = {
+    'fewest_open': lambda s: (s.fm.y.sum(), GRB.MINIMIZE),
+    'max_min': lambda s: (s.active['max_min'][0]['r'], GRB.MAXIMIZE),
+}
+
+
+if __name__ == '__main__':
+    production, distribution = data.production, data.distribution
+    max_prod = pd.Series([180, 200, 140, 80, 180], index=production, name='max_prod')
+    n_demand = pd.Series([89, 95, 121, 101, 116, 181], index=distribution, name='demand')
+    max_prod2 = pd.Series([210, 225, 140, 130, 220], index=production, name='max_production')
+
+    session = WhatIfSession(build_facility(data.transp_cost, max_prod, n_demand), widget_groups(),
+                            widget_objectives, params={'OutputFlag': 0})
+    session.add('must_produce')
+    session.solve('original')
+    session.checkpoint('original')
+    for formulation in ('bigm', 'indicator', 'semicont'):
+        session.add(f"min_ship_{formulation}")
+        session.solve(f"min_ship_{formulation}")
+        session.remove(f"min_ship_{formulation}")
+
+    session.remove('must_produce')
+    session.set_capacity(max_prod2)
+    session.solve('capacity')
+    session.add('open_plants')
+    session.solve('open_plants')
+    session.add('regional')
+    session.solve('regional')
+    session.remove('regional')
+    session.set_objective('fewest_open')
+    session.solve('fewest_open')
+    session.add('only_four')
+    session.set_objective('cost')
+    session.solve('only_four')
+    session.remove('only_four')
+    session.add('max_min')
+    session.set_objective('max_min')
+    session.solve('max_min')
+
+    session.revert('original')
+    session.solve('original (reverted)')
+    print(session.table().to_string(index=False))
+    print(session.shipment_table())
+    session.close()
@@ -0,0 +1,129 @@
+import argparse
+import contextlib
+import glob
+import gurobipy as gp
+import multiprocessing
+import multiprocessing.connection
+import os
+import pandas as pd
+import time
+
+from technician_assignment.routing import read_workbook, solve_trs0
+
+
+# Solve a directory of scenario workbooks (see `read_workbook`) in parallel.
+#
+# Every scenario is solved in its own worker process, with its own Gurobi environment and a
+# share of the cores (Threads), so that the workers together do not oversubscribe the machine;
+# at most `workers` of them run at once. A scenario's routes.csv, orders.csv and logs go to a
+# subdirectory of the output directory named after the workbook. A scenario that is infeasible,
+# fails, or is still running `timeout` seconds after its own start (its process is then
+# terminated) is recorded as such in the summary table, with the time it ran, and does not stop
+# the others. If the batch is interrupted (Ctrl-C), the running scenarios are terminated and
+# recorded as 'interrupted', and those that never started as 'not run'.
+
+summary_cols = [
+    'Scenario', 'Status', 'Objective', 'Jobs', 'Unfilled Jobs', 'Routes', 'Runtime', 'Error'
+]
+
+
+def _scenario_name(excel_file):
+    return os.path.splitext(os.path.basename(excel_file))[0]
+
+
+def solve_scenario(excel_file, output_dir, threads, time_limit=None):
+    scenario = _scenario_name(excel_file)
+    scenario_dir = os.path.join(output_dir, scenario)
+    os.makedirs(scenario_dir, exist_ok=True)
+    start = time.perf_counter()
+    try:
+        techs, _, custs, distances = read_workbook(excel_file)
+        env = gp.Env(empty=True)
+        env.setParam('LogToConsole', 0)
+        env.setParam('LogFile', os.path.join(scenario_dir, 'gurobi.log'))
+        env.setParam('Threads', threads)
+        if time_limit is not None:
+            env.setParam('TimeLimit', time_limit)
+        env.start()
+        try:
+            with open(os.path.join(scenario_dir, 'solve.log'), 'w') as log, contextlib.redirect_stdout(log):
+                sol = solve_trs0(techs, custs, distances, env=env, output_dir=scenario_dir)
+        finally:
+            env.dispose()
+    except Exception as e:
+        return [scenario, 'failed', None, None, None, None, time.perf_counter() - start, repr(e)]
+    if sol is None:
+        return [scenario, 'no solution', None, len(custs), None, None, time.perf_counter() - start, None]
+    unfilled = list(sol.assigned.values()).count(None)
+    routes = sum(1 for route in sol.routes.values() if route)
+    return [scenario, 'solved', sol.objective, len(custs), unfilled, routes, time.perf_counter() - start, None]
+
+
+def _run_scenario(connection, *args):
+    # (in the scenario's own process) the summary row, sent back to the batch
+    connection.send(solve_scenario(*args))
+    connection.close()
+
+
+def run_batch(directory, output_dir='batch_output', workers=None, time_limit=None, timeout=None):
+    files = sorted(glob.glob(os.path.join(directory, '*.xlsx')))
+    os.makedirs(output_dir, exist_ok=True)
+    workers = min(workers or os.cpu_count(), max(len(files), 1))
+    threads = max(os.cpu_count() // workers, 1)
+    print(f"Solving {len(files)} scenarios with {workers} workers, {threads} threads each")
+
+    pending = list(files)
+    running = {}        # workbook -> (process, connection, start)
+    rows = {}
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                excel_file = pending.pop(0)
+                receive, send = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(target=_run_scenario,
+                                                  args=(send, excel_file, output_dir, threads, time_limit))
+                process.start()
+                send.close()
+                running[excel_file] = (process, receive, time.perf_counter())
+            multiprocessing.connection.wait([r for _, r, _ in running.values()]
+                                            + [p.sentinel for p, _, _ in running.values()], timeout=0.1)
+            for excel_file, (process, receive, start) in list(running.items()):
+                elapsed = time.perf_counter() - start
+                if receive.poll():
+                    rows[excel_file] = receive.recv()
+                elif not process.is_alive():
+                    rows[excel_file] = [_scenario_name(excel_file), 'failed', None, None, None, None, elapsed,
+                                        f"worker exited with code {process.exitcode}"]
+                elif timeout is not None and elapsed > timeout:
+                    process.terminate()
+                    rows[excel_file] = [_scenario_name(excel_file), 'timeout', None, None, None, None, elapsed, None]
+                else:
+                    continue
+                process.join()
+                receive.close()
+                del running[excel_file]
+    except KeyboardInterrupt:
+        print('Interrupted: terminating the running scenarios')
+        for excel_file, (process, receive, start) in running.items():
+            process.terminate()
+            process.join()
+            rows[excel_file] = [_scenario_name(excel_file), 'interrupted', None, None, None, None,
+                                time.perf_counter() - start, None]
+        for excel_file in pending:
+            rows[excel_file] = [_scenario_name(excel_file), 'not run', None, None, None, None, None, None]
+
+    summary = pd.DataFrame.from_records([rows[f] for f in files], columns=summary_cols)
+    summary.to_csv(os.path.join(output_dir, 'summary.csv'), index=False)
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Solve a directory of technician routing scenarios')
+    parser.add_argument('directory', help='directory of scenario workbooks (*.xlsx)')
+    parser.add_argument('--output', default='batch_output', help='directory for the results')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--time-limit', type=float, default=None, help='Gurobi time limit per scenario (s)')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='wall-clock limit per scenario, from its own start (s)')
+    args = parser.parse_args()
+    print(run_batch(args.directory, args.output, args.workers, args.time_limit, args.timeout).to_string(index=False))
@@ -0,0 +1,136 @@
+from gurobipy import GRB
+import argparse
+import gurobipy as gp
+import multiprocessing
+import os
+import pandas as pd
+import resource
+import sys
+import time
+
+from technician_assignment.generator import generate_instance
+from technician_assignment.routing import build_trs0
+
+
+# Scaling benchmark for TRS0 on generated instances (see `generator.generate_instance`).
+#
+# Every case of the size grid (customers, technicians) x seeds is built and solved in a fresh
+# worker process, so that the peak memory of the process is that of the case alone and a case
+# that fails does not stop the others. For every case the results table records the build time,
+# the size of the model before and after presolve, the time to the first incumbent, the final
+# objective, bound and gap, the node count, Gurobi's work units and the peak memory (of the
+# process, and as reported by Gurobi). The harness only uses generated data, so it runs offline.
+#
+# The results can be compared with a stored baseline (benchmark_baseline.csv next to this file):
+# a case regresses if it takes more than `tolerance` times as long (and at least a second more)
+# to build, to find a first incumbent or to solve, or ends with a worse objective. Failed cases
+# (e.g. models too large for a size-limited licence) are not stored in the baseline; the stored
+# one only has the sizes that solved (10x3 and 20x5).
+
+results_cols = [
+    'Customers', 'Technicians', 'Depots', 'Seed', 'Status', 'Build Time', 'Variables', 'Constraints',
+    'Presolved Variables', 'Presolved Constraints', 'First Incumbent', 'Runtime', 'Objective', 'Bound', 'Gap',
+    'Nodes', 'Work', 'Peak RSS (MB)', 'Gurobi Memory (MB)', 'Error'
+]
+case_cols = ['Customers', 'Technicians', 'Depots', 'Seed']
+timed_cols = ['Build Time', 'First Incumbent', 'Runtime']
+
+default_grid = [(10, 3), (20, 5), (50, 10), (100, 20)]
+baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.csv')
+
+
+def run_case(n_customers, n_technicians, n_depots, seed, time_limit, threads=1):
+    row = dict(zip(case_cols, (n_customers, n_technicians, n_depots, seed)))
+    try:
+        techs, _, custs, dist = generate_instance(n_customers, n_technicians, n_depots, seed=seed)
+        env = gp.Env(empty=True)
+        env.setParam('OutputFlag', 0)
+        env.setParam('Threads', threads)
+        env.setParam('TimeLimit', time_limit)
+        env.start()
+        try:
+            start = time.perf_counter()
+            rm = build_trs0(techs, custs, dist, env=env)
+            rm.m.update()
+            row.update({'Build Time': time.perf_counter() - start,
+                        'Variables': rm.m.NumVars, 'Constraints': rm.m.NumConstrs})
+            presolved = rm.m.presolve()
+            row.update({'Presolved Variables': presolved.NumVars, 'Presolved Constraints': presolved.NumConstrs})
+            presolved.dispose()
+
+            first = []
+
+            def callback(model, where):
+                if where == GRB.Callback.MIPSOL and not first:
+                    first.append(model.cbGet(GRB.Callback.RUNTIME))
+
+            rm.m.optimize(callback)
+            m = rm.m
+            row.update({'Status': 'optimal' if m.Status == GRB.OPTIMAL else f"status {m.Status}",
+                        'First Incumbent': first[0] if first else None, 'Runtime': m.Runtime,
+                        'Objective': m.ObjVal if m.SolCount else None, 'Bound': m.ObjBound,
+                        'Gap': m.MIPGap if m.SolCount else None, 'Nodes': m.NodeCount, 'Work': m.Work,
+                        'Gurobi Memory (MB)': m.MaxMemUsed * 1024})
+            m.dispose()
+        finally:
+            env.dispose()
+    except Exception as e:
+        row.update({'Status': 'failed', 'Error': repr(e)})
+    row['Peak RSS (MB)'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return row
+
+
+def run_benchmark(grid=None, seeds=(0,), n_depots=2, time_limit=60, threads=1, output='benchmark_results.csv'):
+    cases = [(n, k, n_depots, seed) for n, k in (grid or default_grid) for seed in seeds]
+    rows = []
+    for case in cases:
+        with multiprocessing.Pool(1) as pool:
+            rows.append(pool.apply(run_case, case + (time_limit, threads)))
+        row = rows[-1]
+        print(f"{row['Customers']} customers, {row['Technicians']} technicians, seed {row['Seed']}: "
+              f"{row['Status']}, {row.get('Runtime') or 0:.3f}s")
+    results = pd.DataFrame.from_records(rows, columns=results_cols)
+    results.to_csv(output, index=False)
+    return results
+
+
+def compare_with_baseline(results, baseline=baseline_file, tolerance=1.5):
+    base = pd.read_csv(baseline)
+    both = results.merge(base, on=case_cols, suffixes=('', ' (baseline)'))
+    regressions = []
+    for _, row in both.iterrows():
+        found = []
+        for col in timed_cols:
+            new, old = row[col], row[f"{col} (baseline)"]
+            if pd.notna(new) and pd.notna(old) and new > tolerance * old and new - old > 1:
+                found.append(f"{col} {old:.3f}s -> {new:.3f}s")
+        new, old = row['Objective'], row['Objective (baseline)']
+        if pd.notna(old) and (pd.isna(new) or new > old + 1e-6 * abs(old)):
+            found.append(f"Objective {old} -> {new}")
+        if found:
+            print(f"{row['Customers']} customers, {row['Technicians']} technicians, seed {row['Seed']}: "
+                  + ', '.join(found))
+        regressions += found
+    print(f"{len(both)} cases compared with {baseline}, {len(regressions)} regressions")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scaling benchmark for the technician routing model')
+    parser.add_argument('--sizes', nargs='+', default=None,
+                        help='grid of CUSTOMERSxTECHNICIANS sizes, e.g. 20x5 50x10 (default: 10x3 20x5 50x10 100x20)')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0], help='instance seeds')
+    parser.add_argument('--depots', type=int, default=2, help='number of depots')
+    parser.add_argument('--time-limit', type=float, default=60, help='Gurobi time limit per case (s)')
+    parser.add_argument('--threads', type=int, default=1, help='Gurobi threads per case')
+    parser.add_argument('--output', default='benchmark_results.csv', help='results file')
+    parser.add_argument('--baseline', default=baseline_file, help='baseline results to compare with')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the new baseline')
+    args = parser.parse_args()
+    grid = [tuple(int(v) for v in size.split('x')) for size in args.sizes] if args.sizes else None
+    results = run_benchmark(grid, args.seeds, args.depots, args.time_limit, args.threads, args.output)
+    print(results.to_string(index=False))
+    if args.update_baseline:
+        results[results.Status != 'failed'].to_csv(args.baseline, index=False)
+    elif os.path.exists(args.baseline) and compare_with_baseline(results, args.baseline):
+        sys.exit(1)
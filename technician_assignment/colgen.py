@@ -0,0 +1,199 @@
+from gurobipy import GRB
+import gurobipy as gp
+import heapq
+import itertools
+import time
+
+from technician_assignment.heuristic import insertion_heuristic, schedule
+from technician_assignment.routing import (
+    RoutingSolution, base_scenario, build_trs0, create_excel_output, print_scen, print_solution,
+    time_bounds
+)
+
+
+# Column generation for the TRS problem, for instances too large for the compact arc model.
+#
+# Master problem (set partitioning over candidate routes r):
+#   min  sum_r c_r * lambda_r + sum_j P_j * s_j
+#   s.t. sum_r a_jr * lambda_r + s_j = 1        for all customers j      (cover)
+#        sum_{r of class c} lambda_r <= |c|     for all technician classes (technicians)
+# where a route is an elementary tour of one technician from and back to his/her depot,
+# c_r = 0.01 * M * (sum of the start times along the route) and P_j = pi_j * M + 0.01 * M * a_j
+# is the penalty for leaving j unfilled -- the same objective as `build_trs0`, so the two can
+# be compared directly. Technicians with the same depot, capacity and skills are
+# interchangeable and are priced and counted together as one class.
+#
+# Pricing is an elementary shortest path problem with time windows and capacity, solved with a
+# labeling algorithm for each class. A label at customer i records its start time, the capacity
+# used so far, its reduced cost and the set of customers visited; a label dominates another at
+# the same customer if it is no later, uses no more capacity, is no more expensive and has
+# visited a subset of its customers. Limiting the number of labels kept per customer
+# (`max_labels`) turns the exact pricing into a fast heuristic one; the final LP value is then
+# no longer guaranteed to be a lower bound.
+#
+# Once no more routes price out, the master is solved once more as a MIP over all generated
+# routes (price-and-branch) to recover integral routes.
+
+M = 6100
+
+
+def technician_classes(techs, custs):
+    classes = {}
+    for k in techs:
+        covers = frozenset(i for i, j in enumerate(custs) if k.name in [t.name for t in j.job.covered_by])
+        classes.setdefault((k.depot, k.cap, covers), []).append(k)
+    return [(covers, ks) for (_, _, covers), ks in classes.items()]
+
+
+def price_routes(k, covers, custs, distances, ub, duals, mu, max_labels=None, max_routes=50):
+    # Successors of the depot (-1) and of every customer that the time windows allow
+    succ = {-1: [j for j in covers if distances[k.depot, custs[j].loc] <= ub[j]]}
+    for i in covers:
+        ci = custs[i]
+        succ[i] = [j for j in covers
+                   if j != i and ci.time_start + ci.job.duration + distances[ci.loc, custs[j].loc] <= ub[j]]
+
+    # label: [time, used, reduced cost, customer, visited, path, times, alive]
+    counter = itertools.count()
+    heap = [(0, next(counter), [0, 0, 0.0, -1, 0, (), (), True])]
+    bucket = {j: [] for j in covers}
+    found = []
+    while heap:
+        _, _, label = heapq.heappop(heap)
+        t, used, rc, i, visited, path, times, alive = label
+        if not alive:
+            continue
+        if i >= 0 and rc - mu < -1e-6:
+            found.append((rc - mu, path, times))
+        loc_i = k.depot if i < 0 else custs[i].loc
+        ready = t if i < 0 else t + custs[i].job.duration
+        for j in succ[i]:
+            if visited >> j & 1:
+                continue
+            cj = custs[j]
+            arrival = max(cj.time_start, ready + distances[loc_i, cj.loc])
+            if arrival > ub[j]:
+                continue
+            new_used = used + distances[loc_i, cj.loc] + cj.job.duration
+            if new_used + distances[cj.loc, k.depot] > k.cap:
+                continue
+            new = [arrival, new_used, rc + 0.01 * M * arrival - duals[j], j, visited | 1 << j,
+                   path + (j,), times + (arrival,), True]
+            if any(o[0] <= new[0] and o[1] <= new[1] and o[2] <= new[2] + 1e-9 and o[4] & ~new[4] == 0
+                   for o in bucket[j]):
+                continue
+            for o in bucket[j]:
+                if new[0] <= o[0] and new[1] <= o[1] and new[2] <= o[2] + 1e-9 and new[4] & ~o[4] == 0:
+                    o[7] = False
+            kept = [o for o in bucket[j] if o[7]] + [new]
+            if max_labels is not None and len(kept) > max_labels:
+                kept.sort(key=lambda o: o[2])
+                for o in kept[max_labels:]:
+                    o[7] = False
+                kept = kept[:max_labels]
+            bucket[j] = kept
+            if new[7]:
+                heapq.heappush(heap, (arrival, next(counter), new))
+    found.sort()
+    return found[:max_routes]
+
+
+def solve_colgen(techs, custs, distances, max_labels=None, max_iterations=500, time_limit=600, verbose=True):
+    start_time = time.perf_counter()
+    index = {j.name: i for i, j in enumerate(custs)}
+    t_lb, t_ub = time_bounds(techs, custs, distances)
+    ub = [t_ub[j.loc] for j in custs]
+    penalty = [M * j.job.priority + 0.01 * M * t_lb[j.loc] for j in custs]
+    classes = technician_classes(techs, custs)
+    class_of = {k.name: c for c, (_, ks) in enumerate(classes) for k in ks}
+
+    m = gp.Model('trs0_master')
+    m.Params.OutputFlag = 0
+    s = m.addVars(len(custs), obj=penalty, name='unfilled')
+    cover = m.addConstrs((s[j] == 1 for j in range(len(custs))), name='cover')
+    convexity = m.addConstrs((gp.LinExpr() <= len(classes[c][1]) for c in range(len(classes))), name='technicians')
+    routes = []
+    seen = set()
+
+    def add_route(c, path, times):
+        if (c, path) in seen:
+            return False
+        seen.add((c, path))
+        column = gp.Column([1] * (len(path) + 1), [cover[j] for j in path] + [convexity[c]])
+        lam = m.addVar(obj=0.01 * M * sum(times), column=column, name=f"route[{len(routes)}]")
+        routes.append((c, path, times, lam))
+        return True
+
+    # Initial columns from the construction heuristic
+    initial = insertion_heuristic(techs, custs, distances)
+    for k in techs:
+        route = initial.routes[k.name]
+        if route:
+            add_route(class_of[k.name], tuple(index[j.name] for j in route), tuple(schedule(route, k, distances)))
+
+    for iteration in range(max_iterations):
+        m.optimize()
+        duals = m.getAttr('Pi', cover)
+        mu = m.getAttr('Pi', convexity)
+        added = 0
+        for c, (covers, ks) in enumerate(classes):
+            for _, path, times in price_routes(ks[0], covers, custs, distances, ub, duals, mu[c], max_labels):
+                added += add_route(c, path, times)
+        if verbose:
+            print(f"Iteration {iteration}: LP objective {m.ObjVal:.2f}, {added} routes added, {len(routes)} in total")
+        if added == 0 or time.perf_counter() - start_time > time_limit:
+            break
+    m.optimize()
+    lp_bound = m.ObjVal
+
+    # Price-and-branch: integral routes from the generated columns
+    variables = [lam for _, _, _, lam in routes] + list(s.values())
+    m.setAttr('VType', variables, [GRB.BINARY] * len(variables))
+    m.Params.TimeLimit = max(time_limit - (time.perf_counter() - start_time), 1)
+    m.optimize()
+    if verbose:
+        print(f"Column generation: LP bound {lp_bound:.2f}, integer objective {m.ObjVal:.2f}, "
+              f"{len(routes)} routes, {time.perf_counter() - start_time:.3f}s")
+
+    assigned = {j.name: None for j in custs}
+    start = {j.loc: t_lb[j.loc] for j in custs}
+    start.update({k.depot: 0 for k in techs})
+    sol_routes = {k.name: [] for k in techs}
+    free = {c: list(ks) for c, (_, ks) in enumerate(classes)}
+    for c, path, times, lam in routes:
+        if lam.X > 0.5:
+            k = free[c].pop(0)
+            sol_routes[k.name] = [custs[j] for j in path]
+            for j, t in zip(path, times):
+                assigned[custs[j].name] = k.name
+                start[custs[j].loc] = t
+    objective = m.ObjVal
+    m.dispose()
+    return RoutingSolution(assigned, start, sol_routes), objective, lp_bound
+
+
+# On small instances, the compact model and column generation should agree
+
+
+def compare_with_compact(techs, custs, distances):
+    start = time.perf_counter()
+    rm = build_trs0(techs, custs, distances)
+    rm.m.Params.OutputFlag = 0
+    rm.m.optimize()
+    print(f"Compact model: objective {rm.m.ObjVal:.2f}, {time.perf_counter() - start:.3f}s")
+    rm.m.dispose()
+    start = time.perf_counter()
+    _, objective, lp_bound = solve_colgen(techs, custs, distances, verbose=False)
+    print(f"Column generation: objective {objective:.2f} (LP bound {lp_bound:.2f}), "
+          f"{time.perf_counter() - start:.3f}s")
+
+
+if __name__ == '__main__':
+    technicians, customers, dist = (base_scenario()[name] for name in ('technicians', 'customers', 'dist'))
+    print_scen("Comparing the compact model and column generation")
+    compare_with_compact(technicians, customers, dist)
+
+    print_scen("Solving base scenario with column generation")
+    sol, _, _ = solve_colgen(technicians, customers, dist)
+    print_solution(sol, technicians, customers, dist)
+    create_excel_output(sol, technicians, dist)
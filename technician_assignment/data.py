@@ -0,0 +1,227 @@
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+import sys
+import time
+
+import cache
+
+
+# Columnar routing data.
+#
+# A scenario is held as a handful of NumPy arrays instead of one Python object per technician,
+# job and customer and one dict entry per pair of locations:
+#   - `DistanceMatrix`: an n x n array of travel times with a location name -> row/column map.
+#     It also behaves as a read-only mapping (a, b) -> travel time, so it can be passed
+#     anywhere a distance dict is expected (`build_trs0`, `get_latest_times`, the output
+#     writers, ...). Looking up a pair costs two dict lookups and an array access; nothing
+#     is stored per pair beyond the array itself.
+#   - `TechnicianTable`: names, capacities, depots (as location indices) and a technician x job
+#     skill matrix.
+#   - `JobTable`: names, priorities and durations.
+#   - `CustomerTable`: names, locations (as location indices), jobs (as job indices) and the
+#     time window start/end/due times.
+# `read_columnar` reads a scenario workbook straight into these tables, with one vectorized
+# operation per sheet. The workbook and its parsed sheets go through the data cache (see
+# `cache`), so it is downloaded and parsed once and afterwards loaded from disk. `routing.read_workbook` builds the Technician/Job/Customer objects from
+# them.
+
+
+class DistanceMatrix(Mapping):
+    __slots__ = ('names', 'index', 'array')
+
+    def __init__(self, names, array):
+        self.names = list(names)
+        self.index = {l: i for i, l in enumerate(self.names)}
+        self.array = np.asarray(array)
+
+    def __getitem__(self, key):
+        a, b = key
+        return self.array[self.index[a], self.index[b]].item()
+
+    def __iter__(self):
+        return ((a, b) for a in self.names for b in self.names)
+
+    def __len__(self):
+        return len(self.names) ** 2
+
+    def __contains__(self, key):
+        try:
+            a, b = key
+        except (TypeError, ValueError):
+            return False
+        return a in self.index and b in self.index
+
+    def __str__(self):
+        return f"Distance matrix: {len(self.names)} locations"
+
+    def indices(self, locs):
+        return np.array([self.index[l] for l in locs], dtype=int)
+
+    @classmethod
+    def from_dict(cls, distances):
+        names = list(dict.fromkeys(a for a, _ in distances))
+        matrix = cls(names, np.zeros((len(names), len(names))))
+        for (a, b), d in distances.items():
+            matrix.array[matrix.index[a], matrix.index[b]] = d
+        return matrix
+
+
+# The model builders accept either a `DistanceMatrix` or a plain dict of distances; these two
+# helpers give them the locations and the travel time array without going over every pair of
+# a distance matrix in Python.
+
+
+def locations(distances):
+    if isinstance(distances, DistanceMatrix):
+        return list(distances.names)
+    return list(set([l[0] for l in distances.keys()]))
+
+
+def distance_array(distances, locs):
+    if isinstance(distances, DistanceMatrix):
+        idx = distances.indices(locs)
+        return distances.array[np.ix_(idx, idx)].astype(float)
+    l_idx = {l: i for i, l in enumerate(locs)}
+    tau = np.zeros((len(locs), len(locs)))
+    for (a, b), d in distances.items():
+        tau[l_idx[a], l_idx[b]] = d
+    return tau
+
+
+class TechnicianTable:
+    __slots__ = ('names', 'cap', 'depot', 'skills')
+
+    def __init__(self, names, cap, depot, skills):
+        self.names = list(names)
+        self.cap = np.asarray(cap, dtype=float)
+        self.depot = np.asarray(depot, dtype=int)        # location index
+        self.skills = np.asarray(skills, dtype=bool)     # technician x job
+
+    def __len__(self):
+        return len(self.names)
+
+    def __str__(self):
+        return f"Technician table: {len(self.names)} technicians"
+
+
+class JobTable:
+    __slots__ = ('names', 'index', 'priority', 'duration')
+
+    def __init__(self, names, priority, duration):
+        self.names = list(names)
+        self.index = {j: i for i, j in enumerate(self.names)}
+        self.priority = np.asarray(priority)
+        self.duration = np.asarray(duration)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __str__(self):
+        return f"Job table: {len(self.names)} jobs"
+
+
+class CustomerTable:
+    __slots__ = ('names', 'loc', 'job', 'time_start', 'time_end', 'time_due')
+
+    def __init__(self, names, loc, job, time_start, time_end, time_due):
+        self.names = list(names)
+        self.loc = np.asarray(loc, dtype=int)            # location index
+        self.job = np.asarray(job, dtype=int)            # job index
+        self.time_start = np.asarray(time_start)
+        self.time_end = np.asarray(time_end)
+        self.time_due = np.asarray(time_due)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __str__(self):
+        return f"Customer table: {len(self.names)} customers"
+
+
+class RoutingData:
+    __slots__ = ('technicians', 'jobs', 'customers', 'dist')
+
+    def __init__(self, technicians, jobs, customers, dist):
+        self.technicians = technicians
+        self.jobs = jobs
+        self.customers = customers
+        self.dist = dist
+
+    def __str__(self):
+        return f"Routing data:\n  {self.technicians}\n  {self.jobs}\n  {self.customers}\n  {self.dist}"
+
+    def covers(self):
+        # customer x technician: can the technician do the customer's job?
+        return self.technicians.skills[:, self.customers.job].T
+
+    @classmethod
+    def from_entities(cls, techs, custs, distances):
+        # Tables for lists of Technician and Customer objects (as used by the model builders)
+        dist = distances if isinstance(distances, DistanceMatrix) else DistanceMatrix.from_dict(distances)
+        job_list = list({id(j.job): j.job for j in custs}.values())
+        jobs = JobTable([j.name for j in job_list], [j.priority for j in job_list], [j.duration for j in job_list])
+        job_idx = {id(j): i for i, j in enumerate(job_list)}
+        skills = [[k.name in [t.name for t in j.covered_by] for j in job_list] for k in techs]
+        technicians = TechnicianTable([k.name for k in techs], [k.cap for k in techs],
+                                      dist.indices([k.depot for k in techs]), np.reshape(skills, (len(techs), -1)))
+        customers = CustomerTable([j.name for j in custs], dist.indices([j.loc for j in custs]),
+                                  [job_idx[id(j.job)] for j in custs], [j.time_start for j in custs],
+                                  [j.time_end for j in custs], [j.time_due for j in custs])
+        return cls(technicians, jobs, customers, dist)
+
+
+# Read Excel workbook into columnar tables (sheet layout as described at `routing.read_workbook`)
+
+
+def read_columnar(excel_file, refresh=False):
+    sheets = cache.read_excel(excel_file, sheet_name=['Technicians', 'Locations', 'Customers'], refresh=refresh)
+
+    # Locations: the upper triangle of travel times, mirrored
+    df_locations = sheets['Locations'].set_index(sheets['Locations'].columns[0])
+    upper = np.triu(df_locations.apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(), 1)
+    array = upper + upper.T
+    if np.array_equal(array, np.round(array)):
+        array = array.astype(np.int64)
+    dist = DistanceMatrix(df_locations.index, array)
+
+    # Jobs (columns after the third, with a priority and a duration row) and technicians
+    df = sheets['Technicians']
+    jobs = JobTable(df.columns[3:], df.iloc[0, 3:].to_numpy(), df.iloc[1, 3:].to_numpy())
+    technicians = TechnicianTable(df.iloc[2:, 0], df.iloc[2:, 1].to_numpy(), dist.indices(df.iloc[2:, 2]),
+                                  df.iloc[2:, 3:].to_numpy() == 1)
+
+    # Customers, without those whose job is unknown
+    df_customers = sheets['Customers']
+    known = df_customers.iloc[:, 2].isin(jobs.index).to_numpy()
+    df_customers = df_customers[known]
+    customers = CustomerTable(df_customers.iloc[:, 0], dist.indices(df_customers.iloc[:, 1]),
+                              [jobs.index[j] for j in df_customers.iloc[:, 2]],
+                              *(df_customers.iloc[:, c].to_numpy() for c in (3, 4, 5)))
+    return RoutingData(technicians, jobs, customers, dist)
+
+
+# Memory and build time of a distance dict against a distance matrix, for n random locations
+
+
+def compare_distances(n, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, 100, (n, 2))
+    array = np.rint(np.hypot(*(points[:, None, :] - points[None, :, :]).transpose(2, 0, 1))).astype(np.int64)
+    names = [f"L{i}" for i in range(n)]
+
+    start = time.perf_counter()
+    matrix = DistanceMatrix(names, array)
+    matrix_time = time.perf_counter() - start
+    start = time.perf_counter()
+    as_dict = {(a, b): array[i, j].item() for i, a in enumerate(names) for j, b in enumerate(names)}
+    dict_time = time.perf_counter() - start
+    dict_bytes = sys.getsizeof(as_dict) + sum(sys.getsizeof(key) for key in as_dict)
+    print(f"{n} locations: matrix {matrix.array.nbytes / 2**20:.1f} MiB in {matrix_time:.3f}s, "
+          f"dict {dict_bytes / 2**20:.1f} MiB in {dict_time:.3f}s")
+
+
+if __name__ == '__main__':
+    print(read_columnar('https://raw.githubusercontent.com/decision-spot/technician_assignment/main/data-Sce0.xlsx'))
+    for n in (100, 1000, 2000):
+        compare_distances(n)
@@ -0,0 +1,271 @@
+from gurobipy import GRB
+import gurobipy as gp
+import multiprocessing
+import numpy as np
+import os
+import time
+
+from technician_assignment.data import RoutingData
+from technician_assignment.heuristic import insertion_heuristic
+from technician_assignment.routing import (
+    RoutingSolution, base_scenario, build_trs0, create_excel_output, extract_solution, print_scen,
+    print_solution, time_bounds
+)
+from technician_assignment.timing import route_timing
+
+
+# Assignment-then-route decomposition of TRS0 (logic-based Benders).
+#
+# Master problem: assign customers to technicians, or leave them unfilled.
+#   min  sum_j P_j * g_j + sum_k theta_k
+#   s.t. sum_{k covering j} x_jk + g_j = 1                     for all customers j
+#        sum_j (p_j + e_jk) * x_jk <= cap_k                    for all technicians k
+#        x_ik + x_jk <= 1            if i and j fit on no route of k together, in either order
+#        theta_k >= sum_j c_jk * x_jk                          (routing-cost estimate)
+#        + Benders cuts
+# where P_j = pi_j * M + 0.01 * M * a_j is the cost of leaving j unfilled (as in
+# `colgen.solve_colgen`), e_jk is the shortest travel time into j that k could have (from the
+# depot or another customer), and c_jk = min(0.01 * M * (the earliest k can start at j), P_j)
+# -- so theta_k is a lower bound on the cost of k's customers: the sum of the start times of
+# those k serves, and P_j for those k cannot fit in after all.
+# Whether customers fit on a route is decided by the rules of TRS0: time windows, start times
+# within `routing.time_bounds` (a return to the nearest qualified depot, not necessarily k's)
+# and k's capacity, as in the subproblems, so that the master is a relaxation of TRS0.
+#
+# Subproblem: each technician's assigned customers S_k are routed on their own, with the TRS0
+# model for that technician alone (customers that do not fit are left unfilled, at P_j). The
+# subproblems are independent and are solved in parallel, each worker with its own
+# single-threaded Gurobi environment; results are cached, so an assignment that comes back is
+# not solved again.
+#   - For every customer j that S_k leaves unfilled because it cannot be routed with the others,
+#     a smallest set S' of them that cannot be routed together with j is found by deletion, and
+#     the no-good cut sum_{i in S' + j} x_ik <= |S'| is added.
+#   - If S_k costs C more than theta_k (with start times s_j), the optimality cut
+#       theta_k >= C - sum_{j in S_k} (c_jk + E) * (1 - x_jk) + sum_{j not in S_k} c_jk * x_jk,
+#       E = sum_{i in S_k} (cost of i in the subproblem - c_ik)
+#     is added: adding a customer to S_k costs at least its estimate, and removing one saves at
+#     most its own estimate plus every other customer's cost above its estimate.
+# Both cuts are added for every technician with the same depot and capacity that can take all
+# of the customers involved. They assume that travel times satisfy the triangle inequality
+# (adding a stop never makes the others earlier), as road travel times do. The reported
+# solution is always made of subproblem routes, so it is feasible either way; without the
+# triangle inequality it may just not be optimal.
+#
+# The insertion heuristic's solution is the first incumbent. The loop stops when every
+# technician's routing cost matches the master's theta_k (the master objective is then the
+# optimal objective of TRS0, with travel times that satisfy the triangle inequality), when no
+# cut is added, or at the iteration or time limit with the best solution found and the master's
+# lower bound. The cuts are weak when routes are long and tightly timed, so on such
+# instances the bound closes slowly; the decomposition is meant for instances with many
+# technicians, where the compact model is too large to solve.
+
+M = 6100
+
+
+# Subproblem workers: the instance is handed to each worker once, when it starts
+
+
+_instance = {}
+
+
+def _init_worker(techs, custs, distances, threads=1):
+    env = gp.Env(empty=True)
+    env.setParam('OutputFlag', 0)
+    env.setParam('Threads', threads)
+    env.start()
+    _instance.update(techs=techs, custs=custs, distances=distances, env=env)
+
+
+def route_subproblem(k, S, hard=False):
+    # Route customers S (indices) for technician k (index): (cost, route, start times, unfilled);
+    # with `hard`, no customer may be left unfilled and None means that S cannot be routed
+    techs, custs, distances, env = _instance['techs'], _instance['custs'], _instance['distances'], _instance['env']
+    technician = techs[k]
+    sub_custs = [custs[j] for j in S]
+    rm = build_trs0([technician], sub_custs, distances, env=env)
+    if hard:
+        rm.m.setAttr('UB', list(rm.g.values()), [0] * len(S))
+    rm.m.optimize()
+    if rm.m.SolCount == 0:
+        rm.m.dispose()
+        return None
+    sol = extract_solution(rm, [technician], sub_custs)
+    rm.m.dispose()
+    index = {custs[j].name: j for j in S}
+    route = tuple(index[j.name] for j in sol.routes[technician.name])
+    unfilled = tuple(index[j] for j, kk in sol.assigned.items() if kk is None)
+    return sol.objective, route, tuple(sol.start[custs[j].loc] for j in route), unfilled
+
+
+def minimal_infeasible(k, S):
+    # Deletion filter: drop customers from S as long as the rest still cannot be routed
+    S = list(S)
+    for j in list(S):
+        rest = [i for i in S if i != j]
+        if rest and route_subproblem(k, rest, hard=True) is None:
+            S = rest
+    return tuple(S)
+
+
+def solve_subproblem(task):
+    # The routing of S, and for every customer it leaves unfilled, a smallest set of customers
+    # that cannot be routed together with it
+    k, S = task
+    cost, route, starts, unfilled = route_subproblem(k, S)
+    conflicts = [minimal_infeasible(k, route + (j,)) for j in unfilled
+                 if route_subproblem(k, route + (j,), hard=True) is None]
+    return k, S, cost, route, starts, unfilled, conflicts
+
+
+def solve_decomposed(techs, custs, distances, workers=None, max_iterations=100, time_limit=600, verbose=True):
+    start_time = time.perf_counter()
+    nK, nC = len(techs), len(custs)
+    data = RoutingData.from_entities(techs, custs, distances)
+    covers = data.covers()
+    dur = data.jobs.duration[data.customers.job].astype(float)
+    t_lb, t_ub = time_bounds(techs, custs, distances)
+    penalty = [M * j.job.priority + 0.01 * M * t_lb[j.loc] for j in custs]
+    tau = data.dist.array.astype(float)
+    loc, depot = data.customers.loc, data.technicians.depot
+
+    # Which customers and pairs of customers fit on a route of k (from `timing.route_timing`, with
+    # the start-time bounds of TRS0, as in the subproblems)
+    bound = np.array([t_ub[j.loc] for j in custs], dtype=float)
+    single = route_timing(np.tile(np.arange(nC), nK)[:, None], np.repeat(np.arange(nK), nC), data,
+                          latest_start=bound)
+    fits = single.feasible.reshape(nK, nC).T & covers
+    earliest = single.earliest.reshape(nK, nC).T
+    est = np.minimum(0.01 * M * earliest, np.array(penalty)[:, None])
+    pi, pj = np.triu_indices(nC, 1)
+    pair_k = np.repeat(np.arange(nK), len(pi))
+    both = [route_timing(np.stack([np.tile(a, nK), np.tile(b, nK)], axis=1), pair_k, data,
+                         latest_start=bound).feasible.reshape(nK, -1)
+            for a, b in ((pi, pj), (pj, pi))]
+    apart = ~(both[0] | both[1])
+
+    # Shortest travel into each customer for each technician: from its depot or another customer
+    between = tau[np.ix_(loc, loc)]
+    between[loc[:, None] == loc[None, :]] = np.inf
+    into_other = between.min(axis=0)
+    e = np.minimum(tau[depot][:, loc].T, into_other[:, None])
+
+    # Master problem
+    m = gp.Model('trs0_master')
+    m.Params.OutputFlag = 0
+    pairs = gp.tuplelist((j, k) for j in range(nC) for k in range(nK) if fits[j, k])
+    x = m.addVars(pairs, vtype=GRB.BINARY, name='x')
+    g = m.addVars(nC, vtype=GRB.BINARY, obj=penalty, name='g')
+    theta = m.addVars(nK, obj=1, name='theta')
+    m.addConstrs((x.sum(j, '*') + g[j] == 1 for j in range(nC)), name='assign_to_job')
+    for k in range(nK):
+        m.addConstr(gp.quicksum((dur[j] + e[j, k]) * x[j, k] for j, _ in pairs.select('*', k)) <= techs[k].cap,
+                    name=f"tech_capacity[{k}]")
+        m.addConstr(theta[k] >= gp.quicksum(est[j, k] * x[j, k] for j, _ in pairs.select('*', k)),
+                    name=f"estimate[{k}]")
+    for k, p in zip(*np.nonzero(apart)):
+        i, j = pi[p], pj[p]
+        if (i, k) in x and (j, k) in x:
+            m.addConstr(x[i, k] + x[j, k] <= 1, name=f"apart[{i},{j},{k}]")
+    same = {}
+    for k, technician in enumerate(techs):
+        same.setdefault((technician.depot, technician.cap), []).append(k)
+    twins = {k: same[techs[k].depot, techs[k].cap] for k in range(nK)}
+
+    # Decomposition loop
+    workers = workers or os.cpu_count()
+    pool = multiprocessing.Pool(workers, _init_worker, (techs, custs, distances)) if workers > 1 else None
+    if pool is None:
+        _init_worker(techs, custs, distances, threads=0)
+    cache = {}
+    lower = 0
+
+    # The insertion heuristic's solution is the first incumbent
+    initial = insertion_heuristic(techs, custs, distances)
+    index = {j.name: i for i, j in enumerate(custs)}
+    best_routes = {k: (tuple(index[j.name] for j in initial.routes[technician.name]),
+                       tuple(initial.start[j.loc] for j in initial.routes[technician.name]))
+                   for k, technician in enumerate(techs) if initial.routes[technician.name]}
+    best = (sum(penalty[index[j]] for j, k in initial.assigned.items() if k is None)
+            + sum(0.01 * M * s for _, starts in best_routes.values() for s in starts))
+    for iteration in range(max_iterations):
+        m.optimize()
+        lower = max(lower, m.ObjVal)
+        assigned = {k: tuple(j for j, _ in pairs.select('*', k) if x[j, k].X > 0.5) for k in range(nK)}
+        tasks = [(k, S) for k, S in assigned.items() if S and (techs[k].depot, techs[k].cap, S) not in cache]
+        results = pool.map(solve_subproblem, tasks) if pool is not None else map(solve_subproblem, tasks)
+        for k, S, cost, route, starts, unfilled, conflicts in results:
+            cache[techs[k].depot, techs[k].cap, S] = (cost, route, starts, unfilled, conflicts)
+
+        # Cuts and the value of this assignment
+        value = sum(penalty[j] for j in range(nC) if g[j].X > 0.5)
+        routes = {}
+        cuts = 0
+        for k, S in assigned.items():
+            if not S:
+                continue
+            cost, route, starts, unfilled, conflicts = cache[techs[k].depot, techs[k].cap, S]
+            value += cost
+            routes[k] = (route, starts)
+            for kk in twins[k]:
+                if not all((j, kk) in x for j in S):
+                    continue
+                for conflict in conflicts:
+                    m.addConstr(gp.quicksum(x[j, kk] for j in conflict) <= len(conflict) - 1)
+                    cuts += 1
+                if theta[k].X < cost - 1e-6:
+                    excess = (sum(0.01 * M * s - est[j, kk] for j, s in zip(route, starts))
+                              + sum(penalty[j] - est[j, kk] for j in unfilled))
+                    m.addConstr(theta[kk] >= cost - gp.quicksum((est[j, kk] + excess) * (1 - x[j, kk]) for j in S)
+                                + gp.quicksum(est[j, kk] * x[j, kk] for j, _ in pairs.select('*', kk) if j not in S))
+                    cuts += 1
+        if value < best:
+            best, best_routes = value, routes
+        if verbose:
+            print(f"Iteration {iteration}: lower bound {lower:.2f}, best {best:.2f}, {len(tasks)} subproblems, "
+                  f"{cuts} cuts, {time.perf_counter() - start_time:.3f}s")
+        if cuts == 0 or best - lower <= 1e-6 * best or time.perf_counter() - start_time > time_limit:
+            break
+    if pool is not None:
+        pool.close()
+        pool.join()
+    else:
+        _instance.pop('env').dispose()
+    m.dispose()
+
+    assigned = {j.name: None for j in custs}
+    start = {j.loc: t_lb[j.loc] for j in custs}
+    start.update({k.depot: 0 for k in techs})
+    sol_routes = {k.name: [] for k in techs}
+    for k, (route, starts) in best_routes.items():
+        sol_routes[techs[k].name] = [custs[j] for j in route]
+        for j, s in zip(route, starts):
+            assigned[custs[j].name] = techs[k].name
+            start[custs[j].loc] = s
+    return RoutingSolution(assigned, start, sol_routes, best), lower
+
+
+# On small instances, the compact model and the decomposition should agree
+
+
+def compare_with_compact(techs, custs, distances, workers=None):
+    start = time.perf_counter()
+    rm = build_trs0(techs, custs, distances)
+    rm.m.Params.OutputFlag = 0
+    rm.m.optimize()
+    print(f"Compact model: objective {rm.m.ObjVal:.2f}, {time.perf_counter() - start:.3f}s")
+    rm.m.dispose()
+    start = time.perf_counter()
+    sol, lower = solve_decomposed(techs, custs, distances, workers, verbose=False)
+    print(f"Decomposition: objective {sol.objective:.2f} (lower bound {lower:.2f}), "
+          f"{time.perf_counter() - start:.3f}s")
+
+
+if __name__ == '__main__':
+    technicians, customers, dist = (base_scenario()[name] for name in ('technicians', 'customers', 'dist'))
+    print_scen("Comparing the compact model and the decomposition")
+    compare_with_compact(technicians, customers, dist)
+
+    print_scen("Solving base scenario with the decomposition")
+    sol, _ = solve_decomposed(technicians, customers, dist)
+    print_solution(sol, technicians, customers, dist)
+    create_excel_output(sol, technicians, dist)
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from technician_assignment.data import DistanceMatrix
+from technician_assignment.routing import Customer, Job, Technician, print_scen
+
+
+# Seeded synthetic TRS instances.
+#
+# Locations are points in an `area` x `area` square (travel times in minutes, one minute per
+# unit of distance): `n_depots` depots spread uniformly and customers around `n_clusters`
+# cluster centers (normally distributed with standard deviation `spread`; 0 clusters spreads
+# them uniformly). Travel times are rounded Euclidean distances, made to satisfy the triangle
+# inequality again after rounding. Technicians are spread round-robin over the depots; each
+# is qualified for each job type with probability `coverage` (every job type has at least one
+# qualified technician). Each customer gets a random job type and a time window of `window`
+# minutes, starting on the half hour, that leaves time to do the job before the end of the day
+# (t = 600); like in the base scenario, the due time is an hour after the window closes.
+#
+# The same arguments always give the same instance.
+
+job_names = ['Equipment Installation', 'Equipment Setup', 'Inspect/Service Equipment', 'Repair - Regular',
+             'Repair - Important', 'Repair - Urgent', 'Repair - Critical']
+
+
+def generate_instance(n_customers, n_technicians, n_depots=2, n_clusters=3, window=120, coverage=0.5,
+                      area=150, spread=15, seed=0):
+    rng = np.random.default_rng(seed)
+
+    # Locations and travel times
+    depots = rng.uniform(0, area, (n_depots, 2))
+    if n_clusters > 0:
+        centers = rng.uniform(0, area, (n_clusters, 2))
+        points = centers[rng.integers(n_clusters, size=n_customers)] + rng.normal(0, spread, (n_customers, 2))
+        points = np.clip(points, 0, area)
+    else:
+        points = rng.uniform(0, area, (n_customers, 2))
+    xy = np.vstack([depots, points])
+    tau = np.rint(np.hypot(*(xy[:, None, :] - xy[None, :, :]).transpose(2, 0, 1)))
+    for l in range(len(xy)):
+        tau = np.minimum(tau, tau[:, l, None] + tau[None, l, :])
+    names = [f"Depot{d + 1}" for d in range(n_depots)] + [f"Site{i + 1}" for i in range(n_customers)]
+    dist = DistanceMatrix(names, tau.astype(np.int64))
+
+    # Technicians and jobs
+    technicians = [Technician(f"Tech{k + 1}", 360 if k % 3 == 2 else 480, names[k % n_depots])
+                   for k in range(n_technicians)]
+    skills = rng.random((n_technicians, len(job_names))) < coverage
+    skills[rng.integers(n_technicians, size=len(job_names)), np.arange(len(job_names))] = True
+    priority = rng.integers(1, 5, size=len(job_names))
+    duration = rng.choice([30, 60, 90, 120], size=len(job_names))
+    jobs = [Job(name, int(priority[i]), int(duration[i]), [t for t, ok in zip(technicians, skills[:, i]) if ok])
+            for i, name in enumerate(job_names)]
+
+    # Customers
+    customers = []
+    for i, j in enumerate(rng.integers(len(jobs), size=n_customers)):
+        job = jobs[j]
+        latest = max((600 - job.duration - window) // 30, 0)
+        time_start = 30 * int(rng.integers(latest + 1))
+        customers.append(Customer(f"Customer{i + 1}", names[n_depots + i], job, time_start,
+                                  time_start + window, time_start + window + 60))
+
+    return technicians, jobs, customers, dist
+
+
+# An instance can be written to a scenario workbook (see `routing.read_workbook`), e.g. for
+# `batch.run_batch`
+
+
+def write_workbook(path, techs, jobs, custs, distances):
+    rows = [['Priority', None, None] + [j.priority for j in jobs],
+            ['Duration', None, None] + [j.duration for j in jobs]]
+    for k in techs:
+        rows.append([k.name, k.cap, k.depot] + [int(k.name in [t.name for t in j.covered_by]) for j in jobs])
+    df_techs = pd.DataFrame(rows, columns=['Technician', 'Minutes', 'Depot'] + [j.name for j in jobs])
+    dist = distances if isinstance(distances, DistanceMatrix) else DistanceMatrix.from_dict(distances)
+    upper = np.where(np.triu(np.ones(dist.array.shape, dtype=bool), 1), dist.array, np.nan)
+    df_locations = pd.DataFrame(upper, index=dist.names, columns=dist.names)
+    df_customers = pd.DataFrame([[j.name, j.loc, j.job.name, j.time_start, j.time_end, j.time_due] for j in custs],
+                                columns=['Customer', 'Location', 'Job type', 'Start', 'End', 'Due'])
+    with pd.ExcelWriter(path) as writer:
+        df_techs.to_excel(writer, sheet_name='Technicians', index=False)
+        df_locations.to_excel(writer, sheet_name='Locations')
+        df_customers.to_excel(writer, sheet_name='Customers', index=False)
+
+
+if __name__ == '__main__':
+    print_scen("A clustered instance with 20 customers, 6 technicians and 2 depots")
+    techs, jobs, custs, dist = generate_instance(20, 6)
+    for j in custs[:5]:
+        print(j)
+    print(dist)
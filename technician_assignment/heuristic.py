@@ -0,0 +1,155 @@
+from gurobipy import GRB
+import time
+
+from technician_assignment.routing import (
+    RoutingSolution, base_scenario, build_trs0, load_start, print_scen, solve_trs0
+)
+
+
+# A fast construction heuristic for TRS0: priority-ordered cheapest insertion.
+#
+# Customers are taken by decreasing priority (ties broken by the earliest window end). Each one
+# is inserted at the position, over all qualified technicians' routes, that adds the least
+# travel time while keeping every stop within its time window and the technician within
+# capacity. Customers that fit nowhere are left unfilled. The result is a complete solution
+# that can be loaded as a MIP start, or used on its own when there is no time to solve the MIP.
+
+
+def schedule(route, technician, distances):
+    # Earliest start times along the route, or None if a window or the capacity is violated,
+    # or the technician could not be back at the depot by t = 600 after a job
+    times = []
+    cur, now, used = technician.depot, 0, 0
+    for j in route:
+        now = max(now + distances[cur, j.loc], j.time_start)
+        if now > j.time_end or now + j.job.duration + distances[j.loc, technician.depot] > 600:
+            return None
+        times.append(now)
+        used += distances[cur, j.loc] + j.job.duration
+        now += j.job.duration
+        cur = j.loc
+    used += distances[cur, technician.depot]
+    return times if used <= technician.cap else None
+
+
+def insertion_cost(route, pos, j, technician, distances):
+    prev = route[pos - 1].loc if pos > 0 else technician.depot
+    nxt = route[pos].loc if pos < len(route) else technician.depot
+    return distances[prev, j.loc] + distances[j.loc, nxt] - distances[prev, nxt]
+
+
+def best_insertion(j, routes, techs, distances):
+    best = None
+    for k in techs:
+        if k.name not in [t.name for t in j.job.covered_by]:
+            continue
+        route = routes[k.name]
+        for pos in range(len(route) + 1):
+            cost = insertion_cost(route, pos, j, k, distances)
+            if best is not None and cost >= best[0]:
+                continue
+            if schedule(route[:pos] + [j] + route[pos:], k, distances) is not None:
+                best = (cost, k.name, pos)
+    return best
+
+
+def to_solution(routes, techs, custs, distances):
+    assigned = {j.name: None for j in custs}
+    start = {j.loc: j.time_start for j in custs}
+    start.update({k.depot: 0 for k in techs})
+    for k in techs:
+        for j, t in zip(routes[k.name], schedule(routes[k.name], k, distances)):
+            assigned[j.name] = k.name
+            start[j.loc] = t
+    return RoutingSolution(assigned, start, routes)
+
+
+def insertion_heuristic(techs, custs, distances, time_limit=None):
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    routes = {k.name: [] for k in techs}
+    for j in sorted(custs, key=lambda c: (-c.job.priority, c.time_end, c.name)):
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+        best = best_insertion(j, routes, techs, distances)
+        if best is not None:
+            _, k, pos = best
+            routes[k].insert(pos, j)
+    return to_solution(routes, techs, custs, distances)
+
+
+# Used on its own, the heuristic keeps improving its solution until the time budget runs out:
+# every customer in turn is taken out of its route and put back at its cheapest position, and
+# unfilled customers are tried again once the routes have changed.
+
+
+def solve_heuristic(techs, custs, distances, time_limit=10):
+    deadline = time.perf_counter() + time_limit
+    sol = insertion_heuristic(techs, custs, distances, time_limit)
+    routes = sol.routes
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for k in techs:
+            for j in list(routes[k.name]):
+                if time.perf_counter() > deadline:
+                    break
+                pos = routes[k.name].index(j)
+                cost = insertion_cost(routes[k.name][:pos] + routes[k.name][pos + 1:], pos, j, k, distances)
+                routes[k.name].pop(pos)
+                best = best_insertion(j, routes, techs, distances)
+                # (None: j fits nowhere else, e.g. where it was is the only place it fits)
+                if best is not None and best[0] < cost - 1e-9:
+                    improved = True
+                else:
+                    best = (cost, k.name, pos)
+                routes[best[1]].insert(best[2], j)
+        unfilled = [j for j in custs if all(j not in route for route in routes.values())]
+        for j in sorted(unfilled, key=lambda c: (-c.job.priority, c.time_end, c.name)):
+            best = best_insertion(j, routes, techs, distances)
+            if best is not None:
+                routes[best[1]].insert(best[2], j)
+                improved = True
+    return to_solution(routes, techs, custs, distances)
+
+
+# Time to first incumbent, with and without the heuristic's MIP start
+
+
+def time_to_first_incumbent(techs, custs, distances, start=None):
+    rm = build_trs0(techs, custs, distances)
+    if start is not None:
+        load_start(rm, start, techs)
+    first = []
+
+    def callback(model, where):
+        if where == GRB.Callback.MIPSOL and not first:
+            first.append(model.cbGet(GRB.Callback.RUNTIME))
+
+    rm.m.Params.OutputFlag = 0
+    rm.m.optimize(callback)
+    result = (first[0] if first else None, rm.m.Runtime, rm.m.ObjVal if rm.m.SolCount else None)
+    rm.m.dispose()
+    return result
+
+
+def compare_warm_start(techs, custs, distances):
+    heuristic_start = time.perf_counter()
+    sol = insertion_heuristic(techs, custs, distances)
+    heuristic_time = time.perf_counter() - heuristic_start
+    unfilled = list(sol.assigned.values()).count(None)
+    print(f"Heuristic: {heuristic_time:.3f}s, {unfilled} unfilled jobs")
+    for name, start in (('cold', None), ('warm', sol)):
+        first, total, obj = time_to_first_incumbent(techs, custs, distances, start)
+        if first is None:
+            print(f"{name}: no incumbent found")
+        else:
+            print(f"{name}: first incumbent after {first:.3f}s, solved in {total:.3f}s, objective {obj}")
+
+
+if __name__ == '__main__':
+    technicians, customers, dist = (base_scenario()[name] for name in ('technicians', 'customers', 'dist'))
+    print_scen("Comparing cold and heuristic warm starts")
+    compare_warm_start(technicians, customers, dist)
+
+    print_scen("Solving base scenario model from the heuristic's solution")
+    solve_trs0(technicians, customers, dist, start=insertion_heuristic(technicians, customers, dist))
@@ -0,0 +1,154 @@
+import gurobipy as gp
+import hashlib
+import inspect
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
+
+import cache
+from technician_assignment import routing
+from technician_assignment.data import DistanceMatrix
+from technician_assignment.routing import RoutingModel, build_trs0, print_scen
+
+
+# Cache of built models.
+#
+# A model is stored as <key>.mps.bz2 together with <key>.json, which records, for every family
+# of variables or constraints (x, u, y, ..., assign_to_job, ...), its keys and the positions of
+# its variables or constraints in the model. Reloading reads the model with `gp.read` and
+# rebuilds the tupledicts from those positions. (Names are not relied on: as soon as one name
+# contains a space, e.g. t[Freiburg im Breisgau], the MPS file is written with generic names. The
+# usual gurobipy names are set again on the reloaded model.)
+#
+# The key is a hash of the normalized inputs of the build -- the technicians, the customers and
+# their jobs as plain values, the travel time matrix, the builder and its options -- so any
+# change to the data gives another key and a fresh build. The builder is hashed by the source
+# of its module and of `routing` (time_bounds, usable_arcs), so editing the formulation also
+# gives new keys (as does any other edit to those modules: a spurious rebuild, not a stale model). `cached(build)` wraps a builder with
+# the signature of `routing.build_trs0` (and `routing_matrix.build_trs0_matrix`) into one that
+# reuses the stored model when the key matches, and can be passed to `solve_trs0` as `build`.
+#
+# Parameters are not part of the model file; they are set on the model after it is built or
+# loaded, as before.
+
+model_dir = None   # default: 'models' in the data cache (see `cache`)
+_version = 1    # of the stored layout, part of every key
+
+
+def _directory(directory):
+    return directory or model_dir or os.path.join(cache.cache_dir, 'models')
+
+
+def input_key(*parts):
+    # Hash of plain values (lists, dicts, numbers, strings) and NumPy arrays
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            h.update(f"{part.dtype}{part.shape}".encode())
+            h.update(np.ascontiguousarray(part).tobytes())
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=repr).encode())
+    return h.hexdigest()
+
+
+def builder_source(build):
+    modules = sorted({inspect.getmodule(build), routing}, key=lambda module: module.__name__)
+    return [inspect.getsource(module) for module in modules]
+
+
+def trs0_key(techs, custs, distances, build, tighten):
+    dist = distances if isinstance(distances, DistanceMatrix) else DistanceMatrix.from_dict(distances)
+    return input_key(
+        [_version, build.__module__, build.__name__, tighten],
+        builder_source(build),
+        [[k.name, k.cap, k.depot] for k in techs],
+        [[j.name, j.loc, j.job.name, j.job.priority, j.job.duration, [k.name for k in j.job.covered_by],
+          j.time_start, j.time_end, j.time_due] for j in custs],
+        dist.names, dist.array
+    )
+
+
+def save_model(key, m, families, directory=None):
+    # families: name -> tupledict of Var or of Constr
+    directory = _directory(directory)
+    os.makedirs(directory, exist_ok=True)
+    m.update()
+    layout = {}
+    for name, family in families.items():
+        items = list(family.items())
+        kind = 'constr' if items and isinstance(items[0][1], gp.Constr) else 'var'
+        layout[name] = {'kind': kind, 'keys': [k for k, _ in items], 'index': [v.index for _, v in items]}
+    tmp = tempfile.mkdtemp(dir=directory, prefix='.tmp-')
+    try:
+        m.write(os.path.join(tmp, 'model.mps.bz2'))
+        with open(os.path.join(tmp, 'layout.json'), 'w') as f:
+            json.dump(layout, f)
+        # (the model first, so that a layout file always has its model)
+        os.replace(os.path.join(tmp, 'model.mps.bz2'), os.path.join(directory, f"{key}.mps.bz2"))
+        os.replace(os.path.join(tmp, 'layout.json'), os.path.join(directory, f"{key}.json"))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_model(key, env=None, directory=None, name=None):
+    # (m, families), or None if the model is not in the cache
+    directory = _directory(directory)
+    layout_file = os.path.join(directory, f"{key}.json")
+    if not os.path.exists(layout_file):
+        return None
+    with open(layout_file) as f:
+        layout = json.load(f)
+    m = gp.read(os.path.join(directory, f"{key}.mps.bz2"), env=env)
+    if name is not None:
+        m.ModelName = name
+    all_vars, all_constrs = m.getVars(), m.getConstrs()
+    families = {}
+    var_items, constr_items = [], []
+    for family, entry in layout.items():
+        keys = [tuple(k) if isinstance(k, list) else k for k in entry['keys']]
+        items = all_constrs if entry['kind'] == 'constr' else all_vars
+        members = [items[i] for i in entry['index']]
+        families[family] = gp.tupledict(zip(keys, members))
+        names = [f"{family}[{','.join(map(str, k)) if isinstance(k, tuple) else k}]" for k in keys]
+        (constr_items if entry['kind'] == 'constr' else var_items).append((members, names))
+    for members, names in var_items:
+        m.setAttr('VarName', members, names)
+    for members, names in constr_items:
+        m.setAttr('ConstrName', members, names)
+    m.update()
+    return m, families
+
+
+# TRS0 builder with the cache in front
+
+
+def cached(build=build_trs0, directory=None):
+    def cached_build(techs, custs, distances, tighten=True, env=None):
+        key = trs0_key(techs, custs, distances, build, tighten)
+        loaded = load_model(key, env, directory, name='trs0')
+        if loaded is not None:
+            m, f = loaded
+            constrs = {name: family for name, family in f.items() if name not in ('x', 'u', 'y', 't', 'g')}
+            return RoutingModel(m, f['x'], f['u'], f['y'], f['t'], f['g'], gp.tuplelist(f['y'].keys()), constrs)
+        rm = build(techs, custs, distances, tighten=tighten, env=env)
+        save_model(key, rm.m, {'x': rm.x, 'u': rm.u, 'y': rm.y, 't': rm.t, 'g': rm.g, **(rm.constrs or {})},
+                   directory)
+        return rm
+
+    cached_build.__name__ = f"cached({build.__name__})"
+    return cached_build
+
+
+if __name__ == '__main__':
+    from technician_assignment.generator import generate_instance
+
+    print_scen("Building and reloading TRS0 for a generated instance")
+    techs, _, custs, dist = generate_instance(40, 8, seed=1)
+    for attempt in ('build', 'reload'):
+        start = time.perf_counter()
+        rm = cached(build_trs0)(techs, custs, dist)
+        rm.m.update()
+        print(f"{attempt}: {time.perf_counter() - start:.3f}s, {rm.m.NumVars} variables, {rm.m.NumConstrs} constraints")
@@ -1,10 +1,16 @@
 from gurobipy import GRB
 import gurobipy as gp
+import os
 import pandas as pd
-import sys
+
+from technician_assignment.data import locations, read_columnar
+from technician_assignment.timing import solution_timing
+from telemetry import SolveTrace
 
 
 class Technician:
+    __slots__ = ('name', 'cap', 'depot')
+
     def __init__(self, name, cap, depot):
         self.name = name
         self.cap = cap
@@ -15,6 +21,8 @@ class Technician:
 
 
 class Job:
+    __slots__ = ('name', 'priority', 'duration', 'covered_by')
+
     def __init__(self, name, priority, duration, covered_by):
         self.name = name
         self.priority = priority
@@ -28,6 +36,8 @@ class Job:
 
 
 class Customer:
+    __slots__ = ('name', 'loc', 'job', 'time_start', 'time_end', 'time_due')
+
     def __init__(self, name, loc, job, time_start, time_end, time_due):
         self.name = name
         self.loc = loc
@@ -41,49 +51,73 @@ class Customer:
         return f"Customer: {self.name}\n  Location: {self.loc}\n  Job: {self.job.name}\n  Priority: {self.job.priority}\n  Duration: {self.job.duration}\n  Covered by: {covered_by}\n  Start time: {self.time_start}\n  End time: {self.time_end}\n  Due time: {self.time_due}\n"
 
 
+class RoutingModel:
+    def __init__(self, m, x, u, y, t, g, arcs, constrs=None):
+        self.m = m
+        self.x = x
+        self.u = u
+        self.y = y
+        self.t = t
+        self.g = g
+        self.arcs = arcs
+        self.constrs = constrs  # constraint family name -> tupledict of constraints
+
+    def __str__(self):
+        return f"Routing model: {self.m.ModelName}\n  Variables: {self.m.NumVars}\n  Arcs: {len(self.arcs)}"
+
+
 # Read Excel workbook
-excel_file = 'https://raw.githubusercontent.com/decision-spot/technician_assignment/main/data-Sce0.xlsx'
-df = pd.read_excel(excel_file, sheet_name='Technicians')
-df = df.rename(columns={df.columns[0]: 'name', df.columns[1]: 'cap', df.columns[2]: 'depot'})
-df1 = df.drop(df.columns[3:], axis=1).drop(df.index[[0, 1]])
+# A scenario workbook has three sheets: Technicians (capacity, depot and the jobs each
+# technician is qualified for, below a priority and a duration row), Locations (upper
+# triangle of travel times) and Customers.
+# The sheets are read into columnar tables (see `data.read_columnar`); the Technician, Job and
+# Customer objects are built from those, and the distances are a `DistanceMatrix`.
+
+
+def read_workbook(excel_file):
+    return entities(read_columnar(excel_file))
+
+
+def entities(data):
+    techs, jobs, custs, dist = data.technicians, data.jobs, data.customers, data.dist
+
+    # Create Technician objects
+    technicians = [Technician(name, cap, dist.names[depot])
+                   for name, cap, depot in zip(techs.names, techs.cap.tolist(), techs.depot.tolist())]
+
+    # Create Job objects, each with the technicians qualified for it
+    job_list = [Job(name, priority, duration, [t for t, ok in zip(technicians, techs.skills[:, i]) if ok])
+                for i, (name, priority, duration)
+                in enumerate(zip(jobs.names, jobs.priority.tolist(), jobs.duration.tolist()))]
 
-# Create Technician objects
-technicians = [Technician(*row) for row in df1.itertuples(index=False, name=None)]
+    # Create Customer objects using the corresponding Job object
+    customers = [Customer(name, dist.names[loc], job_list[job], a, b, due)
+                 for name, loc, job, a, b, due
+                 in zip(custs.names, custs.loc.tolist(), custs.job.tolist(), custs.time_start.tolist(),
+                        custs.time_end.tolist(), custs.time_due.tolist())]
 
-# Read job data
-jobs = []
-for j in range(3, len(df.columns)):
-    covered_by = [t for i, t in enumerate(technicians) if df.iloc[2 + i, j] == 1]
-    this_job = Job(df.iloc[2:, j].name, df.iloc[0, j], df.iloc[1, j], covered_by)
-    jobs.append(this_job)
+    return technicians, job_list, customers, dist
 
-# Read location data
-df_locations = pd.read_excel(excel_file, sheet_name='Locations', index_col=0)  # , skiprows=1, index_col=0)
 
-# Extract locations and initialize distance dictionary
-locations = df_locations.index
-dist = {(l, l): 0 for l in locations}
+# The base scenario is read the first time it is used (`routing.technicians`, `from routing import
+# customers`, ...), not when the module is imported, so that the model can be built and solved on
+# other data without a network connection. The workbook is read through the data cache (see
+# `cache`): after the first download it is loaded from disk, also in offline mode.
+
+excel_file = 'https://raw.githubusercontent.com/decision-spot/technician_assignment/main/data-Sce0.xlsx'
+_base_scenario = {}
 
-# Populate distance dictionary
-for i, l1 in enumerate(locations):
-    for j, l2 in enumerate(locations):
-        if i < j:
-            dist[l1, l2] = df_locations.iloc[i, j]
-            dist[l2, l1] = dist[l1, l2]
 
-# Read customer data
-df_customers = pd.read_excel(excel_file, sheet_name='Customers')
-customers = []
-for i, c in enumerate(df_customers.iloc[:, 0]):
-    job_name = df_customers.iloc[i, 2]
+def base_scenario():
+    if not _base_scenario:
+        _base_scenario.update(zip(['technicians', 'jobs', 'customers', 'dist'], read_workbook(excel_file)))
+    return _base_scenario
 
-    # Find the corresponding Job object
-    matching_job = next((job for job in jobs if job.name == job_name), None)
 
-    if matching_job is not None:
-        # Create Customer object using corresponding Job object
-        this_customer = Customer(c, df_customers.iloc[i, 1], matching_job, *df_customers.iloc[i, 3:])
-        customers.append(this_customer)
+def __getattr__(name):
+    if name in ('technicians', 'jobs', 'customers', 'dist'):
+        return base_scenario()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # To determine the latest times for a technician to arrive at a customer location and
@@ -98,41 +132,88 @@ for i, c in enumerate(df_customers.iloc[:, 0]):
 # to reach the depot location after completing all the assigned jobs by time t = 600.
 
 
-def get_latest_times(custs, technician):
+def get_latest_times(custs, technician, distances=None):
+    if distances is None:
+        distances = base_scenario()['dist']
     latest = dict()
-    d = dist[custs[-1].loc, technician.depot]  # distance back to the depot
+    d = distances[custs[-1].loc, technician.depot]  # distance back to the depot
     prev_latest = min(custs[-1].time_end, 600 - d - custs[-1].job.duration)
     latest[custs[-1].loc] = prev_latest
     for i in range(len(custs) - 2, -1, -1):
-        d = dist[custs[i].loc, custs[i + 1].loc]
+        d = distances[custs[i].loc, custs[i + 1].loc]
         latest_end = min(prev_latest - d - custs[i].job.duration, custs[i].time_end)
         latest[custs[i].loc] = latest_end
         prev_latest = latest_end
     return latest
 
 
-# We added another function `create_excel_output` inside the `solve_trs0` function to store
-# the solution of the problem in two tables: **routes** and **orders**.
-
-
-def solve_trs0(techs, custs, distances):
+# Most of the |L|^2 * |K| possible arcs can never be travelled: a technician leaves from and
+# returns to his/her own depot, only visits customers whose job he/she is qualified for, and
+# cannot go from i to j if j's time window closes before the job at i can be finished and the
+# technician has driven to j. Only the remaining (i, j, k) arcs get a routing variable.
+
+
+def usable_arcs(techs, custs, distances):
+    arcs = []
+    for k in techs:
+        covered = [j for j in custs if k.name in [t.name for t in j.job.covered_by]]
+        for j in covered:
+            if distances[k.depot, j.loc] <= j.time_end:
+                arcs.append((k.depot, j.loc, k.name))
+            arcs.append((j.loc, k.depot, k.name))
+        for i in covered:
+            for j in covered:
+                if i.loc != j.loc and i.time_start + i.job.duration + distances[i.loc, j.loc] <= j.time_end:
+                    arcs.append((i.loc, j.loc, k.name))
+    return gp.tuplelist(dict.fromkeys(arcs))
+
+
+# Tighter bounds on the start times make for a much stronger LP relaxation than the blanket
+# 0 <= t <= 600. A customer's job cannot start before its window opens, nor after its window
+# closes or so late that the technician can no longer be back at the (nearest qualified) depot
+# by t = 600 -- the same reasoning as in `get_latest_times`. Depots (and locations without a
+# customer) can always be left at t = 0. The big-M of each temporal constraint then only has to
+# cover the actual range of the two start times involved:
+#   M[i, j] = ub[i] + p[i] + tau[i, j] - lb[j]
+# which is exactly the original 600 + p[i] + tau[i, j] for the blanket bounds.
+
+
+def time_bounds(techs, custs, distances, tighten=True):
+    L = locations(distances)
+    if not tighten:
+        return {l: 0 for l in L}, {l: 600 for l in L}
+    lb = {l: 0 for l in L}
+    ub = {l: 0 for l in L}
+    for j in custs:
+        back = min([distances[j.loc, k.depot] for k in j.job.covered_by], default=0)
+        latest = 600 - j.job.duration - back
+        lb[j.loc] = j.time_start
+        ub[j.loc] = min(j.time_end, max(j.time_start, latest))
+    return lb, ub
+
+
+# `build_trs0` builds the TRS0 model with the usual gurobipy term-by-term API;
+# `routing_matrix.build_trs0_matrix` builds the same model with the matrix API.
+# Either can be handed to `solve_trs0`.
+
+
+def build_trs0(techs, custs, distances, tighten=True, env=None):
     # Build useful data structures
     K = [k.name for k in techs]
     C = [j.name for j in custs]
-    J = [j.loc for j in custs]
-    L = list(set([l[0] for l in distances.keys()]))
+    L = locations(distances)
     D = list(set([t.depot for t in techs]))
     cap = {k.name: k.cap for k in techs}
     loc = {j.name: j.loc for j in custs}
     depot = {k.name: k.depot for k in techs}
-    can_cover = {j.name: [k.name for k in j.job.covered_by] for j in custs}
+    can_cover = {j.name: [k.name for k in j.job.covered_by if k.name in cap] for j in custs}
     dur = {j.name: j.job.duration for j in custs}
     time_start = {j.name: j.time_start for j in custs}
     time_end = {j.name: j.time_end for j in custs}
     priority = {j.name: j.job.priority for j in custs}
 
     # Create model
-    m = gp.Model('trs0')
+    m = gp.Model('trs0', env=env)
     
     # Decision variables
     # Customer-technician assignment
@@ -141,34 +222,30 @@ def solve_trs0(techs, custs, distances):
     # Technician assignment
     u = m.addVars(K, vtype=GRB.BINARY, name='u')
     
-    # Edge-route assignment to technician
-    y = m.addVars(L, L, K, vtype=GRB.BINARY, name='y')
-    
-    # Technician cannot leave or return to a depot that is not its base
-    for k in technicians:
-        for d in D:
-            if k.depot != d:
-                for i in L:
-                    y[i, d, k.name].ub = 0
-                    y[d, i, k.name].ub = 0
+    # Edge-route assignment to technician, only over the arcs that can be used
+    arcs = usable_arcs(techs, custs, distances)
+    pairs = set((i, j) for i, j, _ in arcs)
+    y = m.addVars(arcs, vtype=GRB.BINARY, name='y')
     
     # Start time of service
-    t = m.addVars(L, ub=600, name='t')
+    t_lb, t_ub = time_bounds(techs, custs, distances, tighten)
+    t = m.addVars(L, lb=[t_lb[l] for l in L], ub=[t_ub[l] for l in L], name='t')
     
     # Unfilled jobs
     g = m.addVars(C, vtype=GRB.BINARY, name='g')
     
     # Constraints
+    constrs = {}
 
     # A technician must be assigned to a job, or a gap is declared (1)
-    m.addConstrs(
+    constrs['assign_to_job'] = m.addConstrs(
         (gp.quicksum(x[j, k] for k in can_cover[j]) + g[j] == 1
          for j in C),
         name='assign_to_job'
     )
 
     # At most one technician can be assigned to a job (2)
-    m.addConstrs(
+    constrs['assign_one'] = m.addConstrs(
         (x.sum(j, '*') <= 1 for j in C),
         name='assign_one'
     )
@@ -176,22 +253,22 @@ def solve_trs0(techs, custs, distances):
     # Technician capacity constraints (3)
     cap_lhs = {
         k: gp.quicksum(dur[j] * x[j, k] for j in C)
-           + gp.quicksum(dist[i, j] * y[i, j, k] for i in L for j in L)
+           + gp.quicksum(distances[i, j] * y[i, j, k] for i, j, _ in arcs.select('*', '*', k))
         for k in K
     }
-    m.addConstrs(
+    constrs['tech_capacity'] = m.addConstrs(
         (cap_lhs[k] <= cap[k] * u[k] for k in K),
         name='tech_capacity'
     )
     
     # Technician tour constraints (4 and 5)
-    m.addConstrs(
+    constrs['tech_tour_1'] = m.addConstrs(
         (y.sum('*', loc[j], k) == x[j, k]
          for k in K
          for j in C),
         name='tech_tour_1'
     )
-    m.addConstrs(
+    constrs['tech_tour_2'] = m.addConstrs(
         (y.sum(loc[j], '*', k) == x[j, k]
          for k in K
          for j in C),
@@ -199,49 +276,52 @@ def solve_trs0(techs, custs, distances):
     )
     
     # Same depot constraints (6 and 7)
-    m.addConstrs(
-        (gp.quicksum(y[j, depot[k], k] for j in J) == u[k]
+    constrs['same_depot_1'] = m.addConstrs(
+        (y.sum('*', depot[k], k) == u[k]
          for k in K),
         name='same_depot_1'
     )
-    m.addConstrs(
-        (gp.quicksum(y[depot[k], j, k] for j in J) == u[k]
+    constrs['same_depot_2'] = m.addConstrs(
+        (y.sum(depot[k], '*', k) == u[k]
          for k in K),
         name='same_depot_2'
     )
     
     # Temporal constraints (8) for customer locations
-    M = {(i, j): 600 + dur[i] + dist[loc[i], loc[j]]
+    # (without any arc from i to j, or with M <= 0, the constraint is redundant, so it is skipped)
+    M = {(i, j): t_ub[loc[i]] + dur[i] + distances[loc[i], loc[j]] - t_lb[loc[j]]
          for i in C
          for j in C}
-    m.addConstrs(
+    constrs['tempo_customer'] = m.addConstrs(
         (t[loc[j]]
          >=
          t[loc[i]]
          + dur[i]
-         + dist[loc[i], loc[j]]
-         - M[i, j] * (1 - gp.quicksum(y[loc[i], loc[j], k] for k in K))
+         + distances[loc[i], loc[j]]
+         - M[i, j] * (1 - y.sum(loc[i], loc[j], '*'))
          for i in C
-         for j in C),
+         for j in C
+         if (loc[i], loc[j]) in pairs and M[i, j] > 0),
         name='tempo_customer')
     
     # Temporal constraints (8) for depot locations
-    M = {(i, j): 600 + dist[i, loc[j]]
+    M = {(i, j): t_ub[i] + distances[i, loc[j]] - t_lb[loc[j]]
          for i in D
          for j in C}
-    m.addConstrs(
+    constrs['tempo_depot'] = m.addConstrs(
         (t[loc[j]]
          >=
          t[i]
-         + dist[i, loc[j]]
+         + distances[i, loc[j]]
          - M[i, j] * (1 - y.sum(i, loc[j], '*'))
          for i in D
-         for j in C),
+         for j in C
+         if (i, loc[j]) in pairs and M[i, j] > 0),
         name='tempo_depot')
     
     # Time window constraints (9 and 10)
-    m.addConstrs((t[loc[j]] >= time_start[j] for j in C), name='time_window_a')
-    m.addConstrs((t[loc[j]] <= time_end[j] for j in C), name='time_window_b')
+    constrs['time_window_a'] = m.addConstrs((t[loc[j]] >= time_start[j] for j in C), name='time_window_a')
+    constrs['time_window_b'] = m.addConstrs((t[loc[j]] <= time_end[j] for j in C), name='time_window_b')
     
     # Objective function
     M = 6100
@@ -249,132 +329,260 @@ def solve_trs0(techs, custs, distances):
         gp.quicksum(M * priority[j] * g[j] for j in C)
         + gp.quicksum(0.01 * M * t[k] for k in L),
         GRB.MINIMIZE)
-    
-    m.write('TRS0.lp')
-    m.optimize()
-    
-    status = m.Status
-    if status in [GRB.INF_OR_UNBD, GRB.INFEASIBLE, GRB.UNBOUNDED]:
-        print('Model is either infeasible or unbounded.')
-        sys.exit(0)
-    elif status != GRB.OPTIMAL:
-        print('Optimization terminated with status {}'.format(status))
-        sys.exit(0)
-    
-    ### Print results
+
+    return RoutingModel(m, x, u, y, t, g, arcs, constrs)
+
+
+# The solution is read back from the model in one pass: a single bulk `getAttr` call fetches the
+# values of all y, x, t and g variables, and each technician's route is recovered from a successor
+# map (location -> next location) built from the arcs in use. The printed report, utilization and
+# the routes/orders tables are all produced from the resulting `RoutingSolution`.
+
+
+class RoutingSolution:
+    def __init__(self, assigned, start, routes, objective=None):
+        self.assigned = assigned    # customer name -> technician name, None if unfilled
+        self.start = start          # location -> start time of service
+        self.routes = routes        # technician name -> customers in visiting order
+        self.objective = objective
+
+    def __str__(self):
+        used = [k for k, route in self.routes.items() if route]
+        return f"Routing solution:\n  Routes: {len(used)}\n  Unfilled: {list(self.assigned.values()).count(None)}"
+
+
+def extract_solution(rm, techs, custs):
+    families = [rm.y, rm.x, rm.t, rm.g]
+    values = iter(rm.m.getAttr('X', [v for f in families for v in f.values()]))
+    y, x, t, g = [{key: next(values) for key in f.keys()} for f in families]
+
+    assigned = {j.name: None for j in custs}
+    for (j, k), val in x.items():
+        if val > 0.5 and g[j] < 0.5:
+            assigned[j] = k
+
+    succ = {k.name: {} for k in techs}
+    for (i, j, k), val in y.items():
+        if val > 0.5:
+            succ[k][i] = j
+    at_loc = {j.loc: j for j in custs}
+    routes = {}
+    for k in techs:
+        route = []
+        cur = succ[k.name].get(k.depot, k.depot)
+        while cur != k.depot:
+            route.append(at_loc[cur])
+            cur = succ[k.name][cur]
+        routes[k.name] = route
+    return RoutingSolution(assigned, t, routes, rm.m.ObjVal)
+
+
+def print_solution(sol, techs, custs, distances):
     # Assignments
-    for j in customers:
-        if g[j.name].X > 0.5:
-            job_str = 'Nobody assigned to {} ({}) in {}'.format(j.name, j.job.name, j.loc)
+    for j in custs:
+        k = sol.assigned[j.name]
+        if k is None:
+            print('Nobody assigned to {} ({}) in {}'.format(j.name, j.job.name, j.loc))
         else:
-            for k in K:
-                if x[j.name, k].X > 0.5:
-                    job_str = f"{k} assigned to {j.name} ({j.job.name}) in {j.loc}. Start at t={t[j.loc].X:.2f}."
-        print(job_str)
+            print(f"{k} assigned to {j.name} ({j.job.name}) in {j.loc}. Start at t={sol.start[j.loc]:.2f}.")
 
     # Technicians
-    for k in technicians:
-        if u[k.name].X > 0.5:
+    for k in techs:
+        if sol.routes[k.name]:
             cur = k.depot
             route = k.depot
-            while True:
-                for j in customers:
-                    if y[cur, j.loc, k.name].X > 0.5:
-                        route += (f" -> {j.loc} (dist={dist[cur, j.loc]}, t={t[j.loc].X:.2f},"
-                                  f" proc={j.job.duration}, a={time_start[j.name]}, b={time_end[j.name]})")
-                        cur = j.loc
-                for i in D:
-                    if y[cur,i,k.name].X > 0.5:
-                        route += ' -> {} (dist={})'.format(i,dist[cur, i])
-                        cur = i
-                        break
-                if cur == k.depot:
-                    break
+            for j in sol.routes[k.name]:
+                route += (f" -> {j.loc} (dist={distances[cur, j.loc]}, t={sol.start[j.loc]:.2f},"
+                          f" proc={j.job.duration}, a={j.time_start}, b={j.time_end})")
+                cur = j.loc
+            route += ' -> {} (dist={})'.format(k.depot, distances[cur, k.depot])
             print("{}'s route: {}".format(k.name, route))
         else:
             print('{} is not used'.format(k.name))
 
-
     # Utilization
-    for k in K:
-        used = cap_lhs[k].getValue()
-        total = cap[k]
-        util = used / cap[k] if cap[k] > 0 else 0
-        print("{}'s utilization is {:.2%} ({:.2f}/{:.2f})".format(k, util, used, cap[k]))
-    total_used = sum(cap_lhs[k].getValue() for k in K)
-    total_cap = sum(cap[k] for k in K)
+    total_used, total_cap = 0, 0
+    for k in techs:
+        used = route_travel_time(sol.routes[k.name], k, distances) + sum(j.job.duration for j in sol.routes[k.name])
+        util = used / k.cap if k.cap > 0 else 0
+        print("{}'s utilization is {:.2%} ({:.2f}/{:.2f})".format(k.name, util, used, k.cap))
+        total_used += used
+        total_cap += k.cap
     total_util = total_used / total_cap if total_cap > 0 else 0
     print('Total technician utilization is {:.2%} ({:.2f}/{:.2f})'.format(total_util, total_used, total_cap))
 
-    def create_excel_output():
-        routes_cols = [
-            'Route ID', 'Technician Name', 'Origin Location', 'Total Travel Time',
-            'Total Processing Time', 'Total Time', 'Earliest Start Time', 'Latest Start Time',
-            'Earliest End Time', 'Latest End Time', 'Num Jobs'
-        ]
-        routes_list = []
-        orders_cols = [
-            'Route ID', 'Stop Number', 'Customer Name', 'Technician Name', 'Location Name',
-            'Job type', 'Processing Time', 'Customer Time Window Start',
-            'Customer Time Window End', 'Earliest Start', 'Latest Start', 'Earliest End',
-            'Latest End'
-        ]
-        route_id = 0
-        orders_list = []
-        for k in technicians:
-            if u[k.name].X > 0.5:
-                customers_list = []
-                route_id += 1
-                total_distance, total_travel_time, total_processing_time = 0, 0, 0
-                current = k.depot
-                while True:
-                    for j in customers:
-                        if y[current, j.loc, k.name].X > 0.5:
-                            total_travel_time += dist[current, j.loc]
-                            total_distance += dist[current, j.loc]
-                            total_processing_time += j.job.duration
-                            customers_list.append(j)
-                            current = j.loc
-                    for i in D:
-                        if y[current, i, k.name].X > 0.5:
-                            total_travel_time += dist[current, i]
-                            total_distance += dist[current, i]
-                            current = i
-                            break
-                    if current == k.depot:
-                        break
-                latest = get_latest_times(customers_list, k)
-
-                # append customers to the list of orders
-                for i, j in enumerate(customers_list):
-                    orders_list.append(
-                        [route_id, i + 1, j.name, k.name, j.loc, j.job.name,
-                         j.job.duration, time_start[j.name], time_end[j.name],
-                         t[j.loc].X, latest[j.loc],
-                         t[j.loc].X + j.job.duration, latest[j.loc] + j.job.duration])
-
-                # append route to routes list
-                earliest_start_route = t[customers_list[0].loc].X - dist[k.depot, customers_list[0].loc]
-                latest_start_route = latest[customers_list[0].loc] - dist[k.depot, customers_list[0].loc]
-                earliest_end_route = t[customers_list[-1].loc].X + customers_list[-1].job.duration + \
-                                     dist[customers_list[-1].loc, k.depot]
-                latest_end_route = latest[customers_list[-1].loc] + customers_list[-1].job.duration + \
-                                   dist[customers_list[-1].loc, k.depot]
-
-                routes_list.append([route_id, k.name, k.depot, total_travel_time, total_processing_time,
-                                    earliest_end_route - earliest_start_route, earliest_start_route,
-                                    latest_start_route, earliest_end_route, latest_end_route, len(customers_list)])
-        # Convert to dataframe and write to excel
-        routes_df = pd.DataFrame.from_records(routes_list, columns=routes_cols)
-        routes_df.to_csv('routes.csv', index=False)
-        orders_df = pd.DataFrame.from_records(orders_list, columns=orders_cols)
-        orders_df.to_csv('orders.csv', index=False)
-
-    # create output files
-    create_excel_output()
+
+def route_travel_time(route, technician, distances):
+    stops = [technician.depot] + [j.loc for j in route] + [technician.depot]
+    return sum(distances[stops[i], stops[i + 1]] for i in range(len(stops) - 1)) if route else 0
+
+
+# A known solution (e.g. from a construction heuristic) can be handed to Gurobi as a MIP start.
+# Every variable gets a Start value, so Gurobi does not have to complete a partial solution.
+
+
+def load_start(rm, sol, techs):
+    depot = {k.name: k.depot for k in techs}
+    on_route = set()
+    for k, route in sol.routes.items():
+        if route:
+            stops = [depot[k]] + [j.loc for j in route] + [depot[k]]
+            on_route.update((stops[i], stops[i + 1], k) for i in range(len(stops) - 1))
+    starts = ([1 if sol.assigned[j] == k else 0 for j, k in rm.x.keys()]
+              + [1 if sol.routes[k] else 0 for k in rm.u.keys()]
+              + [1 if arc in on_route else 0 for arc in rm.y.keys()]
+              + [sol.start.get(l, 0) for l in rm.t.keys()]
+              + [1 if sol.assigned[j] is None else 0 for j in rm.g.keys()])
+    variables = [v for f in [rm.x, rm.u, rm.y, rm.t, rm.g] for v in f.values()]
+    rm.m.setAttr('Start', variables, starts)
+
+
+# The function `create_excel_output` stores the solution of the problem in two tables:
+# **routes** and **orders**.
+
+
+def create_excel_output(sol, techs, distances, output_dir='.'):
+    routes_cols = [
+        'Route ID', 'Technician Name', 'Origin Location', 'Total Travel Time',
+        'Total Processing Time', 'Total Time', 'Earliest Start Time', 'Latest Start Time',
+        'Earliest End Time', 'Latest End Time', 'Num Jobs'
+    ]
+    routes_list = []
+    orders_cols = [
+        'Route ID', 'Stop Number', 'Customer Name', 'Technician Name', 'Location Name',
+        'Job type', 'Processing Time', 'Customer Time Window Start',
+        'Customer Time Window End', 'Earliest Start', 'Latest Start', 'Earliest End',
+        'Latest End'
+    ]
+    route_id = 0
+    orders_list = []
+    t = sol.start
+    # Latest start times and travel times of all routes at once
+    timing = solution_timing(sol, techs, [j for k in techs for j in sol.routes[k.name]], distances)
+    for r, k in enumerate(techs):
+        customers_list = sol.routes[k.name]
+        if customers_list:
+            route_id += 1
+            travel = timing.travel[r]
+            latest = timing.latest[r]
+            total_travel_time = travel.sum() + timing.back[r]
+            total_processing_time = sum(j.job.duration for j in customers_list)
+
+            # append customers to the list of orders
+            for i, j in enumerate(customers_list):
+                orders_list.append(
+                    [route_id, i + 1, j.name, k.name, j.loc, j.job.name,
+                     j.job.duration, j.time_start, j.time_end,
+                     t[j.loc], latest[i],
+                     t[j.loc] + j.job.duration, latest[i] + j.job.duration])
+
+            # append route to routes list
+            n = len(customers_list)
+            earliest_start_route = t[customers_list[0].loc] - travel[0]
+            latest_start_route = latest[0] - travel[0]
+            earliest_end_route = t[customers_list[-1].loc] + customers_list[-1].job.duration + timing.back[r]
+            latest_end_route = latest[n - 1] + customers_list[-1].job.duration + timing.back[r]
+
+            routes_list.append([route_id, k.name, k.depot, total_travel_time, total_processing_time,
+                                earliest_end_route - earliest_start_route, earliest_start_route,
+                                latest_start_route, earliest_end_route, latest_end_route, n])
+    # Convert to dataframe and write to excel
+    routes_df = pd.DataFrame.from_records(routes_list, columns=routes_cols)
+    routes_df.to_csv(os.path.join(output_dir, 'routes.csv'), index=False)
+    orders_df = pd.DataFrame.from_records(orders_list, columns=orders_cols)
+    orders_df.to_csv(os.path.join(output_dir, 'orders.csv'), index=False)
+
+
+# `solve_trs0` returns the solution (None if there is none), so that a caller solving many
+# scenarios can carry on with the next one. With `env`, the model is built in that Gurobi
+# environment, which is left for the caller to dispose of; `params` are set on the model.
+# A solve stopped by a time limit still reports its best solution.
+#
+# The build, solve, extraction and output stages and the progress of the solve are traced (see
+# `telemetry.SolveTrace`); pass a trace to add stages of the caller's own (e.g. reading the data)
+# and `trace_dir` to write it to TRS0-<run id>.json/.csv there. The model is written to TRS0.lp
+# only with `write_lp` (for debugging). Building through `model_cache.cached(build_trs0)` reuses a
+# stored model for the same inputs.
+
+
+def solve_trs0(techs, custs, distances, build=build_trs0, start=None, env=None, params=None, output_dir='.',
+               trace=None, trace_dir=None, write_lp=False):
+    trace = trace or SolveTrace('TRS0')
+    with trace.stage('build'):
+        rm = build(techs, custs, distances, env=env)
+    n_arcs = len(locations(distances)) ** 2 * len(techs)
+    print(f"Built model with {build.__name__} in {trace.stages['build']:.3f}s, "
+          f"using {len(rm.arcs)} of {n_arcs} possible arcs")
+    m = rm.m
+    for name, value in (params or {}).items():
+        m.setParam(name, value)
+    if start is not None:
+        load_start(rm, start, techs)
+
+    if write_lp:
+        with trace.stage('write'):
+            m.write(os.path.join(output_dir, 'TRS0.lp'))
+    trace.optimize(m)
+    
+    status = m.Status
+    sol = None
+    if status in [GRB.INF_OR_UNBD, GRB.INFEASIBLE, GRB.UNBOUNDED]:
+        print('Model is either infeasible or unbounded.')
+    elif status != GRB.OPTIMAL and m.SolCount == 0:
+        print('Optimization terminated with status {}'.format(status))
+    else:
+        if status != GRB.OPTIMAL:
+            print('Optimization terminated with status {}, reporting the best solution found'.format(status))
+
+        ### Print results
+        with trace.stage('extract'):
+            sol = extract_solution(rm, techs, custs)
+        print_solution(sol, techs, custs, distances)
+
+        # create output files
+        with trace.stage('output'):
+            create_excel_output(sol, techs, distances, output_dir)
 
     m.dispose()
-    gp.disposeDefaultEnv()
+    if env is None:
+        gp.disposeDefaultEnv()
+    print(trace)
+    if trace_dir is not None:
+        trace.save(trace_dir)
+    return sol
+
+
+# Node count and root gap of the model with the blanket bounds and big-Ms, and with the
+# tightened ones
+
+
+def root_and_nodes(rm):
+    root = []
+
+    def callback(model, where):
+        if where == GRB.Callback.MIPNODE and model.cbGet(GRB.Callback.MIPNODE_NODCNT) == 0:
+            root.append((model.cbGet(GRB.Callback.MIPNODE_OBJBST), model.cbGet(GRB.Callback.MIPNODE_OBJBND)))
+
+    rm.m.update()
+    relaxed = rm.m.relax()
+    relaxed.Params.OutputFlag = 0
+    relaxed.optimize()
+    lp_bound = relaxed.ObjVal
+    relaxed.dispose()
+    rm.m.Params.OutputFlag = 0
+    rm.m.optimize(callback)
+    best, bound = root[-1] if root else (rm.m.ObjVal, rm.m.ObjBound)
+    root_gap = abs(best - bound) / abs(best) if best < GRB.INFINITY and best != 0 else float('inf')
+    return lp_bound, root_gap, rm.m.NodeCount, rm.m.Runtime, rm.m.ObjVal
+
+
+def compare_tightening(techs, custs, distances, build=build_trs0):
+    for tighten in (False, True):
+        rm = build(techs, custs, distances, tighten=tighten)
+        lp_bound, root_gap, nodes, runtime, obj = root_and_nodes(rm)
+        print(f"{'Tightened' if tighten else 'Original'} bounds: LP bound {lp_bound:.2f}, root gap {root_gap:.2%}, "
+              f"{nodes:.0f} nodes, {runtime:.3f}s, objective {obj:.2f}")
+        rm.m.dispose()
 
 
 def print_scen(scen_str):
@@ -384,6 +592,11 @@ def print_scen(scen_str):
 
 if __name__ == '__main__':
     # Base model
+    trace = SolveTrace('TRS0')
+    with trace.stage('load'):
+        technicians, customers, dist = (base_scenario()[name] for name in ('technicians', 'customers', 'dist'))
     print_scen("Solving base scenario model")
-    solve_trs0(technicians, customers, dist)
+    # (imported here, as the model cache uses this module)
+    from technician_assignment.model_cache import cached
+    solve_trs0(technicians, customers, dist, build=cached(build_trs0), trace=trace, trace_dir='traces')
 
@@ -0,0 +1,218 @@
+from gurobipy import GRB
+import gurobipy as gp
+import numpy as np
+import scipy.sparse as sp
+import time
+
+from technician_assignment.data import distance_array, locations
+from technician_assignment.routing import (
+    RoutingModel, base_scenario, build_trs0, time_bounds, usable_arcs
+)
+
+
+# The same TRS0 model as `routing.build_trs0`, built with gurobipy's matrix API.
+#
+# All variables live in one MVar, laid out as [x | u | y | t | g]. Every constraint family is
+# assembled as a sparse coefficient matrix over that MVar from NumPy arrays of durations,
+# windows and distances, and added with a single `addMConstr` call. Variables and constraints
+# get the same names as in `build_trs0`, so the two models can be compared name by name.
+
+
+def build_trs0_matrix(techs, custs, distances, tighten=True, env=None):
+    # Index sets
+    K = [k.name for k in techs]
+    C = [j.name for j in custs]
+    L = locations(distances)
+    D = list(set([t.depot for t in techs]))
+    nK, nC, nL = len(K), len(C), len(L)
+    k_idx = {k: i for i, k in enumerate(K)}
+    l_idx = {l: i for i, l in enumerate(L)}
+
+    # Data as arrays
+    cap = np.array([k.cap for k in techs], dtype=float)
+    depot = np.array([l_idx[k.depot] for k in techs])
+    loc = np.array([l_idx[j.loc] for j in custs])
+    dur = np.array([j.job.duration for j in custs], dtype=float)
+    time_start = np.array([j.time_start for j in custs], dtype=float)
+    time_end = np.array([j.time_end for j in custs], dtype=float)
+    priority = np.array([j.job.priority for j in custs], dtype=float)
+    covers = np.array([[k in [t.name for t in j.job.covered_by] for k in K] for j in custs], dtype=bool)
+    t_lb, t_ub = time_bounds(techs, custs, distances, tighten)
+    t_lb = np.array([t_lb[l] for l in L], dtype=float)
+    t_ub = np.array([t_ub[l] for l in L], dtype=float)
+    tau = distance_array(distances, L)
+
+    arcs = usable_arcs(techs, custs, distances)
+    nA = len(arcs)
+    a_from = np.array([l_idx[i] for i, _, _ in arcs], dtype=int)
+    a_to = np.array([l_idx[j] for _, j, _ in arcs], dtype=int)
+    a_tech = np.array([k_idx[k] for _, _, k in arcs], dtype=int)
+
+    # Variable layout
+    x_off = 0
+    u_off = x_off + nC * nK
+    y_off = u_off + nK
+    t_off = y_off + nA
+    g_off = t_off + nL
+    n = g_off + nC
+    x_col = x_off + np.arange(nC)[:, None] * nK + np.arange(nK)[None, :]
+
+    lb = np.zeros(n)
+    ub = np.ones(n)
+    lb[t_off:g_off] = t_lb
+    ub[t_off:g_off] = t_ub
+    vtype = np.full(n, GRB.BINARY)
+    vtype[t_off:g_off] = GRB.CONTINUOUS
+    M = 6100
+    obj = np.zeros(n)
+    obj[t_off:g_off] = 0.01 * M
+    obj[g_off:] = M * priority
+
+    m = gp.Model('trs0', env=env)
+    v = m.addMVar(n, lb=lb, ub=ub, obj=obj, vtype=vtype)
+    m.ModelSense = GRB.MINIMIZE
+    names = ([f"x[{j},{k}]" for j in C for k in K]
+             + [f"u[{k}]" for k in K]
+             + [f"y[{i},{j},{k}]" for i, j, k in arcs]
+             + [f"t[{l}]" for l in L]
+             + [f"g[{j}]" for j in C])
+    m.setAttr('VarName', v.tolist(), names)
+
+    constrs = {}
+
+    def add_family(rows, cols, vals, nrows, sense, rhs, name, keys):
+        A = sp.csr_matrix((vals, (rows, cols)), shape=(nrows, n))
+        family = m.addMConstr(A, v, sense, rhs).tolist()
+        m.setAttr('ConstrName', family,
+                  [f"{name}[{','.join(map(str, key)) if isinstance(key, tuple) else key}]" for key in keys])
+        constrs[name] = gp.tupledict(zip(keys, family))
+
+    # A technician must be assigned to a job, or a gap is declared (1)
+    cj, ck = np.nonzero(covers)
+    add_family(np.concatenate([cj, np.arange(nC)]),
+               np.concatenate([x_col[cj, ck], g_off + np.arange(nC)]),
+               np.ones(len(cj) + nC), nC, GRB.EQUAL, np.ones(nC), 'assign_to_job', C)
+
+    # At most one technician can be assigned to a job (2)
+    add_family(np.repeat(np.arange(nC), nK), x_col.ravel(), np.ones(nC * nK),
+               nC, GRB.LESS_EQUAL, np.ones(nC), 'assign_one', C)
+
+    # Technician capacity constraints (3)
+    add_family(np.concatenate([np.tile(np.arange(nK), nC), a_tech, np.arange(nK)]),
+               np.concatenate([x_col.ravel(), y_off + np.arange(nA), u_off + np.arange(nK)]),
+               np.concatenate([np.repeat(dur, nK), tau[a_from, a_to], -cap]),
+               nK, GRB.LESS_EQUAL, np.zeros(nK), 'tech_capacity', K)
+
+    # Technician tour constraints (4 and 5): one row per (k, j), over arcs entering/leaving loc[j]
+    at_loc = sp.csr_matrix((np.ones(nC), (loc, np.arange(nC))), shape=(nL, nC))
+    tour_keys = [(k, j) for k in K for j in C]
+    for name, end in (('tech_tour_1', a_to), ('tech_tour_2', a_from)):
+        incidence = sp.csr_matrix((np.ones(nA), (np.arange(nA), end)), shape=(nA, nL)) @ at_loc
+        arc, cust = incidence.nonzero()
+        add_family(np.concatenate([a_tech[arc] * nC + cust, (np.arange(nK)[:, None] * nC + np.arange(nC)).ravel()]),
+                   np.concatenate([y_off + arc, x_col.T.ravel()]),
+                   np.concatenate([np.ones(len(arc)), -np.ones(nK * nC)]),
+                   nK * nC, GRB.EQUAL, np.zeros(nK * nC), name, tour_keys)
+
+    # Same depot constraints (6 and 7)
+    for name, end in (('same_depot_1', a_to), ('same_depot_2', a_from)):
+        arc = np.nonzero(end == depot[a_tech])[0]
+        add_family(np.concatenate([a_tech[arc], np.arange(nK)]),
+                   np.concatenate([y_off + arc, u_off + np.arange(nK)]),
+                   np.concatenate([np.ones(len(arc)), -np.ones(nK)]),
+                   nK, GRB.EQUAL, np.zeros(nK), name, K)
+
+    # Temporal constraints (8): t[to] - t[from] - M * sum_k y[from, to, k] >= p + tau - M,
+    # one row per (from, to) pair that has at least one arc and M > 0
+    pair_code = a_from * nL + a_to
+    order = np.argsort(pair_code, kind='stable')
+    sorted_codes = pair_code[order]
+
+    def add_tempo(frm, to, p, name, keys):
+        # frm/to are location indices of each candidate row; keep those with arcs
+        code = frm * nL + to
+        big_m = t_ub[frm] + p + tau[frm, to] - t_lb[to]
+        keep = np.isin(code, sorted_codes) & (big_m > 0)
+        frm, to, p, code, big_m = frm[keep], to[keep], p[keep], code[keep], big_m[keep]
+        keys = [key for key, k in zip(keys, keep) if k]
+        first = np.searchsorted(sorted_codes, code, side='left')
+        count = np.searchsorted(sorted_codes, code, side='right') - first
+        rows = np.repeat(np.arange(len(code)), count)
+        arc = order[np.repeat(first - np.cumsum(count) + count, count) + np.arange(count.sum())]
+        add_family(np.concatenate([np.arange(len(code)), np.arange(len(code)), rows]),
+                   np.concatenate([t_off + to, t_off + frm, y_off + arc]),
+                   np.concatenate([np.ones(len(code)), -np.ones(len(code)), -big_m[rows]]),
+                   len(code), GRB.GREATER_EQUAL, p + tau[frm, to] - big_m, name, keys)
+
+    ci, cj = np.repeat(np.arange(nC), nC), np.tile(np.arange(nC), nC)
+    add_tempo(loc[ci], loc[cj], dur[ci], 'tempo_customer', [(C[i], C[j]) for i, j in zip(ci, cj)])
+    d_loc = np.array([l_idx[d] for d in D], dtype=int)
+    di, dj = np.repeat(np.arange(len(D)), nC), np.tile(np.arange(nC), len(D))
+    add_tempo(d_loc[di], loc[dj], np.zeros(len(di)), 'tempo_depot', [(D[i], C[j]) for i, j in zip(di, dj)])
+
+    # Time window constraints (9 and 10)
+    add_family(np.arange(nC), t_off + loc, np.ones(nC), nC, GRB.GREATER_EQUAL, time_start, 'time_window_a', C)
+    add_family(np.arange(nC), t_off + loc, np.ones(nC), nC, GRB.LESS_EQUAL, time_end, 'time_window_b', C)
+
+    m.update()
+    var = v.tolist()
+    x = gp.tupledict(zip([(j, k) for j in C for k in K], var[x_off:u_off]))
+    u = gp.tupledict(zip(K, var[u_off:y_off]))
+    y = gp.tupledict(zip(arcs, var[y_off:t_off]))
+    t = gp.tupledict(zip(L, var[t_off:g_off]))
+    g = gp.tupledict(zip(C, var[g_off:]))
+    return RoutingModel(m, x, u, y, t, g, arcs, constrs)
+
+
+# Two models are the same if they have the same variables (type, bounds, objective), the same
+# constraints (sense, right-hand side) and the same coefficients, matched up by name.
+
+
+def same_model(m1, m2):
+    m1.update()
+    m2.update()
+    v1, v2 = m1.getVars(), m2.getVars()
+    c1, c2 = m1.getConstrs(), m2.getConstrs()
+    vn1, vn2 = m1.getAttr('VarName', v1), m2.getAttr('VarName', v2)
+    cn1, cn2 = m1.getAttr('ConstrName', c1), m2.getAttr('ConstrName', c2)
+    if sorted(vn1) != sorted(vn2) or sorted(cn1) != sorted(cn2):
+        return False
+    # vp/cp put the variables/constraints of m1 in the order of m2
+    vp = np.argsort(vn1)[np.argsort(np.argsort(vn2))]
+    cp = np.argsort(cn1)[np.argsort(np.argsort(cn2))]
+    for attr in ('VType', 'LB', 'UB', 'Obj'):
+        a1 = np.array(m1.getAttr(attr, v1))[vp]
+        a2 = np.array(m2.getAttr(attr, v2))
+        if not (np.array_equal(a1, a2) if attr == 'VType' else np.allclose(a1, a2)):
+            return False
+    for attr in ('Sense', 'RHS'):
+        a1 = np.array(m1.getAttr(attr, c1))[cp]
+        a2 = np.array(m2.getAttr(attr, c2))
+        if not (np.array_equal(a1, a2) if attr == 'Sense' else np.allclose(a1, a2)):
+            return False
+    A1 = m1.getA().tocsr()[cp][:, vp]
+    A2 = m2.getA().tocsr()
+    return m1.ModelSense == m2.ModelSense and (A1 - A2).count_nonzero() == 0
+
+
+def compare_builds(techs, custs, distances):
+    times = {}
+    models = {}
+    for build in (build_trs0, build_trs0_matrix):
+        start = time.perf_counter()
+        models[build.__name__] = build(techs, custs, distances).m
+        models[build.__name__].update()
+        times[build.__name__] = time.perf_counter() - start
+    for name, seconds in times.items():
+        m = models[name]
+        print(f"{name}: {seconds:.3f}s ({m.NumVars} variables, {m.NumConstrs} constraints, {m.NumNZs} nonzeros)")
+    same = same_model(models['build_trs0'], models['build_trs0_matrix'])
+    print('Models are the same' if same else 'Models differ')
+    for m in models.values():
+        m.dispose()
+    return times, same
+
+
+if __name__ == '__main__':
+    technicians, customers, dist = (base_scenario()[name] for name in ('technicians', 'customers', 'dist'))
+    compare_builds(technicians, customers, dist)
@@ -0,0 +1,295 @@
+from gurobipy import GRB
+import collections
+import copy
+import gurobipy as gp
+import time
+
+from technician_assignment.heuristic import best_insertion, schedule, to_solution
+from technician_assignment.routing import (
+    Customer, base_scenario, build_trs0, extract_solution, load_start, print_scen, print_solution,
+    time_bounds
+)
+
+
+# A long-lived TRS0 model for same-day re-planning.
+#
+# The session builds the model once and then applies changes to it in place: customers cancel
+# (their variables are fixed to "unfilled" at no cost) or are added (new variables, arcs and
+# constraints), time windows change (bounds, right-hand sides and the affected temporal
+# constraints), and technicians become unavailable or available again (bound on u). Stops that
+# have already started are fixed in the model. Each re-solve is warm started from the previous
+# solution, patched for the changes made since: cancelled customers are taken out of their
+# routes, routes that no longer fit are cut short, and unfilled customers are inserted where
+# they fit.
+#
+# The session keeps the caller's distances (e.g. a `DistanceMatrix`) as they are; travel times
+# given for new customers are kept in an override dict layered over them.
+
+M = 6100
+
+
+class RoutingSession:
+    def __init__(self, techs, custs, distances, env=None, params=None):
+        self.techs = list(techs)
+        self.custs = {j.name: copy.copy(j) for j in custs}
+        self.distances = collections.ChainMap({}, distances)    # overrides, then the caller's distances
+        self.removed = set()
+        self.disabled = set()
+        self.started = set()
+        self.solution = None
+        self.rm = build_trs0(self.techs, list(self.custs.values()), distances, env=env)
+        for name, value in (params or {}).items():
+            self.rm.m.setParam(name, value)
+
+    def __str__(self):
+        return (f"Routing session: {len(self.custs) - len(self.removed)} customers, "
+                f"{len(self.techs) - len(self.disabled)} technicians, {len(self.started)} started stops")
+
+    def active_customers(self):
+        return [j for name, j in self.custs.items() if name not in self.removed]
+
+    def active_technicians(self):
+        return [k for k in self.techs if k.name not in self.disabled]
+
+    def model_distances(self):
+        # The caller's distances as they are while nothing has been added over them
+        return self.distances if self.distances.maps[0] else self.distances.maps[1]
+
+    # Deltas
+
+    def remove_customer(self, name):
+        if name in self.started:
+            raise ValueError(f"Service at {name} has already started")
+        j = self.custs[name]
+        for k in self.techs:
+            self.rm.x[name, k.name].ub = 0
+        self.rm.g[name].lb = 1
+        self.rm.g[name].Obj = 0
+        self.rm.t[j.loc].Obj = 0
+        self.removed.add(name)
+        if self.solution is not None:
+            for k, route in self.solution.routes.items():
+                self.solution.routes[k] = [c for c in route if c.name != name]
+
+    def add_customer(self, customer, distances=None):
+        if customer.name in self.custs:
+            raise ValueError(f"Customer {customer.name} already exists")
+        self.distances.update(distances or {})     # (into the overrides)
+        j = copy.copy(customer)
+        self.custs[j.name] = j
+        rm, m, constrs = self.rm, self.rm.m, self.rm.constrs
+        lb, ub = self.bounds(j)
+
+        for k in self.techs:
+            rm.x[j.name, k.name] = m.addVar(vtype=GRB.BINARY, name=f"x[{j.name},{k.name}]")
+        rm.g[j.name] = m.addVar(vtype=GRB.BINARY, obj=M * j.job.priority, name=f"g[{j.name}]")
+        if j.loc not in rm.t:
+            rm.t[j.loc] = m.addVar(lb=lb, ub=ub, obj=0.01 * M, name=f"t[{j.loc}]")
+        else:
+            rm.t[j.loc].lb, rm.t[j.loc].ub = lb, ub
+
+        can_cover = [k.name for k in j.job.covered_by]
+        constrs['assign_to_job'][j.name] = m.addConstr(
+            gp.quicksum(rm.x[j.name, k] for k in can_cover) + rm.g[j.name] == 1, name=f"assign_to_job[{j.name}]")
+        constrs['assign_one'][j.name] = m.addConstr(
+            rm.x.sum(j.name, '*') <= 1, name=f"assign_one[{j.name}]")
+        for k in self.techs:
+            m.chgCoeff(constrs['tech_capacity'][k.name], rm.x[j.name, k.name], j.job.duration)
+            for family, arcs in (('tech_tour_1', rm.y.select('*', j.loc, k.name)),
+                                 ('tech_tour_2', rm.y.select(j.loc, '*', k.name))):
+                constrs[family][k.name, j.name] = m.addConstr(
+                    gp.quicksum(arcs) == rm.x[j.name, k.name], name=f"{family}[{k.name},{j.name}]")
+        constrs['time_window_a'][j.name] = m.addConstr(rm.t[j.loc] >= j.time_start, name=f"time_window_a[{j.name}]")
+        constrs['time_window_b'][j.name] = m.addConstr(rm.t[j.loc] <= j.time_end, name=f"time_window_b[{j.name}]")
+        self.add_arcs(j)
+
+    def change_window(self, name, time_start, time_end):
+        if name in self.started:
+            raise ValueError(f"Service at {name} has already started")
+        j = self.custs[name]
+        j.time_start, j.time_end = time_start, time_end
+        lb, ub = self.bounds(j)
+        self.rm.t[j.loc].lb, self.rm.t[j.loc].ub = lb, ub
+        self.rm.constrs['time_window_a'][name].RHS = time_start
+        self.rm.constrs['time_window_b'][name].RHS = time_end
+        self.add_arcs(j)
+
+    def disable_technician(self, name):
+        if self.solution is not None and any(self.solution.assigned[j] == name for j in self.started):
+            raise ValueError(f"{name} has already started a job")
+        self.rm.u[name].ub = 0
+        self.disabled.add(name)
+        if self.solution is not None:
+            self.solution.routes[name] = []
+
+    def enable_technician(self, name):
+        self.rm.u[name].ub = 1
+        self.disabled.discard(name)
+
+    def fix_started(self, now):
+        # Fix every stop of the current plan whose service has started by time `now`,
+        # together with the arcs leading up to it
+        rm = self.rm
+        for k in self.techs:
+            cur = k.depot
+            for j in self.solution.routes[k.name]:
+                if self.solution.start[j.loc] > now:
+                    break
+                rm.y[cur, j.loc, k.name].lb = 1
+                rm.x[j.name, k.name].lb = 1
+                rm.t[j.loc].lb = rm.t[j.loc].ub = self.solution.start[j.loc]
+                self.started.add(j.name)
+                cur = j.loc
+
+    # Model maintenance
+
+    def bounds(self, j):
+        lb, ub = time_bounds(self.techs, [j], {(j.loc, k.depot): self.distances[j.loc, k.depot]
+                                               for k in j.job.covered_by})
+        return lb[j.loc], ub[j.loc]
+
+    def add_arcs(self, j):
+        # Add the arcs to and from j that its time window now allows, and rebuild the temporal
+        # constraints of all location pairs involving j
+        rm, m, d = self.rm, self.rm.m, self.distances
+        for k in j.job.covered_by:
+            depot = k.depot
+            new = [(j.loc, depot, k.name)]
+            if d[depot, j.loc] <= j.time_end:
+                new.append((depot, j.loc, k.name))
+            for i in self.active_customers():
+                if i.loc != j.loc and k.name in [t.name for t in i.job.covered_by]:
+                    if i.time_start + i.job.duration + d[i.loc, j.loc] <= j.time_end:
+                        new.append((i.loc, j.loc, k.name))
+                    if j.time_start + j.job.duration + d[j.loc, i.loc] <= i.time_end:
+                        new.append((j.loc, i.loc, k.name))
+            for a, b, kk in new:
+                if (a, b, kk) in rm.y:
+                    continue
+                var = m.addVar(vtype=GRB.BINARY, name=f"y[{a},{b},{kk}]")
+                rm.y[a, b, kk] = var
+                rm.arcs.append((a, b, kk))
+                m.chgCoeff(rm.constrs['tech_capacity'][kk], var, d[a, b])
+                for c in self.custs.values():
+                    if c.loc == b:
+                        m.chgCoeff(rm.constrs['tech_tour_1'][kk, c.name], var, 1)
+                    if c.loc == a:
+                        m.chgCoeff(rm.constrs['tech_tour_2'][kk, c.name], var, 1)
+                if b == depot:
+                    m.chgCoeff(rm.constrs['same_depot_1'][kk], var, 1)
+                if a == depot:
+                    m.chgCoeff(rm.constrs['same_depot_2'][kk], var, 1)
+        # The big-Ms below are read from the (possibly just changed) bounds of t
+        m.update()
+        for i in self.custs.values():
+            if i.loc != j.loc:
+                self.set_tempo('tempo_customer', (i.name, j.name), i.loc, j.loc, i.job.duration)
+                self.set_tempo('tempo_customer', (j.name, i.name), j.loc, i.loc, j.job.duration)
+        for depot in set(k.depot for k in self.techs):
+            self.set_tempo('tempo_depot', (depot, j.name), depot, j.loc, 0)
+
+    def set_tempo(self, family, key, frm, to, p):
+        rm, m = self.rm, self.rm.m
+        old = rm.constrs[family].pop(key, None)
+        if old is not None:
+            m.remove(old)
+        arcs = rm.y.select(frm, to, '*')
+        big_m = rm.t[frm].ub + p + self.distances[frm, to] - rm.t[to].lb
+        if arcs and big_m > 0:
+            rm.constrs[family][key] = m.addConstr(
+                rm.t[to] >= rm.t[frm] + p + self.distances[frm, to] - big_m * (1 - gp.quicksum(arcs)),
+                name=f"{family}[{key[0]},{key[1]}]")
+
+    # Solving
+
+    def warm_start(self):
+        # The previous routes without cancelled customers and disabled technicians, cut short
+        # where they no longer fit, with unfilled customers inserted where they fit
+        techs = self.active_technicians()
+        routes = {k.name: [] for k in self.techs}
+        for k in techs:
+            for j in self.solution.routes[k.name]:
+                if j.name not in self.removed:
+                    j = self.custs[j.name]
+                    if schedule(routes[k.name] + [j], k, self.distances) is not None:
+                        routes[k.name].append(j)
+                    elif j.name in self.started:
+                        return None
+        routed = set(j.name for route in routes.values() for j in route)
+        for j in sorted(self.active_customers(), key=lambda c: (-c.job.priority, c.time_end)):
+            if j.name not in routed:
+                best = best_insertion(j, routes, techs, self.distances)
+                if best is not None:
+                    routes[best[1]].insert(best[2], j)
+        return to_solution(routes, self.techs, list(self.custs.values()), self.distances)
+
+    def solve(self):
+        start = time.perf_counter()
+        if self.solution is not None:
+            warm = self.warm_start()
+            if warm is not None:
+                load_start(self.rm, warm, self.techs)
+        self.rm.m.optimize()
+        if self.rm.m.SolCount > 0:
+            self.solution = extract_solution(self.rm, self.techs, list(self.custs.values()))
+        return time.perf_counter() - start
+
+    def close(self):
+        self.rm.m.dispose()
+
+
+# Re-plan latency of the session against a cold solve of the same changed instance: a new
+# model without the cancelled customers, with the same technicians disabled and the same
+# started stops fixed, solved from scratch
+
+
+def cold_solve(session):
+    start = time.perf_counter()
+    rm = build_trs0(session.techs, session.active_customers(), session.model_distances())
+    for k in session.disabled:
+        rm.u[k].ub = 0
+    for j in session.started:
+        rm.x[j, session.solution.assigned[j]].lb = 1
+        loc = session.custs[j].loc
+        rm.t[loc].lb = rm.t[loc].ub = session.solution.start[loc]
+    rm.m.Params.OutputFlag = 0
+    rm.m.optimize()
+    objective = rm.m.ObjVal if rm.m.SolCount else None
+    rm.m.dispose()
+    return time.perf_counter() - start, objective
+
+
+def replan(session):
+    warm = session.solve()
+    cold, objective = cold_solve(session)
+    print(f"Re-planned in {warm:.3f}s, objective {session.rm.m.ObjVal:.2f} "
+          f"(cold solve: {cold:.3f}s, objective {objective:.2f})")
+
+
+if __name__ == '__main__':
+    technicians, customers, dist = (base_scenario()[name] for name in ('technicians', 'customers', 'dist'))
+    print_scen("Morning plan")
+    session = RoutingSession(technicians, customers, dist, params={'OutputFlag': 0})
+    print(f"Solved in {session.solve():.3f}s")
+    print_solution(session.solution, technicians, session.active_customers(), session.distances)
+
+    print_scen("t=180 -- Customer7 cancels, Customer5 moves its window, a new customer calls in")
+    session.fix_started(180)
+    session.remove_customer('Customer7')
+    session.change_window('Customer5', 300, 420)
+    # A new location needs its travel times; Rastatt is taken to be 10 minutes further than
+    # Baden-Baden from everywhere
+    near = 'Baden-Baden'
+    new = {('Rastatt', 'Rastatt'): 0, ('Rastatt', near): 10, (near, 'Rastatt'): 10}
+    for (a, b), d in dist.items():
+        if a == near and b != near:
+            new['Rastatt', b] = new[b, 'Rastatt'] = d + 10
+    session.add_customer(Customer('Customer8', 'Rastatt', customers[2].job, 240, 360, 420), new)
+    replan(session)
+    print_solution(session.solution, technicians, session.active_customers(), session.distances)
+
+    print_scen("t=240 -- Gina calls in sick")
+    session.disable_technician('Gina')
+    replan(session)
+    print_solution(session.solution, technicians, session.active_customers(), session.distances)
+    session.close()
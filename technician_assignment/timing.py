@@ -0,0 +1,127 @@
+import numpy as np
+
+from technician_assignment.data import RoutingData
+
+
+# Route timing for many routes at once.
+#
+# Routes are given as a padded array of customer indices (one row per route, -1 after the last
+# stop) together with the index of each route's technician, over the tables of a
+# `RoutingData`. One forward pass over the stop positions gives, for every stop of every route,
+# the arrival time, the earliest start (arrival or window start, whichever is later) and the
+# waiting time in between; one backward pass gives the latest start that still lets every
+# later stop start within its window and the technician be back at the depot by the end of the
+# day (the same recursion as `routing.get_latest_times`). Each pass is a loop over positions,
+# not over routes, so thousands of routes cost about as much as one.
+#
+# With `latest_start` (one per customer), a stop's latest start is only bounded by that value
+# and by the later stops, not by the return to the technician's own depot: the rule of TRS0,
+# whose start times are bounded by `routing.time_bounds` (window end, and the return to the
+# nearest qualified depot) and which has no temporal constraint on the way back.
+#
+# A stop's slack is latest - earliest start: how far its job can be pushed back without
+# breaking the route. A route is feasible if no stop's earliest start is after its latest
+# start and its travel plus processing time fits the technician's capacity -- the same checks
+# as `heuristic.schedule`.
+
+
+class RouteTiming:
+    def __init__(self, valid, arrival, earliest, latest, travel, back, used, cap):
+        self.valid = valid          # route x position: is there a stop?
+        self.arrival = arrival      # arrival time at the stop when leaving every stop as early as possible
+        self.earliest = earliest    # earliest start of service
+        self.latest = latest        # latest start of service
+        self.slack = latest - earliest
+        self.waiting = earliest - arrival
+        self.travel = travel        # travel time to the stop from the previous one (or the depot)
+        self.back = back            # travel time from the last stop back to the depot, per route
+        self.used = used            # travel and processing time, per route
+        self.stop_feasible = ~valid | (self.slack >= 0)
+        self.feasible = self.stop_feasible.all(axis=1) & (used <= cap)
+
+    def __str__(self):
+        return (f"Route timing: {len(self.feasible)} routes, {int(self.valid.sum())} stops, "
+                f"{int(self.feasible.sum())} feasible")
+
+    def can_push(self, minutes):
+        # route x position: can the job at this stop start `minutes` later than its earliest start?
+        return self.valid & (self.slack >= minutes)
+
+
+def pad_routes(routes):
+    # Ragged lists of customer indices -> padded array
+    stops = np.full((len(routes), max([1] + [len(r) for r in routes])), -1, dtype=int)
+    for r, route in enumerate(routes):
+        stops[r, :len(route)] = route
+    return stops
+
+
+def route_timing(stops, tech, data, horizon=600, latest_start=None):
+    stops = np.asarray(stops, dtype=int)
+    tech = np.asarray(tech, dtype=int)
+    valid = stops >= 0
+    n_routes, n_pos = stops.shape
+    length = valid.sum(axis=1)
+    if not valid.any():
+        # No stops at all (e.g. every job unfilled): nothing to time, and perhaps no customers
+        empty = np.full((n_routes, n_pos), np.nan)
+        return RouteTiming(valid, empty, empty.copy(), empty.copy(), np.zeros((n_routes, n_pos)),
+                           np.zeros(n_routes), np.zeros(n_routes), data.technicians.cap[tech])
+
+    # Stop data, with the padding pointing at customer 0 and masked out below
+    c = np.where(valid, stops, 0)
+    loc = data.customers.loc[c]
+    dur = np.where(valid, data.jobs.duration[data.customers.job[c]], 0).astype(float)
+    a = data.customers.time_start[c].astype(float)
+    b = (data.customers.time_end if latest_start is None else np.asarray(latest_start))[c].astype(float)
+    depot = data.technicians.depot[tech]
+    tau = data.dist.array
+    prev = np.concatenate([depot[:, None], loc[:, :-1]], axis=1)
+    travel = np.where(valid, tau[prev, loc], 0).astype(float)
+    last = np.maximum(length - 1, 0)
+    back = np.where(length > 0, tau[loc[np.arange(n_routes), last], depot], 0).astype(float)
+
+    # Forward: arrival and earliest start
+    arrival = np.full((n_routes, n_pos), np.nan)
+    earliest = np.full((n_routes, n_pos), np.nan)
+    ready = np.zeros(n_routes)
+    for s in range(n_pos):
+        arrival[:, s] = ready + travel[:, s]
+        earliest[:, s] = np.maximum(arrival[:, s], a[:, s])
+        ready = np.where(valid[:, s], earliest[:, s] + dur[:, s], ready)
+
+    # Backward: latest start
+    latest = np.full((n_routes, n_pos), np.nan)
+    leave_by = horizon - back if latest_start is None else np.full(n_routes, np.inf)
+    for s in range(n_pos - 1, -1, -1):
+        latest[:, s] = np.minimum(b[:, s], leave_by - dur[:, s])
+        leave_by = np.where(valid[:, s], latest[:, s] - travel[:, s], leave_by)
+    arrival[~valid] = earliest[~valid] = latest[~valid] = np.nan
+
+    used = travel.sum(axis=1) + dur.sum(axis=1) + back
+    return RouteTiming(valid, arrival, earliest, latest, travel, back, used, data.technicians.cap[tech])
+
+
+def solution_timing(sol, techs, custs, distances, horizon=600):
+    # Timing of the routes of a `RoutingSolution`, one row per technician (in the order of techs)
+    data = RoutingData.from_entities(techs, custs, distances)
+    index = {j.name: i for i, j in enumerate(custs)}
+    stops = pad_routes([[index[j.name] for j in sol.routes[k.name]] for k in techs])
+    return route_timing(stops, np.arange(len(techs)), data, horizon)
+
+
+if __name__ == '__main__':
+    # (imported here, as routing itself uses this module)
+    from technician_assignment.heuristic import insertion_heuristic
+    from technician_assignment.routing import print_scen, technicians, customers, dist
+
+    print_scen("Which jobs of the heuristic's routes can start 30 minutes later?")
+    sol = insertion_heuristic(technicians, customers, dist)
+    timing = solution_timing(sol, technicians, customers, dist)
+    print(timing)
+    push = timing.can_push(30)
+    for r, k in enumerate(technicians):
+        for s, j in enumerate(sol.routes[k.name]):
+            print(f"{k.name}, stop {s + 1} ({j.name}): earliest {timing.earliest[r, s]:.0f}, "
+                  f"latest {timing.latest[r, s]:.0f}, waiting {timing.waiting[r, s]:.0f} -> "
+                  f"{'can' if push[r, s] else 'cannot'} be pushed 30 minutes")
@@ -0,0 +1,168 @@
+from gurobipy import GRB
+import contextlib
+import gurobipy as gp
+import itertools
+import json
+import os
+import pandas as pd
+import time
+
+
+# Solve telemetry, for the models of all three packages.
+#
+# A `SolveTrace` follows one solve: the stages around it (data loading, model building,
+# extracting the results, ...) are timed with `with trace.stage('build'): ...`, and
+# `trace.optimize(m)` solves the model with a callback that samples the incumbent, the bound,
+# the gap, the node count and the work units. A sample is taken for every new incumbent and
+# otherwise at most once every `interval` seconds of solve time, so the callback costs a few
+# `cbGet` calls now and then and can be left on.
+#
+# From the callbacks the solve time is also split into presolve (up to the first simplex, barrier
+# or MIP callback), root (up to the first explored node) and branching. A model solved as an LP, or
+# at the root, has no branching phase.
+#
+# `trace.save(directory)` writes <name>-<run_id>.json (stages, phases, model size, final status
+# and samples) and <name>-<run_id>.csv (the samples only), one pair of files per solve: the run
+# id (the time the trace was started, the process id and a sequence number, unless given) keeps
+# the traces of repeated solves under the same name, e.g. TRS0 from a batch, apart.
+
+sample_cols = ['Time', 'Event', 'Incumbent', 'Bound', 'Gap', 'Nodes', 'Work']
+_work = getattr(GRB.Callback, 'WORK', None)   # (not before Gurobi 11)
+
+
+def mip_gap(incumbent, bound):
+    if incumbent is None or abs(incumbent) >= GRB.INFINITY or abs(bound) >= GRB.INFINITY:
+        return None
+    if incumbent == bound:
+        return 0.0
+    return abs(incumbent - bound) / abs(incumbent) if incumbent != 0 else None
+
+
+def _attr(m, name):
+    try:
+        return getattr(m, name)
+    except (AttributeError, gp.GurobiError):
+        return None
+
+
+_sequence = itertools.count()
+
+
+def new_run_id():
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_sequence)}"
+
+
+class SolveTrace:
+    def __init__(self, name, interval=1.0, run_id=None):
+        self.name = name
+        self.run_id = run_id or new_run_id()
+        self.interval = interval
+        self.stages = {}        # stage -> seconds
+        self.phases = {}        # phase of the solve -> seconds
+        self.samples = []
+        self.model = {}
+        self.result = {}
+        self._last = -float('inf')
+        self._presolved = None
+        self._branching = None
+
+    def __str__(self):
+        stages = ', '.join(f"{s} {t:.3f}s" for s, t in {**self.stages, **self.phases}.items())
+        gap = self.result.get('Gap')
+        return (f"Trace {self.name}: {stages}; {len(self.samples)} samples, "
+                f"status {self.result.get('Status')}, gap {'-' if gap is None else f'{gap:.2%}'}")
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + time.perf_counter() - start
+
+    def sample(self, event, runtime, incumbent, bound, nodes, work):
+        incumbent = incumbent if abs(incumbent) < GRB.INFINITY else None
+        self.samples.append({'Time': runtime, 'Event': event, 'Incumbent': incumbent,
+                             'Bound': bound if abs(bound) < GRB.INFINITY else None,
+                             'Gap': mip_gap(incumbent, bound), 'Nodes': nodes, 'Work': work})
+        self._last = runtime
+
+    def callback(self, model, where):
+        if where in (GRB.Callback.PRESOLVE, GRB.Callback.POLLING, GRB.Callback.MESSAGE):
+            return
+        runtime = model.cbGet(GRB.Callback.RUNTIME)
+        if self._presolved is None and where != GRB.Callback.MIPSOL:
+            # (heuristics may find a solution before presolve)
+            self._presolved = runtime
+        if where == GRB.Callback.MIPSOL:
+            self.sample('incumbent', runtime, model.cbGet(GRB.Callback.MIPSOL_OBJ),
+                        model.cbGet(GRB.Callback.MIPSOL_OBJBND), model.cbGet(GRB.Callback.MIPSOL_NODCNT),
+                        model.cbGet(_work) if _work else None)
+        elif where == GRB.Callback.MIP:
+            nodes = model.cbGet(GRB.Callback.MIP_NODCNT)
+            if self._branching is None and nodes > 0:
+                self._branching = runtime
+            if runtime - self._last >= self.interval:
+                self.sample('progress', runtime, model.cbGet(GRB.Callback.MIP_OBJBST),
+                            model.cbGet(GRB.Callback.MIP_OBJBND), nodes, model.cbGet(_work) if _work else None)
+
+    def optimize(self, m, callback=None):
+        # Solve m, timed as the 'solve' stage; a callback of the caller's own is called as well
+        m.update()
+        self.model = {'Variables': m.NumVars, 'Constraints': m.NumConstrs, 'Binaries': m.NumBinVars,
+                      'Integers': m.NumIntVars, 'Nonzeros': m.NumNZs}
+        self._last, self._presolved, self._branching = -float('inf'), None, None
+
+        def both(model, where):
+            self.callback(model, where)
+            callback(model, where)
+
+        with self.stage('solve'):
+            m.optimize(both if callback else self.callback)
+        self.record(m)
+
+    def record(self, m):
+        # Final status and solve phases (multi-objective models have no single bound or gap)
+        runtime = m.Runtime
+        is_mip = m.IsMIP == 1
+        bound = _attr(m, 'ObjBound') if is_mip else None
+        self.result = {'Status': m.Status, 'Runtime': runtime, 'Solutions': m.SolCount,
+                       'Objective': m.ObjVal if m.SolCount else None, 'Bound': bound,
+                       'Gap': _attr(m, 'MIPGap') if is_mip and m.SolCount else None,
+                       'Nodes': m.NodeCount if is_mip else None, 'Iterations': m.IterCount,
+                       'Work': _attr(m, 'Work')}
+        presolved = self._presolved if self._presolved is not None else runtime
+        root_end = self._branching if self._branching is not None else runtime
+        self.phases = {'presolve': presolved, 'root': root_end - presolved}
+        if self._branching is not None:
+            self.phases['branching'] = runtime - root_end
+        if is_mip and bound is not None:
+            self.sample('final', runtime, self.result['Objective'] if m.SolCount else GRB.INFINITY,
+                        bound, m.NodeCount, self.result['Work'])
+
+    def as_dict(self):
+        return {'name': self.name, 'run_id': self.run_id, 'stages': self.stages, 'phases': self.phases, 'model': self.model,
+                'result': self.result, 'samples': self.samples}
+
+    def save(self, directory='.'):
+        # (the path of the files, without the extension)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.name}-{self.run_id}")
+        with open(f"{path}.json", 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+        pd.DataFrame.from_records(self.samples, columns=sample_cols).to_csv(f"{path}.csv", index=False)
+        return path
+
+
+# A trace for a solve, written to `trace_dir` (if not None) when done and printed as one line
+
+
+@contextlib.contextmanager
+def traced(name, trace_dir=None, interval=1.0, run_id=None):
+    trace = SolveTrace(name, interval, run_id)
+    try:
+        yield trace
+    finally:
+        print(trace)
+        if trace_dir is not None:
+            trace.save(trace_dir)